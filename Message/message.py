@@ -1,23 +1,60 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional, Union
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
 
 class Text(BaseModel):
     body: str
 
+class EditedContent(BaseModel):
+    body: Optional[str] = None
+
+class Action(BaseModel):
+    type: str
+    target: Optional[str] = None
+    edited_type: Optional[str] = None
+    edited_content: Optional[EditedContent] = None
+
+class Context(BaseModel):
+    quoted_id: Optional[str] = None
+    quoted_author: Optional[str] = None
+    quoted_type: Optional[str] = None
+    quoted_content: Optional[EditedContent] = None
+
 class MessageData(BaseModel):
     id: str
-    from_me: bool
+    from_me: bool = False
     type: str
     chat_id: str
-    timestamp: int
-    source: str
-    device_id: int
-    chat_name: str
-    status: str
-    text: Text
-    from_: str = Field(..., alias="from")
-    from_name: str
+    timestamp: int = 0
+    source: Optional[str] = None
+    device_id: Optional[int] = None
+    chat_name: Optional[str] = None
+    status: Optional[str] = None
+    text: Optional[Text] = None
+    action: Optional[Action] = None
+    context: Optional[Context] = None
+    from_: Optional[str] = Field(None, alias="from")
+    from_name: str = "no_name"
+
+    @property
+    def edited_text(self) -> Optional[str]:
+        """New body of a text message edit, or None if this is not one."""
+        if self.type == "action" and self.action and self.action.type == "edit" and self.action.edited_type == "text" and self.action.edited_content:
+            return self.action.edited_content.body
+        return None
 
 class Message(BaseModel):
     messages: List[MessageData]
-    channel_id: str
+    channel_id: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, raw: Union[bytes, str]) -> "Message":
+        """Parse a raw webhook body in one pass, without building an intermediate dict where Pydantic allows it."""
+        if hasattr(cls, "model_validate_json"):
+            return cls.model_validate_json(raw)
+        return cls.parse_obj(_loads(raw))
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import os
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import httpx
+import litellm
+from litellm import acompletion
+
+from Services.service import Service
+from utils.response_cache import ResponseCache
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class CachedCompletion:
+    """Stand-in for a litellm ModelResponse served from the response cache."""
+
+    def __init__(self, content: str):
+        self.choices = [SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))]
+        self.usage = None
+
+
+class LLMService(Service):
+    """
+    Managed path for every litellm acompletion call made by the bots.
+
+    - All calls share one pooled httpx client (litellm.aclient_session), so
+      connections to the provider are reused instead of re-established.
+    - A keep-warm task pings the provider when no call has been made for
+      LLM_KEEP_WARM_SECONDS, so the first bid after a quiet period finds a
+      warm connection.
+    - Each call is bounded by LLM_TIMEOUT seconds. If the first attempt has
+      not answered after LLM_HEDGE_AFTER_MS, an identical request is sent
+      and whichever answers first wins; the other is cancelled.
+    - Prompt and cached-prompt token counts are tracked per task, so the
+      share of each prompt served from the provider's prefix cache is
+      visible in prompt_cache_stats().
+    - Identical calls (same task, options, prompt and date context, and the
+      same user message up to whitespace and case) are answered from a
+      ResponseCache without a network call.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.model = os.getenv("LLM_MODEL", "gpt-4o-mini")
+        self.timeout = float(os.getenv("LLM_TIMEOUT", "10"))
+        self.hedge_after = float(os.getenv("LLM_HEDGE_AFTER_MS", "1500")) / 1000
+        self.keep_warm_interval = float(os.getenv("LLM_KEEP_WARM_SECONDS", "60"))
+        self.keep_warm_url = os.getenv("LLM_KEEP_WARM_URL", "https://api.openai.com/v1/models")
+        self.client: Optional[httpx.AsyncClient] = None
+        self.keep_warm_task: Optional[asyncio.Task] = None
+        self.last_call = 0.0
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0, "errors": 0, "keep_warm_pings": 0}
+        self.token_stats: Dict[str, Dict[str, int]] = {}
+        self.cache: Optional[ResponseCache] = None
+        if os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true":
+            cache_dir = os.getenv("LLM_CACHE_DIR")
+            self.cache = ResponseCache(
+                max_entries=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+                ttl=float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600")),
+                disk_path=os.path.join(cache_dir, "llm_responses") if cache_dir else None,
+            )
+
+    async def start(self):
+        """Create the pooled client, warm it up and start the keep-warm task."""
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10")),
+                keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "300")),
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "3"))),
+        )
+        litellm.aclient_session = self.client
+        await self.__ping()
+        if self.keep_warm_interval > 0:
+            self.keep_warm_task = asyncio.create_task(self.__keep_warm())
+        logger.info(f"LLM service started (model={self.model}, timeout={self.timeout}s, hedge after={self.hedge_after}s)")
+
+    async def stop(self):
+        if self.keep_warm_task is not None:
+            self.keep_warm_task.cancel()
+            try:
+                await self.keep_warm_task
+            except asyncio.CancelledError:
+                pass
+            self.keep_warm_task = None
+        if self.client is not None:
+            if litellm.aclient_session is self.client:
+                litellm.aclient_session = None
+            await self.client.aclose()
+            self.client = None
+        if self.cache is not None:
+            self.cache.close()
+        logger.info("LLM service stopped")
+
+    async def __ping(self):
+        api_key = os.getenv("OPENAI_API_KEY")
+        if self.client is None or not api_key:
+            return
+        try:
+            started = time.perf_counter()
+            await self.client.get(self.keep_warm_url, headers={"authorization": f"Bearer {api_key}"})
+            self.stats["keep_warm_pings"] += 1
+            logger.debug(f"LLM keep-warm ping took {(time.perf_counter() - started) * 1000:.1f}ms")
+        except httpx.HTTPError as e:
+            logger.warning(f"LLM keep-warm ping failed: {e}")
+
+    async def __keep_warm(self):
+        while True:
+            await asyncio.sleep(self.keep_warm_interval)
+            if time.monotonic() - self.last_call >= self.keep_warm_interval:
+                await self.__ping()
+
+    async def __call(self, messages: List[Dict[str, str]], **kwargs):
+        try:
+            return await asyncio.wait_for(
+                acompletion(model=self.model, messages=messages, **kwargs),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.error(f"LLM call timed out after {self.timeout}s")
+            raise
+
+    def __record_usage(self, task: str, response):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+        totals = self.token_stats.setdefault(task, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["cached_tokens"] += cached_tokens
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        totals["completion_tokens"] += completion_tokens
+        tracer.annotate(prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, completion_tokens=completion_tokens)
+        ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        logger.info("LLM usage for %s: prompt_tokens=%s, cached_tokens=%s (%.0f%% cached)", task, prompt_tokens, cached_tokens, ratio * 100)
+
+    def prompt_cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """Token totals per task with the share of prompt tokens served from the provider cache."""
+        return {
+            task: dict(totals, cached_ratio=totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0)
+            for task, totals in self.token_stats.items()
+        }
+
+    async def complete(self, messages: List[Dict[str, str]], task: str = "default", use_cache: bool = True, **kwargs):
+        """
+        Run one chat completion through the managed path.
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages, see prompts.build_messages.
+            task (str): Name the call's token usage and cache entries are recorded under.
+            use_cache (bool): Whether the response cache may answer this call.
+            **kwargs: Passed to litellm acompletion (response_format, temperature, ...).
+
+        Returns:
+            The litellm ModelResponse of whichever attempt answered first, or a
+            CachedCompletion with the same choices[0].message.content.
+        """
+        name = getattr(task, "value", task)
+        with tracer.span(f"llm.{name}") as span:
+            if self.cache is None or not use_cache:
+                return await self.__complete(messages, name, **kwargs)
+
+            key = ResponseCache.make_key(name, messages, **kwargs)
+            content = await self.cache.aget(key)
+            if content is not None:
+                logger.info("LLM response for %s served from cache", name)
+                span.set(cached=True)
+                return CachedCompletion(content)
+
+            response = await self.__complete(messages, name, **kwargs)
+            content = response.choices[0].message.content
+            if content:
+                await self.cache.aput(key, content)
+            return response
+
+    async def __complete(self, messages: List[Dict[str, str]], name: str, **kwargs):
+        self.stats["calls"] += 1
+        self.last_call = time.monotonic()
+        first = asyncio.create_task(self.__call(messages, **kwargs))
+        attempts = [first]
+        try:
+            if self.hedge_after <= 0:
+                response = await first
+                self.__record_usage(name, response)
+                return response
+
+            done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+            if done:
+                self.__record_usage(name, first.result())
+                return first.result()
+
+            self.stats["hedged"] += 1
+            tracer.annotate(hedged=True)
+            logger.info("LLM call slower than %ss, sending hedged request", self.hedge_after)
+            hedge = asyncio.create_task(self.__call(messages, **kwargs))
+            attempts.append(hedge)
+            pending = {first, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for winner in done:
+                    if winner.exception() is None:
+                        if winner is hedge:
+                            self.stats["hedge_wins"] += 1
+                        for other in pending:
+                            other.cancel()
+                        self.__record_usage(name, winner.result())
+                        return winner.result()
+                    error = winner.exception()
+            raise error
+        except asyncio.CancelledError:
+            for attempt in attempts:
+                attempt.cancel()
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.last_call = time.monotonic()
@@ -2,7 +2,7 @@ import datetime
 import json
 import os
 import logging
-from litellm import OpenAI, acompletion
+from litellm import OpenAI
 import pytz
 from Message.message import Message
 from typing import Union, List, Tuple, Dict
@@ -10,7 +10,7 @@ import httpx
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from utils.utils import send_whatsapp_message
-from prompts import SYSTEM_PROMPT_BOOKING_ROOMS, SYSTEM_PROMPT_GET_DATE, SYSTEM_PROMPT_GET_ORIGINATOR, SYSTEM_PROMPT_NEEDS_ROOMS, SYSTEM_PROMPT_NUMBER_OF_ROOMS, SYSTEM_PROMPT_CONFIRMATION_MENU, SYSTEM_PROMPT_OVERRIDE
+from prompts import PromptTask, build_messages
 from utils import *
 
 from typing import TypedDict, Optional
@@ -22,7 +22,19 @@ import openai
 # lm = OpenAI(model='gpt-4o-mini')
 # dspy.settings.configure(lm=lm)
 # from dspy.teleprompt import BootstrapFewShotWithRandomSearch
-from utils.utils import send_whatsapp_message, calculate_hotel_days
+from utils.utils import send_whatsapp_message, calculate_hotel_days, StageTimer, warm_whatsapp_client
+from utils.telex_parser import parse_telex, TelexVerdict, guess_room_requests
+from utils.inventory import DEFAULT_HOLD_TTL, RoomInventory, Hold
+from utils.session_store import ChatSession
+from utils.state_backend import create_state_backend
+from Services.llm_service import LLMService
+from utils.side_effects import SideEffectQueue
+from utils.report import iter_report_messages, format_date_runs, paginate
+from utils.command_router import is_echo, route_command, parse_command_date, parse_override, find_command_dates, mentions_date, date_range, MAX_RANGE_DAYS
+from utils.logging_setup import configure_logging
+from utils.blocking_io import run_blocking
+from utils.tracing import tracer
+from utils.speculation import SpeculativeBid, Stay
 
 from enum import Enum
 from pydantic import BaseModel
@@ -31,14 +43,7 @@ from pydantic import BaseModel
 load_dotenv()
 
 # Initialize Logger
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("fast_finger_bot.log"),
-        logging.StreamHandler()
-    ]
-)
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -76,11 +81,36 @@ class ResponseType(str, Enum):
 class ConfirmationResponse(BaseModel):
     response_type: ResponseType
 
-class OverrideResponse(BaseModel):
-    date: str
+class OverrideDate(BaseModel):
+    date: str = Field(..., description="Date in YYYY-MM-DD format")
+    number_of_rooms: int
+
+
+class OverrideRange(BaseModel):
+    start_date: str = Field(..., description="First date in YYYY-MM-DD format")
+    end_date: str = Field(..., description="Last date, included, in YYYY-MM-DD format")
     number_of_rooms: int
 
 
+class OverrideResponse(BaseModel):
+    date: Optional[str] = None
+    number_of_rooms: Optional[int] = None
+    dates: List[OverrideDate] = Field(default_factory=list, description="Dates given one by one with their rooms")
+    ranges: List[OverrideRange] = Field(default_factory=list, description="Date ranges set to the same number of rooms")
+
+    def entries(self) -> Dict[str, int]:
+        """Rooms per YYYY-MM-DD date; a date listed on its own wins over a range containing it."""
+        entries = {}
+        for span in self.ranges:
+            for date in date_range(span.start_date, span.end_date)[:MAX_RANGE_DAYS]:
+                entries[date] = span.number_of_rooms
+        for override in self.dates:
+            entries[override.date] = override.number_of_rooms
+        if self.date and self.number_of_rooms is not None:
+            entries[self.date] = self.number_of_rooms
+        return entries
+
+
 class DateResponse(BaseModel):
     date: str = Field(..., description="Date for which rooms booked are queried in YYYY-MM-DD format")
 
@@ -95,41 +125,92 @@ class FastFingerBot:
             logger.error(f"Failed to initialize OpenAI client: {e}")
             raise
 
+        self.llm = LLMService()
+        # Report counters, confirmations and timing logs run after the reply is sent
+        self.side_effects = SideEffectQueue(workers=int(os.getenv("SIDE_EFFECT_WORKERS", "2")))
         self.history = []
-        self.conversation = ""
-        self.system_prompt_needs_rooms = SYSTEM_PROMPT_NEEDS_ROOMS
-        self.system_prompt_number_of_rooms = SYSTEM_PROMPT_NUMBER_OF_ROOMS
-        self.system_prompt_booking_rooms = SYSTEM_PROMPT_BOOKING_ROOMS 
-        self.system_prompt_confirmation_menu = SYSTEM_PROMPT_CONFIRMATION_MENU
-        self.system_prompt_get_date= SYSTEM_PROMPT_GET_DATE
-        self.system_prompt_get_originator = SYSTEM_PROMPT_GET_ORIGINATOR
         self.sent_first_message = False
         self.confirmation_notification_chat_id = os.getenv("CONFIRMATION_NOTIFICATION_CHAT_ID")
-        self.message = None
-        self.current_state = None
-        self.bids = []
-        self.agent_switched_on = True
+        # Inventory, report, metadata and sessions live in the backend chosen by STATE_BACKEND,
+        # either in this process or shared by all workers
+        self.state = create_state_backend(session_model=BasicExtraction)
+        # Bid state is kept per WhatsApp group so concurrent requests don't overwrite each other
+        self.sessions = self.state.sessions
         self.agent_started = True
 
         # Initialize class variables for dates
         self.arrival_date: Optional[str] = None
         self.departure_date: Optional[str] = None
 
-        self.report = {}
-        self.report_file = os.getenv("REPORT_FILE", "data/report.json")
-        # self.__load_report()
+        self.inventory = self.state.inventory
+        self.report_days_back = int(os.getenv("REPORT_DAYS_BACK", "30"))
+        self.report_days_ahead = int(os.getenv("REPORT_DAYS_AHEAD", "90"))
+        # Rooms promised with "RP Can" stay on hold until the airline books them, takes rooms
+        # elsewhere or the hold expires
+        self.bid_hold_ttl = float(os.getenv("BID_HOLD_TTL_SECONDS", DEFAULT_HOLD_TTL))
+
+        # Fast path: take the room count from the single BasicExtraction call
+        # so "RP Can" goes out as early as possible
+        self.fast_path = os.getenv("FAST_PATH_MODE", "true").lower() == "true"
+        logger.info(f"Fast path mode: {self.fast_path}, message originator: {self.originator}")
+
+        # Well-formed telexes and obvious chatter are handled by the local parser;
+        # the LLM is only asked when the parser is unsure
+        self.telex_parser_enabled = os.getenv("TELEX_PARSER_ENABLED", "true").lower() == "true"
+        # Confirmation-chat commands answered by the local router versus the LLM
+        self.router_stats = {"echoes": 0, "local": 0, "llm": 0, "local_dates": 0, "llm_dates": 0}
+        # While the LLM classifies a request the parser is unsure about, rooms are held
+        # for a locally guessed stay and used for "RP Can" if the LLM asks for the same one
+        self.speculation_enabled = os.getenv("SPECULATION_ENABLED", "true").lower() == "true"
+        self.speculation_stats = {"started": 0, "hits": 0, "mismatches": 0, "no_hold": 0, "unused": 0, "errors": 0}
         
         logger.info("FastFingerBot initialization complete")
-        
+
+    @property
+    def agent_switched_on(self) -> bool:
+        return self.state.get_flag("agent_switched_on", True)
+
+    @agent_switched_on.setter
+    def agent_switched_on(self, value: bool):
+        self.state.set_flag("agent_switched_on", value)
+
+    async def __is_switched_on(self) -> bool:
+        # The shared backend reads flags from the database, which must stay off the event loop
+        if self.state.flags_on_disk:
+            return await run_blocking(self.state.get_flag, "agent_switched_on", True)
+        return self.agent_switched_on
+
+    async def __switch_agent(self, on: bool):
+        if self.state.flags_on_disk:
+            await run_blocking(self.state.set_flag, "agent_switched_on", on)
+        else:
+            self.agent_switched_on = on
+
+    @property
+    def originator(self) -> Optional[str]:
+        return self.state.get_metadata("message_originator")
+
+    async def start(self):
+        """Warm up outbound connections and start polling metadata; called on application startup."""
+        await self.llm.start()
+        await self.state.config.start()
+
+    async def close(self):
+        """Flush state that is kept in memory; called on application shutdown."""
+        await self.side_effects.stop()
+        await self.llm.stop()
+        await self.state.config.stop()
+        self.state.close()
+        logger.info("FastFingerBot closed")
 
     async def __calculate_booking_days(self, arrival_date: str, departure_date: str, departure_time: str = "00:00") -> int:
-        logger.debug(f"Calculating booking days from {arrival_date} to {departure_date}")
+        logger.debug("Calculating booking days from %s to %s", arrival_date, departure_date)
         try:
             booking_days = calculate_hotel_days(arrival_date, departure_date, departure_time)
-            logger.info(f"Calculated booking days: {booking_days}")
+            logger.info("Calculated booking days: %s", booking_days)
             return booking_days
         except Exception as e:
-            logger.error(f"Error calculating booking days: {e}")
+            logger.error("Error calculating booking days: %s", e)
             raise
 
     async def whatsapp_confirmation(self, message: str):
@@ -139,67 +220,78 @@ class FastFingerBot:
     
     async def __process_confirmation_group_message(self, message: str, user_id: str):
         logger.info("Processing confirmation group message")
-        # Only needed for dev
-        if message == "Successfully shut down agent" or message =="Successfully started agent" or "daily booking report" in message.lower() or "successfully overridden room availability" in message.lower() or "rooms empty for the date" in message.lower() or "current message originator for the system is" in message.lower() or "originator updated from" in message.lower() or "you can try following messages to command the bot" in message.lower():
+        # The bot's own replies come back through the webhook
+        if is_echo(message) or message == self.state.get_metadata('help_menu'):
+            self.router_stats["echoes"] += 1
             logger.info("Message is a confirmation notification, not processing")
             return
         
-        messages = [
-            {"role": "system", "content": self.system_prompt_confirmation_menu},
-            {"role": "user", "content": message}
-        ]
-        
         try:
-            response = await acompletion(
-                model="gpt-4o-mini",
-                messages=messages,
-                response_format=ConfirmationResponse
-            )
-            response = ConfirmationResponse.parse_obj(json.loads(response.choices[0].message.content))
+            response_type = route_command(message)
+            if response_type is not None:
+                self.router_stats["local"] += 1
+                response = ConfirmationResponse(response_type=response_type)
+            else:
+                # Only commands the patterns don't recognise cost a model call
+                self.router_stats["llm"] += 1
+                messages = build_messages(PromptTask.CONFIRMATION_MENU, message)
+                response = await self.llm.complete(
+                    messages,
+                    task=PromptTask.CONFIRMATION_MENU,
+                    response_format=ConfirmationResponse
+                )
+                response = ConfirmationResponse.parse_obj(json.loads(response.choices[0].message.content))
             logger.info(f"Confirmation response: {response}")
             
             if response.response_type == ResponseType.SHUT_DOWN_AGENT:
-                self.agent_switched_on = False
+                await self.__switch_agent(False)
                 await send_whatsapp_message(f"Successfully shut down agent", self.confirmation_notification_chat_id, self.sent_first_message)
                 
             elif response.response_type == ResponseType.START_AGENT:
-                self.agent_switched_on = True
+                await self.__switch_agent(True)
                 await send_whatsapp_message(f"Successfully started agent", self.confirmation_notification_chat_id, self.sent_first_message)
                 
             elif response.response_type == ResponseType.ROOMS_BOOKED_QUERY:
-                report = self.__load_report()
+                aggregates = await run_blocking(self.state.report_aggregates)
                 today = datetime.datetime.now(pytz.timezone('Asia/Singapore')).strftime("%Y-%m-%d")
 
+                # "this month", "last week" or a YYYY-MM-DD range are answered from the running totals
+                period = self.__query_period(message, datetime.date.fromisoformat(today))
+                if period is not None:
+                    start, end = period
+                    summary = await run_blocking(aggregates.summary, start, end, self.__get_inventory().get)
+                    await send_whatsapp_message(
+                        f"We've booked {summary['rooms_booked']} rooms from {start} to {end}.\n"
+                        f"Messages from airlines: {summary['airline_messages']}\n"
+                        f"Bids won: {summary['bids_won']} of {summary['bids']} ({summary['bid_win_rate']:.0%})\n"
+                        f"Occupancy: {summary['occupancy']:.0%}",
+                        self.confirmation_notification_chat_id,
+                        self.sent_first_message
+                    )
+                    return
+
                 # Get date from message if specified, otherwise use today's date
-                date_messages = [
-                    {"role": "system", "content": SYSTEM_PROMPT_GET_DATE.format(today)},
-                    {"role": "user", "content": message}
-                ]
-                date_response = await acompletion(
-                    model="gpt-4o-mini", 
-                    messages=date_messages,
-                    response_format=DateResponse
-                )
-                date_response = DateResponse.parse_obj(json.loads(date_response.choices[0].message.content))
-                rooms_booked = report.get(date_response.date, {}).get("number_of_rooms_booked", 0)
+                date_response = await self.__get_command_date(message, today)
+                rooms_booked = aggregates.day("rooms_booked", date_response.date)
                 await send_whatsapp_message(f"We've booked {rooms_booked} rooms for {date_response.date}", self.confirmation_notification_chat_id, self.sent_first_message)
                 
             elif response.response_type == ResponseType.ROOMS_EMPTY_QUERY:
                 today = datetime.datetime.now(pytz.timezone('Asia/Singapore')).strftime("%Y-%m-%d")
-                available_rooms = self.__get_available_rooms()
+                inventory = self.__get_inventory()
+
+                # A week, month, range or list of dates is answered in one message
+                dates = self.__query_dates(message, datetime.date.fromisoformat(today))
+                if dates:
+                    rooms = await run_blocking(inventory.get_many, dates)
+                    title = f"We've {sum(value or 0 for value in rooms.values())} rooms empty across {len(dates)} dates from {dates[0]} to {dates[-1]}"
+                    for page in paginate((line + "\n" for line in format_date_runs(rooms)), title=title):
+                        await send_whatsapp_message(page, self.confirmation_notification_chat_id, self.sent_first_message)
+                    return
+
                 # Get date from message if specified, otherwise use today's date
-                date_messages = [
-                    {"role": "system", "content": SYSTEM_PROMPT_GET_DATE.format(today)},
-                    {"role": "user", "content": message}
-                ]
-                date_response = await acompletion(
-                    model="gpt-4o-mini", 
-                    messages=date_messages,
-                    response_format=DateResponse
-                )
-                date_response = DateResponse.parse_obj(json.loads(date_response.choices[0].message.content))
+                date_response = await self.__get_command_date(message, today)
                 logger.info(f"Date response: {date_response}")
-                rooms_available = available_rooms.get(date_response.date, {}).get("availability", 0)
+                rooms_available = await run_blocking(inventory.get, date_response.date) or 0
                 await send_whatsapp_message(f"We've {rooms_available} rooms empty for the date {date_response.date}", self.confirmation_notification_chat_id, self.sent_first_message)
                 
 
@@ -207,34 +299,19 @@ class FastFingerBot:
             elif response.response_type == ResponseType.REPORT:
                 # Handle generating a report
                 try:
-                    # Load both report and room requirements data
-                    with open('data/report.json', 'r') as f:
-                        report_data = json.load(f)
-                    
-                    with open(os.getenv("ROOM_REQUIREMENTS_FILE"), 'r') as f:
-                        rooms_data = json.load(f)
-                    
-                    if not report_data:
+                    start, end = await self.__report_window(message)
+                    inventory = self.__get_inventory()
+                    pages = iter_report_messages(self.state.iter_report(start, end), inventory.get)
+
+                    # Pages are built lazily, off the event loop, and sent in order, so only one is in memory at a time
+                    sent_pages = 0
+                    while (page := await run_blocking(next, pages, None)) is not None:
+                        await send_whatsapp_message(page, self.confirmation_notification_chat_id, self.sent_first_message)
+                        sent_pages += 1
+                    if not sent_pages:
                         await send_whatsapp_message("No report data available", self.confirmation_notification_chat_id, self.sent_first_message)
                         return
-
-                    # Format the report message
-                    report_message = "📊 *Daily Booking Report*\n\n"
-                    for date, data in report_data.items():
-                        report_message += f"*Date:* {date}\n"
-                        report_message += f"Rooms Booked: {data.get('number_of_rooms_booked', 0)}\n"
-                        report_message += f"Rooms Available: {rooms_data.get(date, {}).get('availability', 'N/A')}\n"
-                        report_message += f"Messages from Airlines: {data.get('number_of_messages_from_airlines', 0)}\n"
-                        if 'bookings' in data:
-                            report_message += "Booking Details:\n"
-                            for booking in data['bookings']:
-                                report_message += f"- Room Type: {booking.get('room_type', 'N/A')}\n"
-                                report_message += f"  Check-in: {booking.get('check_in', 'N/A')}\n"
-                                report_message += f"  Check-out: {booking.get('check_out', 'N/A')}\n"
-                        report_message += "\n"
-
-                    await send_whatsapp_message(report_message, self.confirmation_notification_chat_id, self.sent_first_message)
-                    logger.info("Report sent successfully")
+                    logger.info(f"Report for {start} to {end} sent successfully in {sent_pages} messages")
                     
                 except Exception as e:
                     logger.error(f"Error generating report: {e}")
@@ -243,31 +320,32 @@ class FastFingerBot:
             elif response.response_type == ResponseType.OVERRIDE_ROOMS:
                 # Handle overriding the agent's decision
                 try:
-                    override_messages = [
-                        {"role": "system", "content": SYSTEM_PROMPT_OVERRIDE+"\n\nToday's date: " + datetime.datetime.now().strftime("%Y-%m-%d")},
-                        {"role": "user", "content": message}
-                    ]
-                    override_response = await acompletion(
-                        model="gpt-4o-mini",
-                        messages=override_messages,
-                        response_format=OverrideResponse
-                    )
-                    override_response = OverrideResponse.parse_obj(json.loads(override_response.choices[0].message.content))
-                    
-                    # Update the room availability for the specified date
-                    available_rooms = self.__get_available_rooms()
-                    
-                    if override_response.date not in available_rooms:
-                        available_rooms[override_response.date] = {"availability": override_response.number_of_rooms}
+                    # Dates, ranges and per-date lists in the usual forms are read locally
+                    entries = parse_override(message, datetime.datetime.now(pytz.timezone('Asia/Singapore')).date())
+                    if entries is None:
+                        override_messages = build_messages(PromptTask.OVERRIDE, message, datetime.datetime.now().strftime("%Y-%m-%d"))
+                        override_response = await self.llm.complete(
+                            override_messages,
+                            task=PromptTask.OVERRIDE,
+                            response_format=OverrideResponse
+                        )
+                        override_response = OverrideResponse.parse_obj(json.loads(override_response.choices[0].message.content))
+                        entries = override_response.entries()
+                    if not entries:
+                        raise ValueError(f"No date and number of rooms found in override: {message}")
+
+                    # Every date is updated in one batch
+                    await run_blocking(self.__get_inventory().set_availability_many, entries)
+
+                    if len(entries) == 1:
+                        (date, number_of_rooms), = entries.items()
+                        logger.info(f"Successfully overridden room availability for {date} to {number_of_rooms} rooms")
+                        await send_whatsapp_message(f"Successfully overridden room availability for {date} to {number_of_rooms} rooms", self.confirmation_notification_chat_id, self.sent_first_message)
                     else:
-                        available_rooms[override_response.date]["availability"] = override_response.number_of_rooms
-                    
-                    room_requirements_file = os.getenv("ROOM_REQUIREMENTS_FILE")
-                    with open(room_requirements_file, 'w') as f:
-                        json.dump(available_rooms, f, indent=4)
-                    
-                    logger.info(f"Successfully overridden room availability for {override_response.date} to {override_response.number_of_rooms} rooms")
-                    await send_whatsapp_message(f"Successfully overridden room availability for {override_response.date} to {override_response.number_of_rooms} rooms", self.confirmation_notification_chat_id, self.sent_first_message)
+                        title = f"Successfully overridden room availability for {len(entries)} dates from {min(entries)} to {max(entries)}"
+                        logger.info(title)
+                        for page in paginate((line + "\n" for line in format_date_runs(entries)), title=title):
+                            await send_whatsapp_message(page, self.confirmation_notification_chat_id, self.sent_first_message)
 
                 except Exception as e:
                     logger.error(f"Error during override processing: {e}")
@@ -276,36 +354,18 @@ class FastFingerBot:
 
             elif response.response_type == ResponseType.CHANGE_MESSAGE_ORIGINATOR:
                 logger.info(f"Originator query received: {message}")
+                original_originator = self.originator
                 try:
-                    originator_messages = [
-                        {"role": "system", "content": self.system_prompt_get_originator},
-                        {"role": "user", "content": message}
-                    ]
-                    originator_response = await acompletion(
-                        model="gpt-4o-mini", 
-                        messages=originator_messages,
+                    originator_messages = build_messages(PromptTask.GET_ORIGINATOR, message)
+                    originator_response = await self.llm.complete(
+                        originator_messages,
+                        task=PromptTask.GET_ORIGINATOR,
                         temperature=0
                     )
                     originator = originator_response.choices[0].message.content
                     
                     if originator and originator.lower() != "null":
-                        # Load current metadata
-                        metadata_file = os.getenv("DATA_METADATA_FILE", "data/metadata.json")
-                        try:
-                            with open(metadata_file, 'r') as f:
-                                metadata = json.load(f)
-                        except FileNotFoundError:
-                            metadata = {}
-                        
-                        original_originator = metadata.get('message_originator', None)
-                        # Update originator
-                        metadata['message_originator'] = originator
-                        
-                        # Save updated metadata
-                        with open(metadata_file, 'w') as f:
-                            json.dump(metadata, f, indent=4)
-                            
-                        self.originator = originator
+                        await run_blocking(self.state.set_metadata, 'message_originator', originator)
                         logger.info(f"Successfully updated originator to {originator}")
                     else:
                         logger.info("No valid originator found in message")
@@ -319,7 +379,7 @@ class FastFingerBot:
             elif response.response_type == ResponseType.GET_ORIGINATOR:
                 logger.info(f"Originator query received: {message}")
                 try:
-                    originator = self.__get_message_originator()
+                    originator = self.originator
                     logger.info(f"Successfully retrieved originator: {originator}")
                     await send_whatsapp_message(f"current message originator for the system is {originator}", self.confirmation_notification_chat_id, self.sent_first_message)
                 except Exception as e:
@@ -329,10 +389,7 @@ class FastFingerBot:
             elif response.response_type == ResponseType.HELP:
                 logger.info(f"Help query received: {message}")
                 try:
-                    metadata_file = os.getenv("DATA_METADATA_FILE", "data/metadata.json")
-                    with open(metadata_file, 'r') as f:
-                        metadata = json.load(f)
-                    help_menu = metadata.get('help_menu', "Help menu not found")
+                    help_menu = self.state.get_metadata('help_menu', "Help menu not found")
                     await send_whatsapp_message(help_menu, self.confirmation_notification_chat_id, self.sent_first_message)
                 except Exception as e:
                     logger.error(f"Error retrieving help menu: {e}")
@@ -346,16 +403,78 @@ class FastFingerBot:
             logger.error(f"Error during confirmation response processing: {e}")
             raise
 
-    def __get_message_originator(self) -> str:
-        """Get the message originator from metadata file"""
-        metadata_file = os.getenv("DATA_METADATA_FILE", "data/metadata.json")
-        try:
-            with open(metadata_file, 'r') as f:
-                metadata = json.load(f)
-        except FileNotFoundError:
-            metadata = {}
-        
-        return metadata.get('message_originator', None)
+    async def __get_command_date(self, message: str, today: str) -> DateResponse:
+        """Date a menu command refers to, from the local parser or, if it can't read the date, the LLM."""
+        date = parse_command_date(message, datetime.date.fromisoformat(today))
+        if date is not None:
+            self.router_stats["local_dates"] += 1
+            return DateResponse(date=date)
+        self.router_stats["llm_dates"] += 1
+        date_messages = build_messages(PromptTask.GET_DATE, message, today)
+        date_response = await self.llm.complete(
+            date_messages,
+            task=PromptTask.GET_DATE,
+            response_format=DateResponse
+        )
+        return DateResponse.parse_obj(json.loads(date_response.choices[0].message.content))
+
+    @staticmethod
+    def __query_period(message: str, today: datetime.date) -> Optional[Tuple[str, str]]:
+        """Date range named in a rooms booked or rooms empty query, or None if it asks about a single day."""
+        text = message.lower()
+        dates = find_command_dates(message, today)
+        if len(dates) >= 2:
+            return min(dates), max(dates)
+        if "this week" in text or "last week" in text:
+            monday = today - datetime.timedelta(days=today.weekday())
+            if "last week" in text:
+                monday -= datetime.timedelta(days=7)
+            return monday.isoformat(), (monday + datetime.timedelta(days=6)).isoformat()
+        if "this month" in text or "last month" in text:
+            first = today.replace(day=1)
+            if "last month" in text:
+                first = (first - datetime.timedelta(days=1)).replace(day=1)
+            last = (first.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+            return first.isoformat(), last.isoformat()
+        return None
+
+    def __query_dates(self, message: str, today: datetime.date) -> Optional[List[str]]:
+        """
+        Dates named in a rooms empty query, or None if it asks about a single day.
+
+        A period (this week, last month, ...) or two dates give every date in
+        between, at most MAX_RANGE_DAYS of them; three or more dates are
+        taken as a list.
+        """
+        dates = find_command_dates(message, today)
+        if len(dates) > 2:
+            return sorted(set(dates))
+        period = self.__query_period(message, today)
+        if period is not None:
+            return date_range(*period)[:MAX_RANGE_DAYS]
+        return None
+
+    async def __report_window(self, message: str) -> Tuple[str, str]:
+        """
+        Date window for the REPORT command.
+
+        Dates and periods are read as in the rooms booked query: two dates or
+        "this week", "last month", ... give the window, and a single date
+        (09NOV, today, ...) reports just that day. A report that names no
+        date covers REPORT_DAYS_BACK days before today to REPORT_DAYS_AHEAD
+        days after it.
+        """
+        today = datetime.datetime.now(pytz.timezone('Asia/Singapore')).date()
+        period = self.__query_period(message, today)
+        if period is not None:
+            return period
+        if mentions_date(message):
+            date = (await self.__get_command_date(message, today.isoformat())).date
+            return date, date
+        return (
+            (today - datetime.timedelta(days=self.report_days_back)).isoformat(),
+            (today + datetime.timedelta(days=self.report_days_ahead)).isoformat(),
+        )
 
     async def handle_whatsapp_group(self, chat_id: str, message: str, user_id: str, from_number: str):
         if message == "RP Can":
@@ -367,40 +486,79 @@ class FastFingerBot:
             await self.__process_confirmation_group_message(message, user_id)
             return
         
-        if not self.agent_switched_on:
+        if not await self.__is_switched_on():
             logger.info("Agent is shut down, not processing message")
             return
         
-        logger.info(f"Handling WhatsApp message from user_id={user_id} in chat_id={chat_id}")
-        self.chat_id = chat_id
-        self.conversation += f"{user_id}: {message}\n"
-        logger.debug(f"Updated conversation: {self.conversation}")
+        logger.info("Handling WhatsApp message from user_id=%s in chat_id=%s", user_id, chat_id)
+        with tracer.span("handle_message"):
+            if self.state.sessions_on_disk:
+                session = await run_blocking(self.sessions.get, chat_id)
+            else:
+                session = self.sessions.get(chat_id)
+            speculation = self.__new_speculation(from_number)
+            try:
+                await self.__handle_group_session(session, message, user_id, from_number, speculation)
+            finally:
+                if speculation is not None:
+                    await speculation.discard()
+                # Shared backends only see the session's bid state once it is saved
+                if self.state.sessions_on_disk:
+                    await run_blocking(self.sessions.save, session)
+                else:
+                    self.sessions.save(session)
+
+    def __new_speculation(self, from_number: str) -> Optional[SpeculativeBid]:
+        # Only the originator's requests get a bid, so only theirs are worth speculating on
+        if not self.speculation_enabled or self.inventory is None or str(from_number) != str(self.originator):
+            return None
+        return SpeculativeBid(self.inventory, self.bid_hold_ttl, self.speculation_stats, prepare=warm_whatsapp_client)
+
+    def __speculative_stays(self, user_message: str) -> List[Stay]:
+        """Stays the LLM is likely to ask for, worked out from the parser's guesses the same way as from its answer."""
+        stays = []
+        for guess in guess_room_requests(user_message, datetime.datetime.now().date()):
+            extraction = BasicExtraction(**dict(guess.extraction_fields(), needs_rooms=True))
+            self.__adjust_early_arrival(extraction)
+            booking_days = calculate_hotel_days(extraction.arrival_date, extraction.departure_date, extraction.departure_time)
+            stay = Stay(extraction.arrival_date, booking_days, extraction.number_of_rooms)
+            if stay not in stays:
+                stays.append(stay)
+        return stays
+
+    async def __handle_group_session(self, session: ChatSession, message: str, user_id: str, from_number: str, speculation: Optional[SpeculativeBid] = None):
+        chat_id = session.chat_id
+        timer = StageTimer(f"group message {chat_id}")
+        session.conversation.append(f"{user_id}: {message}")
+        logger.debug("Updated conversation for chat_id=%s: %s", chat_id, session.conversation[-1])
         
         try:
-            room_need = await self.__determine_room_need(message)
-            logger.info(f"Room need determination: {room_need.needs_rooms}")            
+            room_need = await self.__determine_room_need(message, speculation)
+            timer.mark("determine_room_need")
+            logger.info("Room need determination: %s", room_need.needs_rooms)
         except Exception as e:
-            logger.error(f"Error determining room need: {e}")
+            logger.error("Error determining room need: %s", e)
             #self.sent_first_message = True
             return
         
         try:
-            available_rooms = self.__get_available_rooms()
-            logger.debug(f"Available rooms: {available_rooms}")
+            self.__get_inventory()
         except Exception as e:
-            logger.error(f"Error fetching available rooms: {e}")
+            logger.error("Error fetching available rooms: %s", e)
             return
 
         if not room_need.needs_rooms:
-            if self.current_state == None:
-                logger.info(f"Current state is None, returning")
+            # Not a new bid: give the guessed rooms back before the booking check, which may need them
+            if speculation is not None:
+                await speculation.discard()
+            if session.current_state == None:
+                logger.info("Current state is None, returning")
                 return
             logger.info("User does not need rooms, Checking if they are booking a room")
             booking_response = await self.__determine_room_booking(message)
-            logger.info(f"Booking response: {booking_response}")        
             
             if booking_response.booking_room:
-                # if room_need.needs_rooms != self.current_state.needs_rooms:
+                # if room_need.needs_rooms != session.current_state.needs_rooms:
                 #     logger.info(f"User needs rooms changed, not booking")
 
                 #     await send_whatsapp_message(
@@ -409,22 +567,17 @@ class FastFingerBot:
                 #         self.sent_first_message
                 #     )
                 #     return
-                logger.info(f"User is booking {booking_response.number_of_rooms} rooms")
+                logger.info("User is booking %s rooms", booking_response.number_of_rooms)
                 try:
-                    booking_days = await self.__calculate_booking_days(self.current_state.arrival_date, self.current_state.departure_date)
+                    booking_days = await self.__calculate_booking_days(session.current_state.arrival_date, session.current_state.departure_date)
                 except Exception as e:
-                    logger.error(f"Error calculating booking days: {e}")
+                    logger.error("Error calculating booking days: %s", e)
                     return
 
-                is_possible = await self.__calculate_if_possible(
-                    booking_response.number_of_rooms,
-                    available_rooms
-                )
-
+                hold = await self.__reserve_rooms(session, booking_response.number_of_rooms, reuse_current_hold=True)
 
-
-                if not is_possible:
-                    logger.info(f"Not enough rooms available, not booking")
+                if hold is None:
+                    logger.info("Not enough rooms available, not booking")
                     await send_whatsapp_message(
                         f"No, we cannot accommodate {booking_response.number_of_rooms} rooms for the selected dates.",
                         chat_id,
@@ -432,41 +585,42 @@ class FastFingerBot:
                     )
                 else:
                     try:
-                        await self.__update_available_rooms(
-                            booking_response.number_of_rooms,
-                            self.current_state.arrival_date,
-                            self.current_state.departure_date
-                        )
+                        await self.__update_available_rooms(session, booking_response.number_of_rooms, hold)
 
-                        departure_hour = int(self.current_state.departure_time.split(":")[0])
+                        departure_hour = int(session.current_state.departure_time.split(":")[0])
                         if departure_hour >= 19:
-                            departure_date = (datetime.datetime.strptime(self.current_state.departure_date, "%Y-%m-%d") + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+                            departure_date = (datetime.datetime.strptime(session.current_state.departure_date, "%Y-%m-%d") + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
                         else:
-                            departure_date = self.current_state.departure_date
-                        logger.info(f"Booking {booking_response.number_of_rooms} rooms from {self.current_state.arrival_date} to {departure_date}")
-                        await self.whatsapp_confirmation(f"SQ booking {booking_response.number_of_rooms} rooms from {self.current_state.arrival_date} to {departure_date}.\n\n*Original Message*\n{self.message}")
+                            departure_date = session.current_state.departure_date
+                        logger.info("Booking %s rooms from %s to %s", booking_response.number_of_rooms, session.current_state.arrival_date, departure_date)
+                        self.side_effects.submit("record_bid", self.state.record_bid, datetime.datetime.now(pytz.timezone('Asia/Singapore')).strftime("%Y-%m-%d"), won=True)
+                        self.side_effects.submit("whatsapp_confirmation", self.whatsapp_confirmation, f"SQ booking {booking_response.number_of_rooms} rooms from {session.current_state.arrival_date} to {departure_date}.\n\n*Original Message*\n{session.message}")
                     except Exception as e:
-                        logger.error(f"Error updating available rooms: {e}")
+                        logger.error("Error updating available rooms: %s", e)
+            elif booking_response.number_of_rooms > 0 and session.current_hold is not None:
+                # The airline took its rooms from another hotel, so our bid is lost
+                logger.info("User is booking rooms elsewhere, releasing hold %s", session.current_hold.hold_id)
+                await run_blocking(self.__get_inventory().release, session.current_hold)
+                session.current_hold = None
             else:
                 logger.info("User is not booking rooms")
             return
         
         if room_need.needs_rooms:
 
-            with open("data/metadata.json") as f:
-                message_originator = str(json.load(f)["message_originator"])
+            message_originator = str(self.originator)
+            timer.mark("originator_check")
             
             # Check if message is from someone other than the originator
             if str(from_number) != message_originator:
-                logger.info(f"Message from {from_number} is not from the originator {message_originator}, not processing")
+                logger.info("Message from %s is not from the originator %s, not processing", from_number, message_originator)
                 return
             
             try:
-                self.__update_report(datetime.datetime.now(pytz.timezone('Asia/Singapore')).strftime("%Y-%m-%d"), message_from_airlines=True)
                 # Store arrival and departure dates as class variables
-                self.current_state = room_need
-                self.current_state.arrival_date = room_need.arrival_date
-                self.current_state.departure_date = room_need.departure_date
+                session.current_state = room_need
+                session.current_state.arrival_date = room_need.arrival_date
+                session.current_state.departure_date = room_need.departure_date
 
                 # # Check if arrival date is before today in Singapore timezone
                 # sg_tz = pytz.timezone('Asia/Singapore')
@@ -478,62 +632,81 @@ class FastFingerBot:
                 #     return
 
 
-                number_of_rooms = await self.__get_number_of_rooms(message)
-                logger.info(f"Number of rooms requested: {number_of_rooms.number_of_rooms}")
+                if self.fast_path:
+                    # The combined extraction already carries the room count
+                    number_of_rooms = NumberOfRooms(number_of_rooms=room_need.number_of_rooms, date=room_need.arrival_date)
+                else:
+                    number_of_rooms = await self.__get_number_of_rooms(message)
+                    timer.mark("get_number_of_rooms")
+                logger.info("Number of rooms requested: %s", number_of_rooms.number_of_rooms)
             except Exception as e:
-                logger.error(f"Error getting number of rooms: {e}")
+                logger.error("Error getting number of rooms: %s", e)
                 #self.sent_first_message = True
                 return
             try:
-                is_possible = await self.__calculate_if_possible(
-                    number_of_rooms.number_of_rooms,
-                    available_rooms
-                )
-                if is_possible:
+                hold = await self.__reserve_rooms(session, number_of_rooms.number_of_rooms, speculation=speculation)
+                timer.mark("availability_check")
+                if hold is not None:
+                    session.current_hold = hold
                     response = "RP Can"
-                    self.message = message
-                    self.bids.append((message, number_of_rooms.number_of_rooms))
+                    session.message = message
+                    session.bids.append((message, number_of_rooms.number_of_rooms))
+                    self.side_effects.submit("record_bid", self.state.record_bid, datetime.datetime.now(pytz.timezone('Asia/Singapore')).strftime("%Y-%m-%d"))
                     await send_whatsapp_message(response, chat_id, self.sent_first_message)
+                    tracer.mark("time_to_rp_can")
+                    timer.mark("send_reply")
                                         
                 else:
                     response = "No, we cannot accommodate you."
-                logger.info(f"Response to user: {response}")
+                logger.info("Response to user: %s", response)
             except Exception as e:
-                logger.error(f"Error calculating room availability: {e}")
+                logger.error("Error calculating room availability: %s", e)
+
+            # Report counters are not needed for the bid, so update them after replying
+            self.side_effects.submit(
+                "update_report",
+                self.__update_report,
+                datetime.datetime.now(pytz.timezone('Asia/Singapore')).strftime("%Y-%m-%d"),
+                message_from_airlines=True
+            )
+            self.side_effects.submit("log_timings", timer.log)
             
             
         else:
             response = "No rooms needed."
-            logger.info(f"Response to user: {response}")
+            logger.info("Response to user: %s", response)
             #self.sent_first_message = True
 
-    async def __determine_room_need(self, user_message: str) -> BasicExtraction:
+    async def __determine_room_need(self, user_message: str, speculation: Optional[SpeculativeBid] = None) -> BasicExtraction:
         # if "SQ" not in user_message:
         #     logger.info("SQ not found in message, not determining room need")
         #     return RoomResponse(needs_rooms=False)
         
         logger.info("Determining if user needs rooms")
-        messages = [
-            {"role": "system", "content": self.system_prompt_needs_rooms + "\n\nToday's date: " + datetime.datetime.now().strftime("%Y-%m-%d")},
-            {"role": "user", "content": user_message}
-        ]
+        if self.telex_parser_enabled:
+            with tracer.span("telex_parse"):
+                parsed = parse_telex(user_message, datetime.datetime.now().date())
+            if parsed.verdict != TelexVerdict.UNSURE:
+                response = BasicExtraction(**parsed.extraction_fields())
+                self.__adjust_early_arrival(response)
+                logger.info("Room need resolved by telex parser (%s)", parsed.verdict.value)
+                logger.debug("Telex extraction: %s", response)
+                return response
+            logger.info("Telex parser unsure, falling back to LLM")
+
+        if speculation is not None:
+            speculation.start(self.__speculative_stays(user_message))
+        messages = build_messages(PromptTask.NEEDS_ROOMS, user_message, datetime.datetime.now().strftime("%Y-%m-%d"))
         try:
-            response = await acompletion(
-                model="gpt-4o-mini",
-                messages=messages,
+            response = await self.llm.complete(
+                messages,
+                task=PromptTask.NEEDS_ROOMS,
                 response_format=BasicExtraction
             )
 
             response = BasicExtraction.parse_obj(json.loads(response.choices[0].message.content))
-
-            # Adjust arrival date if arrival time is before 1:00 PM
-            if response.arrival_time:
-                arrival_hour = int(response.arrival_time.split(":")[0])
-                if arrival_hour < 13:  # Before 1:00 PM
-                    arrival_date = datetime.datetime.strptime(response.arrival_date, "%Y-%m-%d")
-                    response.arrival_date = (arrival_date - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-                    logger.info(f"Adjusted arrival date to {response.arrival_date} due to early arrival time")
-            logger.info(f"Room need response: {response}")
+            self.__adjust_early_arrival(response)
+            logger.debug("Room need response: %s", response)
             return response
         
         # try:
@@ -541,9 +714,18 @@ class FastFingerBot:
         #     logger.info(f"Room need response: {response}")
         #     return response
         except Exception as e:
-            logger.error(f"Error during room need completion: {e}")
+            logger.error("Error during room need completion: %s", e)
             raise
 
+
+    def __adjust_early_arrival(self, response: BasicExtraction):
+        # Adjust arrival date if arrival time is before 1:00 PM
+        if response.arrival_time:
+            arrival_hour = int(response.arrival_time.split(":")[0])
+            if arrival_hour < 13:  # Before 1:00 PM
+                arrival_date = datetime.datetime.strptime(response.arrival_date, "%Y-%m-%d")
+                response.arrival_date = (arrival_date - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+                logger.info("Adjusted arrival date to %s due to early arrival time", response.arrival_date)
     
     async def __determine_room_booking(self, user_message: str) -> BookingResponse:
         # if "SQ" not in user_message:
@@ -551,163 +733,104 @@ class FastFingerBot:
         #     return RoomResponse(needs_rooms=False)
         
         logger.info("Determining if user is booking rooms")
-        messages = [
-            {"role": "system", "content": self.system_prompt_booking_rooms + "\n\nToday's date: " + datetime.datetime.now().strftime("%Y-%m-%d")},
-            {"role": "user", "content": user_message}
-        ]
+        messages = build_messages(PromptTask.BOOKING_ROOMS, user_message, datetime.datetime.now().strftime("%Y-%m-%d"))
         try:
-            response = await acompletion(
-                model="gpt-4o-mini",
-                messages=messages,
+            response = await self.llm.complete(
+                messages,
+                task=PromptTask.BOOKING_ROOMS,
                 response_format=BookingResponse
             )
 
-            logger.info(f"Booking rooms response from LLM: {response}")
+            logger.debug("Booking rooms response from LLM: %s", response)
 
             response = BookingResponse.parse_obj(json.loads(response.choices[0].message.content))
-            logger.info(f"Booking rooms response: {response}")
+            logger.info("Booking rooms response: booking_room=%s number_of_rooms=%s", response.booking_room, response.number_of_rooms)
             return response
         except Exception as e:
-            logger.error(f"Error during room need completion: {e}")
+            logger.error("Error during room need completion: %s", e)
             raise
 
     async def __get_number_of_rooms(self, user_message: str) -> NumberOfRooms:
         logger.debug("Fetching number of rooms required by user")
-        messages = [
-            {"role": "system", "content": self.system_prompt_number_of_rooms + "\n\nToday's date: " + datetime.datetime.now().strftime("%Y-%m-%d")},
-            {"role": "user", "content": user_message}
-        ]
+        messages = build_messages(PromptTask.NUMBER_OF_ROOMS, user_message, datetime.datetime.now().strftime("%Y-%m-%d"))
         try:
-            response = await acompletion(
-                model="gpt-4o-mini",
-                messages=messages,
+            response = await self.llm.complete(
+                messages,
+                task=PromptTask.NUMBER_OF_ROOMS,
                 response_format=NumberOfRooms
             )
             response = NumberOfRooms.parse_obj(json.loads(response.choices[0].message.content))
-            logger.debug(f"Number of rooms response: {response}")
+            logger.debug("Number of rooms response: %s", response)
             return response
         except Exception as e:
-            logger.error(f"Error during number of rooms completion: {e}")
+            logger.error("Error during number of rooms completion: %s", e)
             raise
 
-    def __get_available_rooms(self):
-        logger.debug("Fetching available rooms from file")
-        room_requirements_file = os.getenv("ROOM_REQUIREMENTS_FILE")
-        if not room_requirements_file:
+    def __get_inventory(self) -> RoomInventory:
+        if self.inventory is None:
             logger.critical("ROOM_REQUIREMENTS_FILE environment variable not set")
             raise ValueError("ROOM_REQUIREMENTS_FILE environment variable not set")
-
-        try:
-            with open(room_requirements_file, 'r') as f:
-                available_rooms = json.load(f)
-                logger.debug(f"Loaded available rooms: {available_rooms}")
-                return available_rooms
-        except FileNotFoundError:
-            logger.error(f"Room requirements file not found: {room_requirements_file}")
-            raise
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding JSON from room requirements file: {e}")
-            raise
-
-    async def __update_available_rooms(self, rooms_to_book: int, arrival_date: str, departure_date: str) -> Dict[str, int]:
-        logger.info(f"Updating available rooms, booking {rooms_to_book} rooms from {arrival_date} to {departure_date}.")
-        room_requirements_file = os.getenv("ROOM_REQUIREMENTS_FILE")
-        if not room_requirements_file:
-            logger.critical("ROOM_REQUIREMENTS_FILE environment variable not set")
-            raise ValueError("ROOM_REQUIREMENTS_FILE environment variable not set")
-
-        try:
-            available_rooms = self.__get_available_rooms()
-            booking_days = await self.__calculate_booking_days(self.current_state.arrival_date, self.current_state.departure_date, self.current_state.departure_time)
-            current_date = datetime.datetime.strptime(arrival_date, "%Y-%m-%d")
-            dates = [current_date + datetime.timedelta(days=i) for i in range(booking_days)]
-            date_strings = [date.strftime("%Y-%m-%d") for date in dates]
-            logger.info(f"Date strings: {date_strings}, \n dates: {dates}, \n booking days: {booking_days}, \n current date: {current_date}")
-            for date in date_strings:
-                if date not in available_rooms:
-                    available_rooms[date] = {"availability": 10}
-                    logger.info(f"Added missing date {date} with 10 rooms")
-
-                if available_rooms[date]["availability"] < rooms_to_book:
-                    logger.error(f"Not enough rooms available on {date}")
-                    raise ValueError(f"Not enough rooms available on {date}")
-
-                available_rooms[date]["availability"] -= rooms_to_book
-                self.__update_report(date, rooms_to_book)
-                logger.debug(f"Updated room availability on {date} to: {available_rooms[date]['availability']}")
-
-            with open(room_requirements_file, 'w') as f:
-                json.dump(available_rooms, f, indent=4)
-
-            logger.info("Successfully updated room availability for all booking dates")
-            return available_rooms
-        except FileNotFoundError:
-            logger.error(f"Room requirements file not found: {room_requirements_file}")
-            raise
-        except json.JSONDecodeError as e:
-            logger.error(f"Error handling JSON for room requirements file: {e}")
-            raise
+        return self.inventory
+
+    async def __update_available_rooms(self, session: ChatSession, rooms_to_book: int, hold: Hold) -> List[str]:
+        logger.info("Updating available rooms, booking %s rooms on %s", rooms_to_book, hold.dates)
+        inventory = self.__get_inventory()
+        with tracer.span("inventory_commit"):
+            booked_dates = await run_blocking(inventory.commit, hold, rooms_to_book)
+        if hold is session.current_hold:
+            session.current_hold = None
+        for date in booked_dates:
+            self.side_effects.submit("update_report", self.__update_report, date, rooms_to_book)
+        check_out = (datetime.date.fromisoformat(booked_dates[-1]) + datetime.timedelta(days=1)).isoformat()
+        self.side_effects.submit("record_booking", self.state.record_booking, booked_dates[0], check_out, rooms_to_book, session.chat_id)
+
+        logger.info("Successfully updated room availability for all booking dates")
+        return booked_dates
     
-    async def __calculate_if_possible(self, room_requirements: int, available_rooms: Dict[str, int], booking = False) -> bool:
-        logger.debug("Calculating room availability across all booking dates")
-        try:
-            booking_days = await self.__calculate_booking_days(self.current_state.arrival_date, self.current_state.departure_date, self.current_state.departure_time)
-            logger.info(f"Booking spans {booking_days} days")
-
-            current_date = datetime.datetime.strptime(self.current_state.arrival_date, "%Y-%m-%d")
-            dates = [current_date + datetime.timedelta(days=i) for i in range(booking_days)]
-            date_strings = [date.strftime("%Y-%m-%d") for date in dates]
-            logger.info(f"Date strings while checking for availability: {date_strings}")
-            # Check for missing dates and add them
-            room_requirements_file = os.getenv("ROOM_REQUIREMENTS_FILE")
-            updated = False
-
-            for date in date_strings:
-                if date not in available_rooms:
-                    available_rooms[date] = {"availability": 10}
-                    logger.info(f"Added missing date {date} with 10 rooms")
-                    updated = True
-                
-                if available_rooms[date]['availability'] < room_requirements:
-                    logger.warning(f"Insufficient rooms on {date}")
-                    return False
-
-            # Save updated file if any dates were added
-            if updated:
-                with open(room_requirements_file, 'w') as f:
-                    json.dump(available_rooms, f, indent=4)
-
-            logger.info("Sufficient rooms available for all booking dates")
-            return True
-        except Exception as e:
-            logger.error(f"Error during room availability calculation: {e}")
-            raise
+    async def __reserve_rooms(self, session: ChatSession, room_requirements: int, reuse_current_hold: bool = False, speculation: Optional[SpeculativeBid] = None) -> Optional[Hold]:
+        """
+        Put room_requirements rooms on hold for every night of the current request.
+
+        With reuse_current_hold the hold taken for our bid is returned when it still
+        covers the rooms; otherwise it is released before reserving again. A
+        speculative hold for exactly this stay is used instead of reserving again.
+        Returns None if the rooms are not available.
+        """
+        logger.debug("Reserving rooms across all booking dates")
+        with tracer.span("inventory_check"):
+            try:
+                inventory = self.__get_inventory()
+                if reuse_current_hold and session.current_hold is not None and await run_blocking(inventory.is_held, session.current_hold) and session.current_hold.rooms >= room_requirements:
+                    logger.info("Using hold %s taken for our bid", session.current_hold.hold_id)
+                    return session.current_hold
+                if session.current_hold is not None:
+                    await run_blocking(inventory.release, session.current_hold)
+                session.current_hold = None
+
+                booking_days = await self.__calculate_booking_days(session.current_state.arrival_date, session.current_state.departure_date, session.current_state.departure_time)
+                logger.info("Booking spans %s days", booking_days)
+
+                if speculation is not None:
+                    hold = await speculation.claim(Stay(session.current_state.arrival_date, booking_days, room_requirements))
+                    if hold is not None:
+                        logger.info("Using speculative hold %s", hold.hold_id)
+                        return hold
+
+                hold = await run_blocking(inventory.try_reserve, session.current_state.arrival_date, booking_days, room_requirements, ttl=self.bid_hold_ttl)
+                if hold is None:
+                    return None
+
+                logger.info("Sufficient rooms available for all booking dates")
+                return hold
+            except Exception as e:
+                logger.error("Error during room availability calculation: %s", e)
+                raise
     
-    def __load_report(self):
-        if os.path.exists(self.report_file):
-            with open(self.report_file, 'r') as f:
-                report = json.load(f)
-        else:
-            report = {}
-        return report
-
-    def __save_report(self, report: Dict[str, Dict[str, int]]):
-        with open(self.report_file, 'w') as f:
-            json.dump(report, f, indent=4)
-
     def __update_report(self, date: str, rooms_booked: int = 0, message_from_airlines: bool = False):
         try:    
-            logger.info(f"Updating report for date: {date}, rooms booked: {rooms_booked}, message from airlines: {message_from_airlines}")
-            report = self.__load_report()
-            if date not in report:
-                report[date] = {"number_of_messages_from_airlines": 0, "number_of_rooms_booked": 0}
-        
-            if message_from_airlines:
-                report[date]["number_of_messages_from_airlines"] += 1
-            else:
-                report[date]["number_of_rooms_booked"] += rooms_booked
-            self.__save_report(report)
+            logger.info("Updating report for date: %s, rooms booked: %s, message from airlines: %s", date, rooms_booked, message_from_airlines)
+            self.state.update_report(date, rooms_booked, message_from_airlines)
         except Exception as e:
-            logger.error(f"Error updating report: {e}")
+            logger.error("Error updating report: %s", e)
             raise
     
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Throughput of bulk availability overrides and multi-date availability lookups.
+
+For each inventory kind (JSON file with journal, in-memory with Storage, and
+the shared SQLite inventory) sets the availability of --dates dates one call
+per date, then again with one set_availability_many() call, and reads them
+back with get() per date and with get_many(). Fails if any date ends up with
+the wrong availability.
+
+Usage:
+    python -m benchmarks.bulk_override [--dates 365] [--repeat 3]
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import tempfile
+import time
+
+from utils.inventory import RoomInventory
+from utils.sqlite_backend import SQLiteInventory, SCHEMA
+from utils.storage import Storage
+
+START_DATE = datetime.date(2024, 11, 1)
+
+
+def make_inventories(directory: str):
+    room_requirements_file = os.path.join(directory, "room_availability.json")
+    with open(room_requirements_file, 'w') as f:
+        json.dump({}, f)
+    memory_storage = Storage(os.path.join(directory, "memory.db"))
+    sqlite_storage = Storage(os.path.join(directory, "shared.db"))
+    sqlite_storage.executescript(SCHEMA)
+    return {
+        "json file": RoomInventory(room_requirements_file),
+        "memory + storage": RoomInventory(storage=memory_storage),
+        "sqlite": SQLiteInventory(sqlite_storage),
+    }
+
+
+def timed(function, repeat: int) -> float:
+    """Best wall time of repeat runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dates", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger("utils.inventory").setLevel(logging.WARNING)
+
+    dates = [(START_DATE + datetime.timedelta(days=i)).isoformat() for i in range(args.dates)]
+    one_by_one = {date: i % 7 + 1 for i, date in enumerate(dates)}
+    bulk = {date: i % 5 + 10 for i, date in enumerate(dates)}
+
+    print(f"{'inventory':<18}{'set x1 (ms)':>14}{'set bulk (ms)':>15}{'speedup':>9}{'get x1 (ms)':>14}{'get bulk (ms)':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, inventory in make_inventories(directory).items():
+            set_single = timed(lambda: [inventory.set_availability(date, rooms) for date, rooms in one_by_one.items()], args.repeat)
+            set_bulk = timed(lambda: inventory.set_availability_many(bulk), args.repeat)
+            get_single = timed(lambda: [inventory.get(date) for date in dates], args.repeat)
+            get_bulk = timed(lambda: inventory.get_many(dates), args.repeat)
+
+            inventory.close()
+            assert inventory.get_many(dates) == bulk, f"{name}: availability differs from the bulk override"
+            print(f"{name:<18}{set_single * 1000:>14.1f}{set_bulk * 1000:>15.1f}{set_single / set_bulk:>8.0f}x"
+                  f"{get_single * 1000:>14.1f}{get_bulk * 1000:>15.1f}")
+
+    print(f"{args.dates} dates per override, best of {args.repeat}")
+
+
+if __name__ == "__main__":
+    main()
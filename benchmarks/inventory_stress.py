@@ -0,0 +1,109 @@
+"""
+Stress check for RoomInventory reservations.
+
+Fires concurrent try_reserve/commit/release calls from many threads against
+a small inventory and fails if any date is overbooked, i.e. if availability
+goes negative or the rooms committed on a date exceed what it started with.
+
+Usage:
+    python -m benchmarks.inventory_stress [--workers 32] [--operations 2000]
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.inventory import RoomInventory
+
+START_DATE = datetime.date(2024, 11, 1)
+DAYS = 14
+INITIAL_AVAILABILITY = 300
+
+
+def run_worker(inventory: RoomInventory, operations: int, seed: int, committed: Counter, committed_lock: threading.Lock) -> int:
+    rng = random.Random(seed)
+    bookings = 0
+    for _ in range(operations):
+        arrival = (START_DATE + datetime.timedelta(days=rng.randrange(DAYS - 3))).isoformat()
+        nights = rng.randint(1, 3)
+        rooms = rng.randint(1, 4)
+        hold = inventory.try_reserve(arrival, nights, rooms, ttl=rng.choice([0.001, 60.0]))
+        if hold is None:
+            continue
+        choice = rng.random()
+        if choice < 0.6:
+            try:
+                booked_rooms = rng.randint(1, rooms)
+                dates = inventory.commit(hold, booked_rooms)
+            except ValueError:
+                # The hold expired before we committed it
+                continue
+            with committed_lock:
+                for date in dates:
+                    committed[date] += booked_rooms
+            bookings += 1
+        elif choice < 0.9:
+            inventory.release(hold)
+        # else: abandon the hold and let it expire
+    return bookings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--operations", type=int, default=2000, help="operations per worker")
+    args = parser.parse_args()
+    # Insufficient-room warnings are expected here and would drown the result
+    logging.getLogger("utils.inventory").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        room_requirements_file = os.path.join(directory, "room_availability.json")
+        with open(room_requirements_file, 'w') as f:
+            json.dump({
+                (START_DATE + datetime.timedelta(days=i)).isoformat(): {"availability": INITIAL_AVAILABILITY}
+                for i in range(DAYS)
+            }, f)
+
+        inventory = RoomInventory(room_requirements_file)
+        committed = Counter()
+        committed_lock = threading.Lock()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [
+                executor.submit(run_worker, inventory, args.operations, seed, committed, committed_lock)
+                for seed in range(args.workers)
+            ]
+            bookings = sum(future.result() for future in futures)
+        elapsed = time.perf_counter() - started
+
+        time.sleep(0.01)
+        inventory.expire_holds()
+        for hold in list(inventory.holds.values()):
+            inventory.release(hold)
+
+        snapshot = inventory.snapshot()
+        for date, data in snapshot.items():
+            availability = data["availability"]
+            assert availability >= 0, f"{date} went negative: {availability}"
+            assert availability == INITIAL_AVAILABILITY - committed[date], \
+                f"{date} has {availability} rooms left but {committed[date]} of {INITIAL_AVAILABILITY} were committed"
+            assert inventory.is_available(date, 1, availability), f"{date} still has rooms on hold"
+
+        inventory.close()
+        reloaded = RoomInventory(room_requirements_file).snapshot()
+        assert reloaded == snapshot, "journal replay does not match the in-memory inventory"
+
+    total_operations = args.workers * args.operations
+    print(f"{total_operations} reservations from {args.workers} workers in {elapsed:.2f}s "
+          f"({total_operations / elapsed:.0f} ops/s), {bookings} bookings committed, no date overbooked")
+
+
+if __name__ == "__main__":
+    main()
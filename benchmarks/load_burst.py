@@ -0,0 +1,432 @@
+"""
+Burst load test: many WhatsApp groups posting at once, across several app workers.
+
+Models a weather disruption, when dozens of delayed flights are posted in
+several groups within minutes. --groups groups each post Poisson traffic
+at every rate in --rates (messages/s per group): delay telexes, bookings,
+chatter, free-form requests the telex parser leaves to the LLM and telexes
+from other stations, plus WHAPI redeliveries of some webhooks. Payloads
+have the shape post_whatsapp_group_payload expects.
+
+Each worker is a separate process running main.app in-process, as a
+uvicorn worker would, with its own dispatcher of --consumers consumers,
+MockLLM answering every LLM call and all workers sharing one state
+database and one MockWhapi. Webhooks are spread over the workers at
+random, like connections over uvicorn workers, so a redelivery can reach
+a different worker than the original. Every combination of --backends,
+--workers and --consumers is stepped through --rates until it saturates.
+
+Each step reports offered and processed messages/s, the time to drain the
+backlog, webhook ack latency, dispatcher queue wait, time to "RP Can" and
+how many "RP Can"s were missing or sent twice, then checks the shared
+inventory: dates where more rooms were booked than existed (overbooked)
+and dates whose availability is not the initial rooms minus the rooms
+booked (inconsistent). A step is sustained when nothing was rejected,
+the backlog drained within --max-drain seconds and "RP Can" p95 met
+--slo-ms. The summary recommends the fewest workers, then consumers, that
+sustain each rate with a consistent inventory. Steps are appended to
+--results keyed by commit.
+
+Usage:
+    python -m benchmarks.load_burst [--groups 12] [--rates 0.25,0.5,1] [--workers 1,2] [--consumers 4,12]
+        [--backends sqlite] [--duration 10] [--rooms 80] [--slo-ms 1500]
+        [--llm-latency lognormal:700:0.35] [--mix telex=0.4,booking=0.25,chatter=0.2,freeform=0.1,foreign=0.05]
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.replay.common import git_revision, match_rp_cans, percentiles, wait_for_idle  # noqa: E402
+from benchmarks.replay.mock_llm import LatencyModel, MockLLM, parse_latencies  # noqa: E402
+from benchmarks.replay.mock_whapi import MockWhapi  # noqa: E402
+from utils.storage import Storage  # noqa: E402
+
+ORIGINATOR = "6591234567"
+OTHER_STATION = "6591112222"
+HOTEL_DESK = "6598765432"
+CONFIRMATION_GROUP = "120363199999999999@g.us"
+HUBS = ["BCN", "AKL", "LHR", "FRA", "SYD", "NRT", "CDG", "JFK", "DXB", "HKG"]
+CHATTER = ["Noted with thanks", "Any update on the rooms?", "Crew transport arranged", "Received", "Will revert shortly",
+           "Pls disregard previous msg", "Thank you RP", "Ok noted", "👍", "Weather still bad, more delays expected"]
+DEFAULT_MIX = "telex=0.4,booking=0.25,chatter=0.2,freeform=0.1,foreign=0.05"
+DEFAULT_RESULTS = REPO_ROOT / "benchmarks" / "results" / "load_burst.jsonl"
+STAY_WINDOW_DAYS = 10
+
+
+class Traffic:
+    """Poisson webhook schedule for a number of groups, with the LLM answers for its free-form requests."""
+
+    def __init__(self, groups: int, rate: float, duration: float, mix: Dict[str, float], redeliver: float, seed: int):
+        self.rng = random.Random(seed)
+        self.groups = [f"1203631{i:011d}@g.us" for i in range(groups)]
+        self.rate = rate
+        self.duration = duration
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.redeliver = redeliver
+        self.today = datetime.date.today()
+        self.answers: Dict[str, Dict[str, Any]] = {}
+        self.sequence = itertools.count(1)
+
+    def __message(self, chat_id: str, at: float, body: str, sender: str, name: str, message_id: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "messages": [{
+                "id": message_id or f"LOAD{next(self.sequence):08d}",
+                "from_me": False,
+                "type": "text",
+                "chat_id": chat_id,
+                "timestamp": int(time.time() + at),
+                "source": "mobile",
+                "text": {"body": body},
+                "from": sender,
+                "from_name": name,
+            }],
+            "channel_id": "LOAD-1",
+        }
+
+    def __stay(self) -> Tuple[datetime.date, str, datetime.date, str]:
+        """An afternoon arrival within the stay window and a next-day departure before 19:00, i.e. a one-night stay."""
+        arrival = self.today + datetime.timedelta(days=self.rng.randrange(STAY_WINDOW_DAYS))
+        eta = f"{self.rng.randint(13, 23):02d}{self.rng.choice(['05', '20', '35', '50'])}"
+        std = f"{self.rng.randint(8, 18):02d}{self.rng.choice(['00', '25', '45'])}"
+        return arrival, eta, arrival + datetime.timedelta(days=1), std
+
+    def __telex(self, rooms: int) -> str:
+        arrival, eta, departure, std = self.__stay()
+        economy = self.rng.randint(0, rooms)
+        lines = ["NEW DELAYED SQ ARR", "", f"SQ{self.rng.randint(100, 999)}/{self.rng.choice(HUBS)}/{arrival.strftime('%d%b').upper()}/ETA {eta}HRS",
+                 "", "NO. OF ROOMS", ""]
+        if economy:
+            lines.append(f"  {economy} ROOMS (ECONOMY)" if economy > 1 else "  1 ROOM (ECONOMY)")
+        if rooms - economy:
+            lines.append(f"  {rooms - economy} ROOMS (Business)" if rooms - economy > 1 else "  1 ROOM (Business)")
+        lines += ["", " DEPARTURE :", "", f"SQ{self.rng.randint(100, 999)}/{self.rng.choice(HUBS)}/{departure.strftime('%d%b').upper()}/STD {std}HRS"]
+        return "\n".join(lines)
+
+    def __freeform(self, rooms: int) -> str:
+        arrival, eta, departure, std = self.__stay()
+        body = (f"Pls provide {rooms} rooms for SQ{self.rng.randint(100, 999)} crew arr {arrival.strftime('%d%b').upper()} {eta} "
+                f"dep {departure.strftime('%d%b').upper()} {std} ref {next(self.sequence)}")
+        self.answers[body] = {"BasicExtraction": {
+            "needs_rooms": True, "number_of_rooms": rooms,
+            "arrival_date": arrival.isoformat(), "arrival_time": f"{eta[:2]}:{eta[2:]}",
+            "departure_date": departure.isoformat(), "departure_time": f"{std[:2]}:{std[2:]}",
+        }}
+        return body
+
+    def schedule(self) -> List[Dict[str, Any]]:
+        """Webhooks in arrival order: {"at" seconds, "payload", "kind", "expect"}."""
+        webhooks = []
+        for chat_id in self.groups:
+            at = 0.0
+            last_rooms = self.rng.randint(1, 4)
+            while True:
+                at += self.rng.expovariate(self.rate)
+                if at >= self.duration:
+                    break
+                kind = self.rng.choices(self.kinds, self.weights)[0]
+                expect = None
+                if kind == "telex":
+                    last_rooms = self.rng.randint(1, 6)
+                    payload = self.__message(chat_id, at, self.__telex(last_rooms), ORIGINATOR, "SQ Ops")
+                    expect = "RP Can"
+                elif kind == "booking":
+                    payload = self.__message(chat_id, at, f"We will take from RP {last_rooms} rooms", ORIGINATOR, "SQ Duty Manager")
+                elif kind == "chatter":
+                    payload = self.__message(chat_id, at, self.rng.choice(CHATTER), HOTEL_DESK, "Hotel Desk")
+                elif kind == "freeform":
+                    last_rooms = self.rng.randint(1, 6)
+                    payload = self.__message(chat_id, at, self.__freeform(last_rooms), ORIGINATOR, "SQ Ops")
+                    expect = "RP Can"
+                else:
+                    payload = self.__message(chat_id, at, self.__telex(self.rng.randint(1, 6)), OTHER_STATION, "Other Station")
+                webhooks.append({"at": at, "payload": payload, "kind": kind, "expect": expect})
+                if self.rng.random() < self.redeliver:
+                    webhooks.append({"at": at + self.rng.uniform(0.05, 0.5), "payload": payload, "kind": "redelivery", "expect": None})
+        return sorted(webhooks, key=lambda webhook: webhook["at"])
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("telex", "booking", "chatter", "freeform", "foreign"):
+            raise ValueError(f"Unknown message kind {kind!r} in --mix")
+        mix[kind] = float(weight)
+    return mix
+
+
+def prepare_state(directory: Path, backend: str, rooms: int) -> Tuple[Dict[str, str], List[str]]:
+    """Data files and an initialised shared database, so workers do not race to import them; returns their env and the inventory dates."""
+    today = datetime.date.today()
+    dates = [(today + datetime.timedelta(days=i)).isoformat() for i in range(-1, STAY_WINDOW_DAYS + 3)]
+    data = directory / "data"
+    data.mkdir()
+    room_requirements_file = data / "room_availability.json"
+    room_requirements_file.write_text(json.dumps({date: {"availability": rooms, "price_per_night": 180.0} for date in dates}))
+    metadata_file = data / "metadata.json"
+    metadata_file.write_text(json.dumps({"message_originator": ORIGINATOR, "help_menu": "HELP"}))
+    db_file = data / "state.db"
+    storage = Storage(str(db_file))
+    storage.import_json(str(room_requirements_file), None, str(metadata_file))
+    if backend == "sqlite":
+        from utils.config_cache import ConfigCache
+        from utils.sqlite_backend import SQLiteStateBackend
+        SQLiteStateBackend(storage, ConfigCache(storage)).close()
+    else:
+        storage.close()
+    env = {
+        "STATE_BACKEND": backend,
+        "STATE_DB_FILE": str(db_file),
+        "ROOM_REQUIREMENTS_FILE": str(room_requirements_file),
+        "DATA_METADATA_FILE": str(metadata_file),
+        "REPORT_FILE": str(data / "report.json"),
+        "LOG_FILE": str(directory / "fast_finger_bot.log"),
+    }
+    return env, dates
+
+
+def check_inventory(db_file: str, dates: List[str], rooms: int) -> Dict[str, Any]:
+    """Compare the shared inventory with the bookings every worker recorded."""
+    storage = Storage(db_file)
+    final = {date: availability for date, availability, _ in storage.availability_range(dates[0], dates[-1])}
+    booked = Counter()
+    bookings = storage.query("SELECT check_in, check_out, rooms FROM bookings")
+    storage.close()
+    for check_in, check_out, booked_rooms in bookings:
+        night = datetime.date.fromisoformat(check_in)
+        while night < datetime.date.fromisoformat(check_out):
+            booked[night.isoformat()] += booked_rooms
+            night += datetime.timedelta(days=1)
+    overbooked = [date for date in dates if booked[date] > rooms]
+    inconsistent = [date for date in dates if final.get(date) != rooms - booked[date]]
+    return {
+        "bookings": len(bookings),
+        "rooms_booked": sum(booked.values()),
+        "overbooked_dates": len(overbooked),
+        "inconsistent_dates": len(inconsistent),
+        "rooms_unaccounted": sum(abs(final.get(date, rooms) - (rooms - booked[date])) for date in dates),
+    }
+
+
+async def drive(app_module, webhooks: List[Dict[str, Any]], barrier, timeout: float) -> Dict[str, Any]:
+    import httpx
+
+    app = app_module.app
+    posts: List[Dict[str, Any]] = []
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load") as client:
+            await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+            started = time.perf_counter()
+
+            async def post(webhook):
+                await asyncio.sleep(max(started + webhook["at"] - time.perf_counter(), 0))
+                sent = time.perf_counter()
+                response = await client.post("/webhooks/whatsapp_group/messages", content=json.dumps(webhook["payload"]),
+                                             headers={"content-type": "application/json"})
+                posts.append({
+                    "chat_id": webhook["payload"]["messages"][0]["chat_id"],
+                    "sent": sent,
+                    "ack_s": time.perf_counter() - sent,
+                    "status": response.status_code,
+                    "expect": webhook["expect"],
+                })
+
+            # Open loop: webhooks arrive on schedule whether or not earlier ones have been processed
+            await asyncio.gather(*(post(webhook) for webhook in webhooks))
+            idle = await wait_for_idle(app_module, timeout)
+            stats = (await client.get("/stats")).json()
+    return {"posts": posts, "started": started, "idle": idle, "stats": stats}
+
+
+def run_worker(env: Dict[str, str], directory: str, webhooks: List[Dict[str, Any]], answers: Dict[str, Dict[str, Any]],
+               llm_latency: str, seed: int, barrier, results, timeout: float):
+    """One app worker: main.app with MockLLM, fed its share of the webhooks."""
+    os.environ.update(env)
+    os.chdir(directory)
+    sys.stdout = open(os.devnull, "w")
+    import main as app_module
+    MockLLM(answers, parse_latencies([], llm_latency, seed)).install()
+    results.put(asyncio.run(drive(app_module, webhooks, barrier, timeout)))
+
+
+def run_step(args, backend: str, workers: int, consumers: int, rate: float, whapi: MockWhapi) -> Dict[str, Any]:
+    traffic = Traffic(args.groups, rate, args.duration, parse_mix(args.mix), args.redeliver, args.seed)
+    webhooks = traffic.schedule()
+    router = random.Random(args.seed)
+    shares: List[List[Dict[str, Any]]] = [[] for _ in range(workers)]
+    for webhook in webhooks:
+        shares[router.randrange(workers)].append(webhook)
+
+    with tempfile.TemporaryDirectory(prefix="load-burst-") as work:
+        env, dates = prepare_state(Path(work), backend, args.rooms)
+        env.update({
+            "OPENAI_API_KEY": "load",
+            "WHAPI_API_KEY": "load",
+            "WHAPI_BASE_URL": whapi.url,
+            "WHAPI_HTTP2": "false",
+            "WHATSAPP_GROUP_IDS": ",".join(traffic.groups + [CONFIRMATION_GROUP]),
+            "CONFIRMATION_NOTIFICATION_CHAT_ID": CONFIRMATION_GROUP,
+            "WEBHOOK_CONSUMERS": str(consumers),
+            "LLM_KEEP_WARM_SECONDS": "0",
+            "LLM_KEEP_WARM_URL": f"{whapi.url}/models",
+            "LLM_CACHE_DIR": str(Path(work) / "data" / "llm_cache"),
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "ERROR"),
+            "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+        })
+        context = multiprocessing.get_context("spawn")
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        processes = [
+            context.Process(target=run_worker, args=(env, work, share, traffic.answers, args.llm_latency, args.seed + i, barrier, results, args.timeout))
+            for i, share in enumerate(shares)
+        ]
+        sent_before = len(whapi.sent)
+        for process in processes:
+            process.start()
+        runs = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        inventory = check_inventory(env["STATE_DB_FILE"], dates, args.rooms)
+
+    posts = [post for run in runs for post in run["posts"]]
+    sends = whapi.sent_since(sent_before)
+    latencies, missed, duplicates = match_rp_cans(posts, sends)
+    started = min(run["started"] for run in runs)
+    idle = max(run["idle"] for run in runs)
+    dispatchers = [run["stats"]["webhook_dispatcher"] for run in runs]
+    processed = sum(d["processed"] + d["failed"] for d in dispatchers)
+    queue_wait_p95 = max(run["stats"]["stage_latency"].get("queue_wait", {}).get("p95_ms", 0.0) for run in runs)
+    rp_can = dict(percentiles(latencies), count=len(latencies), missed=missed, duplicates=duplicates)
+    rejected = sum(1 for post in posts if post["status"] == 503)
+    drain_s = max(idle - started - args.duration, 0.0)
+    return {
+        "backend": backend,
+        "workers": workers,
+        "consumers": consumers,
+        "groups": args.groups,
+        "rate_per_group": rate,
+        "offered_msgs_per_s": round(len(webhooks) / args.duration, 2),
+        "processed_msgs_per_s": round(len(posts) / (idle - started), 2),
+        "webhooks": len(posts),
+        "dispatched": processed,
+        "rejected": rejected,
+        "drain_s": round(drain_s, 2),
+        "ack": percentiles([post["ack_s"] for post in posts]),
+        "queue_wait": {
+            "avg_ms": round(sum(d["avg_wait_ms"] * (d["processed"] + d["failed"]) for d in dispatchers) / processed, 2) if processed else 0.0,
+            "p95_ms": round(queue_wait_p95, 2),
+            "max_ms": round(max(d["max_wait_ms"] for d in dispatchers), 2),
+        },
+        "rp_can": rp_can,
+        "llm_calls": sum(run["stats"]["llm"]["calls"] for run in runs),
+        "speculation": {
+            outcome: sum(run["stats"].get("speculation", {}).get(outcome, 0) for run in runs)
+            for outcome in ("started", "hits", "misses")
+        },
+        "inventory": inventory,
+        "consistent": not (inventory["overbooked_dates"] or inventory["inconsistent_dates"] or duplicates),
+        "sustained": rejected == 0 and drain_s <= args.max_drain and rp_can["p95_ms"] <= args.slo_ms,
+    }
+
+
+def print_step(step: Dict[str, Any]):
+    rp, inventory = step["rp_can"], step["inventory"]
+    print(f"{step['backend']:<7}{step['workers']:>3}w{step['consumers']:>4}c {step['offered_msgs_per_s']:>7.1f} {step['processed_msgs_per_s']:>7.1f}"
+          f"{step['drain_s']:>7.1f}s{step['ack']['p95_ms']:>8.1f}{step['queue_wait']['p95_ms']:>9.1f}{rp['p50_ms']:>8.0f}{rp['p95_ms']:>8.0f}"
+          f"{rp['missed']:>7}{rp['duplicates']:>5}{inventory['overbooked_dates']:>6}{inventory['inconsistent_dates']:>6}"
+          f"  {'sustained' if step['sustained'] else 'SATURATED'}{'' if step['consistent'] else ' INCONSISTENT'}", flush=True)
+
+
+def recommend(steps: List[Dict[str, Any]], groups: int):
+    """For each rate, the fewest workers and then consumers that sustained it with a consistent inventory."""
+    print(f"\nRecommendation for one property with {groups} groups:")
+    configs = {}
+    for step in steps:
+        configs.setdefault((step["backend"], step["workers"], step["consumers"]), []).append(step)
+    for config, config_steps in sorted(configs.items()):
+        sustained = [step["offered_msgs_per_s"] for step in config_steps if step["sustained"] and step["consistent"]]
+        peak = max(step["processed_msgs_per_s"] for step in config_steps)
+        problems = [] if all(step["consistent"] for step in config_steps) else [" - inventory NOT consistent"]
+        print(f"  {config[0]} backend, {config[1]} worker(s) x {config[2]} consumers: sustains {max(sustained) if sustained else 0:.1f} msg/s, "
+              f"peak {peak:.1f} msg/s processed{''.join(problems)}")
+    for rate in sorted({step["rate_per_group"] for step in steps}):
+        candidates = [step for step in steps if step["rate_per_group"] == rate and step["sustained"] and step["consistent"]]
+        offered = next(step["offered_msgs_per_s"] for step in steps if step["rate_per_group"] == rate)
+        if not candidates:
+            print(f"  {offered:.1f} msg/s ({rate:g}/s per group): no tested config sustains it; add workers or consumers")
+            continue
+        best = min(candidates, key=lambda step: (step["workers"], step["consumers"], step["backend"] != "sqlite"))
+        print(f"  {offered:.1f} msg/s ({rate:g}/s per group): {best['workers']} uvicorn worker(s) x WEBHOOK_CONSUMERS={best['consumers']} "
+              f"with STATE_BACKEND={best['backend']} (RP Can p95 {best['rp_can']['p95_ms']:.0f}ms)")
+
+
+def floats(spec: str) -> List[float]:
+    return [float(value) for value in spec.split(",")]
+
+
+def ints(spec: str) -> List[int]:
+    return [int(value) for value in spec.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=12)
+    parser.add_argument("--rates", type=floats, default=[0.25, 0.5, 1.0], help="Messages/s per group, stepped through in order")
+    parser.add_argument("--workers", type=ints, default=[1, 2], help="App worker processes")
+    parser.add_argument("--consumers", type=ints, default=[4, 12], help="WEBHOOK_CONSUMERS per worker")
+    parser.add_argument("--backends", type=lambda spec: spec.split(","), default=["sqlite"], help="STATE_BACKEND values")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of traffic per step")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--redeliver", type=float, default=0.05, help="Share of webhooks WHAPI delivers twice")
+    parser.add_argument("--rooms", type=int, default=80, help="Rooms per night; low values make groups compete for rooms")
+    parser.add_argument("--llm-latency", default="lognormal:700:0.35")
+    parser.add_argument("--whapi-latency", default="lognormal:80:0.3")
+    parser.add_argument("--slo-ms", type=float, default=1500.0, help="Highest acceptable RP Can p95")
+    parser.add_argument("--max-drain", type=float, default=3.0, help="Seconds the backlog may take to drain after traffic stops")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS)
+    args = parser.parse_args()
+
+    commit, dirty = git_revision()
+    whapi = MockWhapi(LatencyModel(args.whapi_latency, random.Random(args.seed)))
+    whapi.start()
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    print(f"{'backend':<7}{'config':>9} {'offer':>7} {'done':>7}{'drain':>8}{'ack95':>8}{'wait95':>9}{'RP p50':>8}{'RP p95':>8}"
+          f"{'missed':>7}{'dup':>5}{'over':>6}{'incon':>6}")
+    steps = []
+    try:
+        for backend, workers, consumers in itertools.product(args.backends, args.workers, args.consumers):
+            for rate in args.rates:
+                step = run_step(args, backend, workers, consumers, rate, whapi)
+                steps.append(step)
+                print_step(step)
+                with open(args.results, "a") as f:
+                    f.write(json.dumps(dict(step, commit=commit, dirty=dirty, timestamp=datetime.datetime.now().isoformat(timespec="seconds"),
+                                            config={"duration": args.duration, "mix": args.mix, "rooms": args.rooms, "seed": args.seed,
+                                                    "llm_latency": args.llm_latency, "whapi_latency": args.whapi_latency})) + "\n")
+                if not step["sustained"]:
+                    # Higher rates only saturate further
+                    break
+    finally:
+        whapi.stop()
+    recommend(steps, args.groups)
+
+
+if __name__ == "__main__":
+    main()
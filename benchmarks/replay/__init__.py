@@ -0,0 +1 @@
+"""Offline replay benchmark: recorded group webhooks through main.app with a mock LLM and a mock WHAPI server."""
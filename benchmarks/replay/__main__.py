@@ -0,0 +1,325 @@
+"""
+Offline replay of recorded group webhooks through the whole FastAPI app.
+
+Replays benchmarks/replay/corpus.json (airline delay telexes, bookings,
+chatter, edits, WHAPI redeliveries and confirmation-group commands) into
+main.app in-process, with every litellm acompletion call answered by
+MockLLM and WHAPI replaced by a local MockWhapi server, so a run needs no
+network and no API keys. The app runs on a throwaway copy of its data
+files with a generous availability file, so every telex can be answered.
+
+Reports webhook throughput and acknowledgement latency, time from webhook
+to "RP Can" at WHAPI (p50/p95/p99, each "RP Can" matched to its telex in
+per-chat order), LLM calls, the app's own stage latencies and the file
+I/O done during the replay: Python-level opens of the data files from an
+audit hook, plus /proc/self/io deltas, which also cover SQLite. Each run
+is appended to --results keyed by commit and config, so the same config
+can be compared across commits with --compare.
+
+Usage:
+    python -m benchmarks.replay [--repeat 5] [--speed 0]
+        [--llm-latency lognormal:700:0.35] [--llm-latency BookingResponse=fixed:300]
+        [--whapi-latency lognormal:80:0.3] [--seed 1] [--no-llm-cache] [--compare]
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_CORPUS = REPO_ROOT / "benchmarks" / "replay" / "corpus.json"
+DEFAULT_RESULTS = REPO_ROOT / "benchmarks" / "results" / "replay.jsonl"
+# Corpus dates are offsets from the day of the replay, so its telexes are always upcoming
+CORPUS_DATE_RE = re.compile(r"\{(?P<kind>day|date)(?P<offset>[+-]\d+)\}")
+PROC_IO_FIELDS = ("rchar", "wchar", "syscr", "syscw", "read_bytes", "write_bytes")
+REPORTED_STAGES = ("handle_message", "telex_parse", "inventory_check", "inventory_commit", "whapi_send", "queue_wait", "time_to_rp_can")
+
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.replay.common import git_revision, match_rp_cans, percentiles, wait_for_idle  # noqa: E402
+
+
+def proc_io() -> Optional[Dict[str, int]]:
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return {name: int(fields[name]) for name in PROC_IO_FIELDS}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class FileOpenCounter:
+    """Counts files opened under a directory, for reading and for writing, through an audit hook."""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.realpath(directory) + os.sep
+        self.active = False
+        self.counts = {"reads": 0, "writes": 0}
+        self.files: Dict[str, int] = {}
+
+    def __call__(self, event: str, args: tuple):
+        if not self.active or event != "open":
+            return
+        path, mode, flags = args
+        if not isinstance(path, str):
+            return
+        path = os.path.realpath(path)
+        if not path.startswith(self.directory):
+            return
+        if mode is not None:
+            writing = any(c in mode for c in "wax+")
+        else:
+            writing = bool(flags & (os.O_WRONLY | os.O_RDWR))
+        self.counts["writes" if writing else "reads"] += 1
+        name = os.path.relpath(path, self.directory)
+        self.files[name] = self.files.get(name, 0) + 1
+
+
+def render_corpus(text: str, today: datetime.date) -> Dict[str, Any]:
+    """The corpus with each {day+N} written as a DDMMM date and each {date+N} as a YYYY-MM-DD date, N days after today."""
+    def render(match: "re.Match") -> str:
+        date = today + datetime.timedelta(days=int(match.group("offset")))
+        return date.strftime("%d%b").upper() if match.group("kind") == "day" else date.isoformat()
+    return json.loads(CORPUS_DATE_RE.sub(render, text))
+
+
+def write_data_files(directory: Path, corpus: Dict[str, Any]) -> Dict[str, str]:
+    """Availability from a month before today to a year after it, plus metadata; returns the env pointing at them."""
+    data = directory / "data"
+    data.mkdir()
+    today = datetime.date.today()
+    dates = [today + datetime.timedelta(days=i) for i in range(-30, 366)]
+    availability = {date.isoformat(): {"availability": 1000, "price_per_night": 180.0} for date in dates}
+    (data / "room_availability.json").write_text(json.dumps(availability, indent=4))
+    (data / "metadata.json").write_text(json.dumps({"message_originator": corpus["originator"], "help_menu": "HELP"}))
+    return {
+        "ROOM_REQUIREMENTS_FILE": str(data / "room_availability.json"),
+        "DATA_METADATA_FILE": str(data / "metadata.json"),
+        "REPORT_FILE": str(data / "report.json"),
+        "STATE_DB_FILE": str(data / "state.db"),
+        "LLM_CACHE_DIR": str(data / "llm_cache"),
+        "LOG_FILE": str(directory / "fast_finger_bot.log"),
+    }
+
+
+def recorded_answers(corpus: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    answers = {}
+    for webhook in corpus["webhooks"]:
+        if "llm" in webhook:
+            message = webhook["payload"]["messages"][0]
+            answers[message["text"]["body"]] = webhook["llm"]
+    return answers
+
+
+def with_round(payload: Dict[str, Any], round_number: int) -> Dict[str, Any]:
+    """A copy of payload whose message ids are unique to this round, so later rounds are not deduplicated away."""
+    if round_number == 0:
+        return payload
+    payload = json.loads(json.dumps(payload))
+    for message in payload["messages"]:
+        message["id"] = f"{message['id']}-{round_number}"
+        if message.get("action", {}).get("target"):
+            message["action"]["target"] = f"{message['action']['target']}-{round_number}"
+    return payload
+
+
+async def replay(app_module, corpus: Dict[str, Any], whapi, args) -> Dict[str, Any]:
+    import httpx
+
+    app = app_module.app
+    webhooks = corpus["webhooks"]
+    span_ms = max(w["at_ms"] for w in webhooks) + 1000
+    by_chat: Dict[str, List[Tuple[float, int, Dict[str, Any]]]] = {}
+    for round_number in range(args.repeat):
+        for webhook in webhooks:
+            chat_id = webhook["payload"]["messages"][0]["chat_id"]
+            at = (round_number * span_ms + webhook["at_ms"]) / 1000
+            by_chat.setdefault(chat_id, []).append((at, round_number, webhook))
+
+    posts: List[Dict[str, Any]] = []
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            sent_before = len(whapi.sent)
+            started = time.perf_counter()
+
+            async def send_chat(entries):
+                for at, round_number, webhook in entries:
+                    if args.speed > 0:
+                        await asyncio.sleep(max(started + at / args.speed - time.perf_counter(), 0))
+                    body = json.dumps(with_round(webhook["payload"], round_number))
+                    sent = time.perf_counter()
+                    response = await client.post("/webhooks/whatsapp_group/messages", content=body, headers={"content-type": "application/json"})
+                    posts.append({
+                        "chat_id": webhook["payload"]["messages"][0]["chat_id"],
+                        "sent": sent,
+                        "ack_s": time.perf_counter() - sent,
+                        "status": response.status_code,
+                        "expect": webhook.get("expect"),
+                    })
+
+            await asyncio.gather(*(send_chat(entries) for entries in by_chat.values()))
+            acked = time.perf_counter()
+
+            idle = await wait_for_idle(app_module, args.timeout)
+            stats = (await client.get("/stats")).json()
+
+    sends = whapi.sent_since(sent_before)
+    return {"posts": posts, "sends": sends, "started": started, "acked": acked, "idle": idle, "stats": stats}
+
+
+def config_key(args, corpus_bytes: bytes) -> Tuple[Dict[str, Any], str]:
+    config = {
+        "corpus_sha1": hashlib.sha1(corpus_bytes).hexdigest()[:12],
+        "repeat": args.repeat,
+        "speed": args.speed,
+        "llm_latency": args.llm_latency,
+        "whapi_latency": args.whapi_latency,
+        "seed": args.seed,
+        "llm_cache": not args.no_llm_cache,
+        "state_backend": os.getenv("STATE_BACKEND", "memory").lower(),
+    }
+    return config, hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:10]
+
+
+def print_comparison(results_file: Path, config_hash: str):
+    runs = []
+    if results_file.exists():
+        for line in results_file.read_text().splitlines():
+            run = json.loads(line)
+            if run.get("config_hash") == config_hash:
+                runs.append(run)
+    print(f"\nRuns with config {config_hash} in {results_file}:")
+    print(f"{'commit':<14}{'date':<21}{'msg/s':>8}{'ack p95':>9}{'RP p50':>9}{'RP p95':>9}{'RP p99':>9}{'missed':>8}{'LLM':>6}{'writes':>8}")
+    for run in runs[-20:]:
+        rp = run["rp_can"]
+        print(f"{run['commit'] + ('+' if run['dirty'] else ''):<14}{run['timestamp'][:19]:<21}{run['throughput_msgs_per_s']:>8.1f}"
+              f"{run['ack']['p95_ms']:>9.1f}{rp['p50_ms']:>9.1f}{rp['p95_ms']:>9.1f}{rp['p99_ms']:>9.1f}{rp['missed']:>8}"
+              f"{run['llm_calls']['total']:>6}{run['file_io']['opens']['writes']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=5, help="Replay the corpus this many times, with fresh message ids each time")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay speed relative to the recording; 0 sends each chat's webhooks back to back")
+    parser.add_argument("--llm-latency", action="append", default=[], metavar="[NAME=]SPEC",
+                        help="fixed:MS, uniform:LO:HI, normal:MEAN:SD or lognormal:MEDIAN:SIGMA, optionally for one response_format NAME")
+    parser.add_argument("--whapi-latency", default="lognormal:80:0.3")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-llm-cache", action="store_true", help="Turn off the LLM response cache")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for the app to go idle after the last webhook")
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS)
+    parser.add_argument("--compare", action="store_true", help="Print earlier runs with the same config")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own output")
+    args = parser.parse_args()
+    llm_default = next((spec for spec in args.llm_latency if "=" not in spec), "lognormal:700:0.35")
+
+    corpus_bytes = args.corpus.read_bytes()
+    corpus = render_corpus(corpus_bytes.decode(), datetime.date.today())
+    config, config_hash = config_key(args, corpus_bytes)
+    commit, dirty = git_revision()
+
+    from benchmarks.replay.mock_llm import LatencyModel, MockLLM, parse_latencies
+    from benchmarks.replay.mock_whapi import MockWhapi
+    import random
+
+    whapi = MockWhapi(LatencyModel(args.whapi_latency, random.Random(args.seed + 1)))
+    whapi.start()
+    work = tempfile.TemporaryDirectory(prefix="replay-")
+    directory = Path(work.name)
+    os.environ.update(write_data_files(directory, corpus))
+    os.environ.update({
+        "OPENAI_API_KEY": "replay",
+        "WHAPI_API_KEY": "replay",
+        "WHAPI_BASE_URL": whapi.url,
+        "WHAPI_HTTP2": "false",
+        "WHATSAPP_GROUP_IDS": ",".join(corpus["airline_groups"] + [corpus["confirmation_group"]]),
+        "CONFIRMATION_NOTIFICATION_CHAT_ID": corpus["confirmation_group"],
+        "LLM_KEEP_WARM_SECONDS": "0",
+        "LLM_KEEP_WARM_URL": f"{whapi.url}/models",
+        "LLM_CACHE_ENABLED": "false" if args.no_llm_cache else "true",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "INFO" if args.verbose else "WARNING"),
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    })
+    # Anything the app writes relative to the working directory lands in the throwaway copy
+    os.chdir(directory)
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        import main as app_module
+        mock_llm = MockLLM(recorded_answers(corpus), parse_latencies(args.llm_latency, llm_default, args.seed))
+        mock_llm.install()
+
+        opens = FileOpenCounter(str(directory))
+        sys.addaudithook(opens)
+        io_before = proc_io()
+        opens.active = True
+        run = asyncio.run(replay(app_module, corpus, whapi, args))
+        opens.active = False
+        io_after = proc_io()
+    whapi.stop()
+
+    posts = run["posts"]
+    latencies, missed, unexpected = match_rp_cans(posts, run["sends"])
+    stages = run["stats"].get("stage_latency", {})
+    result = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "config_hash": config_hash,
+        "config": config,
+        "webhooks": len(posts),
+        "statuses": {str(status): sum(1 for p in posts if p["status"] == status) for status in sorted({p["status"] for p in posts})},
+        "throughput_msgs_per_s": round(len(posts) / (run["idle"] - run["started"]), 2),
+        "ingest_msgs_per_s": round(len(posts) / (run["acked"] - run["started"]), 2),
+        "wall_s": round(run["idle"] - run["started"], 3),
+        "ack": percentiles([p["ack_s"] for p in posts]),
+        "rp_can": dict(percentiles(latencies), count=len(latencies), missed=missed, unexpected=unexpected),
+        "whapi_sends": len(run["sends"]),
+        "llm_calls": dict(sorted(mock_llm.calls.items()), total=sum(mock_llm.calls.values()), max_in_flight=mock_llm.max_in_flight),
+        "speculation": run["stats"].get("speculation"),
+        "file_io": {
+            "opens": opens.counts,
+            "opens_by_file": dict(sorted(opens.files.items())),
+            "proc": {name: io_after[name] - io_before[name] for name in PROC_IO_FIELDS} if io_before and io_after else None,
+        },
+        "stages": {stage: {k: round(v, 2) for k, v in stages[stage].items()} for stage in sorted(stages)
+                   if stage in REPORTED_STAGES or stage.startswith("llm.")},
+    }
+    work.cleanup()
+
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.results, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+    rp = result["rp_can"]
+    print(f"Replayed {len(posts)} webhooks ({config['state_backend']} backend) in {result['wall_s']:.2f}s: "
+          f"{result['throughput_msgs_per_s']:.1f} msg/s processed, {result['ingest_msgs_per_s']:.1f} msg/s acknowledged")
+    print(f"Webhook ack:   p50 {result['ack']['p50_ms']:.1f}ms  p95 {result['ack']['p95_ms']:.1f}ms  p99 {result['ack']['p99_ms']:.1f}ms")
+    print(f"Time to RP Can: p50 {rp['p50_ms']:.1f}ms  p95 {rp['p95_ms']:.1f}ms  p99 {rp['p99_ms']:.1f}ms  max {rp['max_ms']:.1f}ms "
+          f"({rp['count']} sent, {missed} missed, {unexpected} unexpected)")
+    print(f"LLM calls:     {result['llm_calls']}")
+    if result["speculation"]:
+        print(f"Speculation:   {result['speculation']}")
+    print(f"File I/O:      {result['file_io']['opens']} opens, /proc/self/io {result['file_io']['proc']}")
+    for stage, snapshot in result["stages"].items():
+        print(f"  {stage:<28} p50 {snapshot['p50_ms']:>8.1f}ms  p95 {snapshot['p95_ms']:>8.1f}ms  p99 {snapshot['p99_ms']:>8.1f}ms  n={snapshot['count']}")
+    print(f"Saved to {args.results} as {commit}{'+' if dirty else ''} / config {config_hash}")
+    if args.compare:
+        print_comparison(args.results, config_hash)
+
+
+if __name__ == "__main__":
+    main()
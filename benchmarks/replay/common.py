@@ -0,0 +1,76 @@
+import asyncio
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and max of values in seconds, in milliseconds (nearest rank)."""
+    if not values:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(values)
+    result = {}
+    for quantile in (50, 95, 99):
+        rank = max(-(-quantile * len(ordered) // 100), 1)
+        result[f"p{quantile}_ms"] = round(ordered[rank - 1] * 1000, 2)
+    result["max_ms"] = round(ordered[-1] * 1000, 2)
+    return result
+
+
+def git_revision() -> Tuple[str, bool]:
+    """Short commit of HEAD and whether tracked files differ from it."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=REPO_ROOT).returncode != 0
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def match_rp_cans(posts: List[Dict[str, Any]], sends: List[Tuple[float, str, str]]) -> Tuple[List[float], int, int]:
+    """
+    Time from each telex expecting "RP Can" to the "RP Can" sent to its chat.
+
+    Replies in a chat are matched to that chat's expecting webhooks in
+    order, each to the oldest one sent before it.
+
+    Returns:
+        Latencies in seconds, the number of telexes that got no "RP Can"
+        and the number of "RP Can"s no telex expected.
+    """
+    expected: Dict[str, List[float]] = {}
+    for post in sorted(posts, key=lambda p: p["sent"]):
+        if post["expect"] == "RP Can" and post["status"] == 200:
+            expected.setdefault(post["chat_id"], []).append(post["sent"])
+    latencies, unexpected = [], 0
+    for sent_at, chat_id, body in sorted(sends):
+        if body != "RP Can":
+            continue
+        pending = expected.get(chat_id, [])
+        if pending and pending[0] <= sent_at:
+            latencies.append(sent_at - pending.pop(0))
+        else:
+            unexpected += 1
+    missed = sum(len(pending) for pending in expected.values())
+    return latencies, missed, unexpected
+
+
+async def wait_for_idle(app_module, timeout: float) -> float:
+    """
+    Wait until the dispatcher and the side-effect queue of main.app have finished everything queued so far.
+
+    Returns:
+        The time.perf_counter() at which the app went idle, or gave up after timeout seconds.
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        dispatched = app_module.dispatcher.stats
+        side_effects = app_module.fast_finger_bot.side_effects.stats
+        if (dispatched["enqueued"] == dispatched["processed"] + dispatched["failed"]
+                and side_effects["submitted"] == side_effects["completed"] + side_effects["failed"] + side_effects["overflow"]):
+            break
+        await asyncio.sleep(0.01)
+    return time.perf_counter()
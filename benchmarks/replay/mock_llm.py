@@ -0,0 +1,133 @@
+import asyncio
+import datetime
+import json
+import math
+import random
+import re
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+class LatencyModel:
+    """
+    Latency drawn from a distribution given as a spec string, in milliseconds.
+
+    fixed:MS, uniform:LO:HI, normal:MEAN:SD or lognormal:MEDIAN:SIGMA. A
+    lognormal with sigma 0.3-0.6 is a fair model of LLM API latency: most
+    calls near the median and a long tail.
+    """
+
+    def __init__(self, spec: str, rng: random.Random):
+        self.spec = spec
+        self.rng = rng
+        kind, *values = spec.split(":")
+        self.kind = kind
+        self.values = [float(v) for v in values]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if expected.get(kind) != len(self.values):
+            raise ValueError(f"Bad latency spec {spec!r}, expected fixed:MS, uniform:LO:HI, normal:MEAN:SD or lognormal:MEDIAN:SIGMA")
+
+    def sample(self) -> float:
+        """One latency, in seconds."""
+        if self.kind == "fixed":
+            ms = self.values[0]
+        elif self.kind == "uniform":
+            ms = self.rng.uniform(*self.values)
+        elif self.kind == "normal":
+            ms = self.rng.gauss(*self.values)
+        else:
+            median, sigma = self.values
+            ms = self.rng.lognormvariate(math.log(median), sigma)
+        return max(ms, 0.0) / 1000
+
+
+def parse_latencies(specs: List[str], default: str, seed: int) -> Dict[Optional[str], LatencyModel]:
+    """
+    Latency models per response format from --llm-latency options.
+
+    A plain spec sets the default; NAME=SPEC applies to calls whose
+    response_format is the pydantic model NAME (e.g. BookingResponse).
+    """
+    rng = random.Random(seed)
+    models: Dict[Optional[str], LatencyModel] = {None: LatencyModel(default, rng)}
+    for spec in specs:
+        name, _, value = spec.rpartition("=")
+        models[name or None] = LatencyModel(value, rng)
+    return models
+
+
+def _fallback(name: Optional[str], user: str) -> Optional[Dict[str, Any]]:
+    """Rule-based answer for a message the corpus has no recorded answer for."""
+    text = user.lower()
+    tomorrow = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    if name == "BasicExtraction":
+        rooms = re.search(r"(\d+)\s+rooms?", text)
+        if "sq" in text and rooms and "take" not in text:
+            return dict(needs_rooms=True, arrival_date=tomorrow, arrival_time="22:25",
+                        departure_date=tomorrow, departure_time="23:55", number_of_rooms=int(rooms.group(1)))
+        return dict(needs_rooms=False, arrival_date="", arrival_time="", departure_date="", departure_time="", number_of_rooms=0)
+    if name == "BookingResponse":
+        rooms = re.search(r"(\d+)\s+rooms?", text)
+        return dict(booking_room="take" in text, number_of_rooms=int(rooms.group(1)) if rooms else 1)
+    if name == "NumberOfRooms":
+        return dict(number_of_rooms=3, date=tomorrow)
+    if name == "ConfirmationResponse":
+        for keyword, response_type in (("report", "report"), ("empty", "rooms_empty_query"), ("override", "override_rooms"),
+                                       ("booked", "rooms_booked_query"), ("help", "help")):
+            if keyword in text:
+                return dict(response_type=response_type)
+        return dict(response_type="others")
+    if name == "DateResponse":
+        return dict(date=tomorrow)
+    if name == "OverrideResponse":
+        return dict(date=tomorrow, number_of_rooms=4, dates=[], ranges=[])
+    return None
+
+
+class MockLLM:
+    """
+    Stand-in for litellm.acompletion that never leaves the machine.
+
+    Answers come from the corpus (keyed by the raw WhatsApp message, which
+    is always the last user message, and the response_format's name) or,
+    failing that, from simple rules. Each call sleeps for a latency drawn
+    from the model for its response_format, and returns token usage
+    estimated at four characters per token, so LLMService's hedging,
+    timeouts and token accounting behave as they would against the API.
+    """
+
+    def __init__(self, answers: Dict[str, Dict[str, Any]], latencies: Dict[Optional[str], LatencyModel]):
+        self.answers = answers
+        self.latencies = latencies
+        self.calls: Dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def acompletion(self, model: str = None, messages: List[Dict[str, str]] = None, response_format=None, **kwargs):
+        name = getattr(response_format, "__name__", None)
+        user = messages[-1]["content"]
+        self.calls[name or "text"] = self.calls.get(name or "text", 0) + 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latencies.get(name, self.latencies[None]).sample())
+        finally:
+            self.in_flight -= 1
+        recorded = self.answers.get(user, {})
+        content = recorded[name] if name in recorded else _fallback(name, user)
+        text = json.dumps(content) if content is not None else "null"
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=len(text) // 4,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=prompt_tokens // 2),
+        )
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=text))], usage=usage)
+
+    def install(self):
+        """Answer every litellm acompletion call, including those already imported by name."""
+        import litellm
+        import Services.llm_service
+
+        litellm.acompletion = self.acompletion
+        Services.llm_service.acompletion = self.acompletion
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+from benchmarks.replay.mock_llm import LatencyModel
+
+
+class MockWhapi:
+    """
+    Local HTTP server standing in for gate.whapi.cloud.
+
+    Answers GET /health and POST /messages/text after a latency drawn from
+    latency, and records every sent message as (time.perf_counter(),
+    chat id, body) so the replay can time each "RP Can" from the webhook
+    that caused it. Point WHAPI_BASE_URL at url.
+    """
+
+    def __init__(self, latency: Optional[LatencyModel] = None):
+        self.latency = latency
+        self.sent: List[Tuple[float, str, str]] = []
+        self.lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def __reply(self, status: int, payload: dict):
+                if mock.latency is not None:
+                    with mock.lock:
+                        delay = mock.latency.sample()
+                    time.sleep(delay)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self.__reply(200, {"status": {"code": 4, "text": "AUTH"}})
+
+            def do_POST(self):
+                data = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                if self.path != "/messages/text":
+                    self.__reply(404, {"error": {"code": 404, "message": "Not found"}})
+                    return
+                # The send is recorded when WHAPI has it, before the response's latency
+                with mock.lock:
+                    mock.sent.append((time.perf_counter(), data.get("to"), data.get("body")))
+                    message_id = f"MOCK{len(mock.sent):06d}"
+                self.__reply(200, {"sent": True, "message": {"id": message_id, "chat_id": data.get("to"), "status": "pending"}})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.__handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-whapi", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def sent_since(self, index: int) -> List[Tuple[float, str, str]]:
+        with self.lock:
+            return self.sent[index:]
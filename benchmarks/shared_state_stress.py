@@ -0,0 +1,115 @@
+"""
+Stress check for the SQLite state backend shared by several worker processes.
+
+Each process opens its own SQLiteStateBackend on one database and fires
+try_reserve/commit/release calls at the same dates, the way uvicorn workers
+would. Fails if any date is overbooked or if a message id is claimed by more
+than one process.
+
+Usage:
+    python -m benchmarks.shared_state_stress [--processes 4] [--operations 500]
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+from utils.config_cache import ConfigCache
+from utils.sqlite_backend import SQLiteStateBackend
+from utils.storage import Storage
+
+START_DATE = datetime.date(2024, 11, 1)
+DAYS = 14
+INITIAL_AVAILABILITY = 300
+MESSAGE_IDS = 200
+
+
+def run_process(db_file: str, operations: int, seed: int):
+    logging.getLogger("utils.sqlite_backend").setLevel(logging.ERROR)
+    logging.getLogger("utils.storage").setLevel(logging.ERROR)
+    storage = Storage(db_file)
+    backend = SQLiteStateBackend(storage, ConfigCache(storage))
+    inventory = backend.inventory
+    rng = random.Random(seed)
+    committed = Counter()
+    bookings = 0
+    for _ in range(operations):
+        arrival = (START_DATE + datetime.timedelta(days=rng.randrange(DAYS - 3))).isoformat()
+        hold = inventory.try_reserve(arrival, rng.randint(1, 3), rng.randint(1, 4), ttl=rng.choice([0.001, 60.0]))
+        if hold is None:
+            continue
+        choice = rng.random()
+        if choice < 0.6:
+            booked_rooms = rng.randint(1, hold.rooms)
+            try:
+                dates = inventory.commit(hold, booked_rooms)
+            except ValueError:
+                # The hold expired before we committed it
+                continue
+            for date in dates:
+                committed[date] += booked_rooms
+            bookings += 1
+        elif choice < 0.9:
+            inventory.release(hold)
+    # Every process sees every redelivered webhook; only one may claim it
+    claimed = [message_id for message_id in map(str, range(MESSAGE_IDS)) if backend.claim_message(message_id)]
+    backend.close()
+    return committed, bookings, claimed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--operations", type=int, default=500, help="operations per process")
+    args = parser.parse_args()
+    logging.getLogger("utils.sqlite_backend").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        room_requirements_file = os.path.join(directory, "room_availability.json")
+        with open(room_requirements_file, 'w') as f:
+            json.dump({
+                (START_DATE + datetime.timedelta(days=i)).isoformat(): {"availability": INITIAL_AVAILABILITY}
+                for i in range(DAYS)
+            }, f)
+        db_file = os.path.join(directory, "state.db")
+        storage = Storage(db_file)
+        storage.import_json(room_requirements_file)
+        SQLiteStateBackend(storage, ConfigCache(storage)).close()
+
+        started = time.perf_counter()
+        with Pool(args.processes) as pool:
+            results = pool.starmap(run_process, [(db_file, args.operations, seed) for seed in range(args.processes)])
+        elapsed = time.perf_counter() - started
+
+        committed = Counter()
+        claimed = Counter()
+        for process_committed, _, process_claimed in results:
+            committed.update(process_committed)
+            claimed.update(process_claimed)
+        bookings = sum(result[1] for result in results)
+
+        storage = Storage(db_file)
+        backend = SQLiteStateBackend(storage, ConfigCache(storage))
+        backend.inventory.expire_holds()
+        for date, data in backend.inventory.snapshot().items():
+            availability = data["availability"]
+            assert availability >= 0, f"{date} went negative: {availability}"
+            assert availability == INITIAL_AVAILABILITY - committed[date], \
+                f"{date} has {availability} rooms left but {committed[date]} of {INITIAL_AVAILABILITY} were committed"
+        backend.close()
+        assert len(claimed) == MESSAGE_IDS and max(claimed.values()) == 1, "a message id was claimed by more than one process"
+
+    total_operations = args.processes * args.operations
+    print(f"{total_operations} reservations from {args.processes} processes in {elapsed:.2f}s "
+          f"({total_operations / elapsed:.0f} ops/s), {bookings} bookings committed, no date overbooked, "
+          f"every message claimed once")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Microbenchmark for parsing a WHAPI group webhook body.
+
+Compares the old approach (json.loads followed by repeated dict lookups on
+body["messages"][0]) with a single Message.from_json call, and reports the
+per-request cost of each.
+
+Usage:
+    python -m benchmarks.webhook_parse [--iterations 20000]
+"""
+import argparse
+import json
+import time
+
+from Message.message import Message, _loads
+
+TEXT_PAYLOAD = {
+    "messages": [{
+        "id": "ABCD-1234",
+        "from_me": False,
+        "type": "text",
+        "chat_id": "120363000000000000@g.us",
+        "timestamp": 1730419200,
+        "source": "mobile",
+        "text": {"body": "PLS PROVIDE 12 ROOMS FOR AI-123 ARR 01NOV 2345 DEP AI-124 02NOV 0130"},
+        "from": "919800000000",
+        "from_name": "Ops Desk",
+    }],
+    "channel_id": "CHANNEL-1",
+}
+
+EDIT_PAYLOAD = {
+    "messages": [{
+        "id": "ABCD-1235",
+        "type": "action",
+        "chat_id": "120363000000000000@g.us",
+        "from": "919800000000",
+        "action": {"target": "ABCD-1234", "type": "edit", "edited_type": "text", "edited_content": {"body": "12 ROOMS"}},
+    }],
+    "channel_id": "CHANNEL-1",
+}
+
+
+def parse_dict(raw: bytes):
+    body = json.loads(raw)
+    if body.get("messages")[0].get("type") == "text":
+        return (
+            body.get("messages")[0].get("text").get("body"),
+            body.get("messages")[0].get("chat_id"),
+            body.get("messages")[0].get("from_name", "no_name"),
+            body.get("messages")[0].get("from"),
+        )
+    if body.get("messages")[0].get("type") == "action" and body.get("messages")[0].get("action").get("type") == "edit":
+        return body.get("messages")[0].get("action").get("edited_content").get("body")
+
+
+def parse_model(raw: bytes):
+    data = Message.from_json(raw).messages[0]
+    if data.type == "text":
+        return data.text.body, data.chat_id, data.from_name, data.from_
+    return data.edited_text
+
+
+def time_per_call(fn, raw: bytes, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(raw)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    decoder = "pydantic model_validate_json" if hasattr(Message, "model_validate_json") else _loads.__module__
+    print(f"decoder: {decoder}")
+    for name, payload in (("text", TEXT_PAYLOAD), ("edit", EDIT_PAYLOAD)):
+        raw = json.dumps(payload).encode()
+        assert parse_dict(raw) == parse_model(raw)
+        dict_us = time_per_call(parse_dict, raw, args.iterations)
+        model_us = time_per_call(parse_model, raw, args.iterations)
+        print(f"{name:>5}: dict lookups {dict_us:.1f}us/request, Message.from_json {model_us:.1f}us/request")
+
+
+if __name__ == "__main__":
+    main()
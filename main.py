@@ -1,6 +1,10 @@
 import json
+import logging
 import os
-from fastapi import FastAPI, Request
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from agents.agent import Agent
 from Message.message import Message
 from agents.customer_service_agent import CustomerServiceBot
@@ -10,12 +14,19 @@ from Services.knowcross_service import KnowcrossService
 from Services.simphony_service import SimphonyService
 from Services.sinix_service import SinixService
 from Services.rag_service import RAGService
+from utils.utils import start_whatsapp_client, close_whatsapp_client, whatsapp_client_stats
+from utils.dispatcher import WebhookDispatcher
+from utils.dedup import RecentMessageIds
+from utils.blocking_io import io_pool, run_blocking, blocking_io_stats
+from utils.loop_monitor import LoopLagMonitor
+from utils.tracing import tracer, traced
+from utils.speculation import speculation_stats
 import httpx
 
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
 agent = Agent()
 customer_service_bot = CustomerServiceBot()
@@ -27,6 +38,83 @@ sinix_service = SinixService()
 rag_service = RAGService()
 
 api_key = os.getenv("WHAPI_API_KEY")
+group_ids = set(os.getenv("WHATSAPP_GROUP_IDS", "").split(","))
+
+# Group messages are processed by these consumers after the webhook is acknowledged
+dispatcher = WebhookDispatcher(
+    consumers=int(os.getenv("WEBHOOK_CONSUMERS", "4")),
+    max_queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000")),
+)
+# WHAPI can redeliver a webhook; each message id is only processed once. With several
+# workers the state backend's claim_message makes that hold across processes
+recent_message_ids = RecentMessageIds(
+    max_ids=int(os.getenv("DEDUP_MAX_IDS", "10000")),
+    window=float(os.getenv("DEDUP_WINDOW_SECONDS", "3600")),
+)
+
+# Logs the stack of any handler that blocks the event loop for longer than this; 0 turns it off
+loop_monitor = LoopLagMonitor(threshold_ms=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    await start_whatsapp_client()
+    await fast_finger_bot.start()
+    dispatcher.start()
+    yield
+    await dispatcher.stop()
+    await fast_finger_bot.close()
+    await close_whatsapp_client()
+    io_pool.shutdown()
+    await loop_monitor.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/stats")
+async def get_stats():
+    return {
+        "webhook_dispatcher": dispatcher.metrics(),
+        "dedup": recent_message_ids.metrics(),
+        "whapi": whatsapp_client_stats(),
+        "llm": fast_finger_bot.llm.stats,
+        "llm_prompt_cache": fast_finger_bot.llm.prompt_cache_stats(),
+        "side_effects": dict(fast_finger_bot.side_effects.stats, depth=fast_finger_bot.side_effects.depth()),
+        "metadata_cache": fast_finger_bot.state.config.stats,
+        "command_router": fast_finger_bot.router_stats,
+        "speculation": speculation_stats(fast_finger_bot.speculation_stats),
+        "blocking_io": blocking_io_stats(),
+        "event_loop": loop_monitor.metrics(),
+        "stage_latency": tracer.metrics(),
+        "llm_response_cache": dict(fast_finger_bot.llm.cache.stats, hit_rate=fast_finger_bot.llm.cache.hit_rate()) if fast_finger_bot.llm.cache else None,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text format: p50/p95/p99 per pipeline stage, stage errors and LLM tokens
+    return PlainTextResponse(tracer.prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces/{message_id}")
+async def get_trace(message_id: str):
+    trace = tracer.get_trace(message_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace for this message")
+    return trace.to_dict()
+
+
+async def claim_message(message_id: str) -> bool:
+    """Claim message_id in the state backend, off the event loop only when that means a database write."""
+    if fast_finger_bot.state.messages_on_disk:
+        return await run_blocking(fast_finger_bot.state.claim_message, message_id)
+    return fast_finger_bot.state.claim_message(message_id)
+
+
+async def release_message(message_id: str):
+    if fast_finger_bot.state.messages_on_disk:
+        await run_blocking(fast_finger_bot.state.release_message, message_id)
+    else:
+        fast_finger_bot.state.release_message(message_id)
+
 
 # Make sure message is not from us
 # Or rather not from_me
@@ -35,31 +123,40 @@ async def post_whatsapp_group_payload(request: Request):
 
     #If it's a reply to yourself, ignore it
     #if it's yourself, ignore it
-    body = await request.json()
-    print("Received webhook payload:", body)
-    from_me = body.get("messages")[0].get("from_me")
-    context = body.get("messages")[0].get("context", None)
-    type = body.get("messages")[0].get("type")
-    from_number = body.get("messages")[0].get("from", None)
-    
-
-    if type == "text":
-        message = body.get("messages")[0].get("text").get("body")
-        # if context:
-        #     quoted_message = context.get("quoted_content").get("body")
-        #     print(f"Quoted message: {context} and hence it's a reply and not responding")
+    received = time.perf_counter()
+    payload = Message.from_json(await request.body())
+    data = payload.messages[0]
+    # Every stage of this message's processing is traced under its WhatsApp message id
+    trace = tracer.start_trace(data.id, started=received)
+    tracer.record("parse", time.perf_counter() - received, trace, received)
+    with tracer.activate(trace), tracer.span("dedup"):
+        duplicate = recent_message_ids.seen(data.id) or not await claim_message(data.id)
+    if duplicate:
+        logger.info("Duplicate delivery of message %s, ignoring", data.id)
+        return {"status": "duplicate"}
+
+    if data.type == "text":
+        message = data.text.body
+        # if data.context:
+        #     quoted_message = data.context.quoted_content.body
+        #     print(f"Quoted message: {data.context} and hence it's a reply and not responding")
         
-        # elif from_me:
-        #     print(f"Message from self: {body.get('messages')[0]} and hence not responding")
+        # elif data.from_me:
+        #     print(f"Message from self: {data} and hence not responding")
 
-        if body.get("messages")[0].get("chat_id") in os.getenv("WHATSAPP_GROUP_IDS").split(","):
+        if data.chat_id in group_ids:
             print("Group message received from our Group")
-            response = await fast_finger_bot.handle_whatsapp_group(body.get('messages')[0].get('chat_id'), message , body.get('messages')[0].get('from_name', 'no_name'), from_number)
+            queued = dispatcher.dispatch(data.chat_id, traced(trace, fast_finger_bot.handle_whatsapp_group), data.chat_id, message, data.from_name, data.from_)
+            if not queued:
+                # Let WHAPI redeliver once the backlog has cleared; the redelivery must not be taken for a duplicate
+                recent_message_ids.forget(data.id)
+                await release_message(data.id)
+                raise HTTPException(status_code=503, detail="Message queue full")
+            return {"status": "queued"}
         else:
             print("Message not from our group, ignoring")
 
-    elif type == "action" and body.get("messages")[0].get("action").get("type") == "edit" and body.get("messages")[0].get("action").get("edited_type") == "text":
-        body = body.get("messages")[0].get("action").get("edited_content").get("body")
+    elif data.edited_text is not None:
         print("Action message received")
         
 
@@ -1,3 +1,7 @@
+import functools
+from enum import Enum
+from typing import Dict, List, Optional
+
 SYSTEM_PROMPT_NEEDS_ROOMS = """
 Following is a message from some airlines. You're a helpful assistant who will identify the user is looking for rooms. 
 
@@ -83,6 +87,8 @@ If user is booking a room, also respond with the number of rooms they are bookin
 1. We will take from RP. All 3 rooms. -> true, 3
 2. We will take from RP. 1 room. -> true, 1
 3. We will take from RP 2 rooms and from PQR 3 rooms. -> true, 2
+4. We will take from PQR. All 3 rooms. -> false, 3
+5. Thanks, noted. -> false, 0
 """
 
 SYSTEM_PROMPT_CONFIRMATION_MENU = """
@@ -170,41 +176,60 @@ SYSTEM_PROMPT_CONFIRMATION_MENU = """
 SYSTEM_PROMPT_OVERRIDE = """You are a helpful assistant that extracts override information from messages.
         
 Extract the following information from the message:
-- The number of rooms to override to
-- The date to override (in YYYY-MM-DD format)
+- The date to override (in YYYY-MM-DD format) and the number of rooms to override to
+- Or, when several dates are overridden, each date with its number of rooms in "dates"
+  and each range of dates set to the same number of rooms in "ranges"
 
-If either piece of information is missing, use null.
+If a piece of information is missing, use null (or an empty list).
 
 Provide your response in the following JSON format:
 {
-    "override_rooms": <number or null>,
-    "override_date": "<YYYY-MM-DD or null>"
+    "date": "<YYYY-MM-DD or null>",
+    "number_of_rooms": <number or null>,
+    "dates": [{"date": "<YYYY-MM-DD>", "number_of_rooms": <number>}],
+    "ranges": [{"start_date": "<YYYY-MM-DD>", "end_date": "<YYYY-MM-DD>", "number_of_rooms": <number>}]
 }
 
 Examples:
 
 1. User: "Override the last booking to 3 rooms"
 Response: {
-    "override_rooms": 3,
-    "override_date": null
+    "date": null,
+    "number_of_rooms": 3,
+    "dates": [],
+    "ranges": []
 }
 
 2. User: "Change the booking for 2024-01-15 to 2 rooms"
 Response: {
-    "override_rooms": 2, 
-    "override_date": "2024-01-15"
+    "date": "2024-01-15",
+    "number_of_rooms": 2,
+    "dates": [],
+    "ranges": []
 }
 
 3. User: "Update January 15th booking to 4 rooms"
 Response: {
-    "override_rooms": 4,
-    "override_date": "2024-01-15"
+    "date": "2024-01-15",
+    "number_of_rooms": 4,
+    "dates": [],
+    "ranges": []
 }
 
-4. User: "Hello, how are you?"
+4. User: "Set the whole week of 15 January to 6 rooms, except the 17th which has 2"
 Response: {
-    "override_rooms": null,
-    "override_date": null
+    "date": null,
+    "number_of_rooms": null,
+    "dates": [{"date": "2024-01-17", "number_of_rooms": 2}],
+    "ranges": [{"start_date": "2024-01-15", "end_date": "2024-01-21", "number_of_rooms": 6}]
+}
+
+5. User: "Hello, how are you?"
+Response: {
+    "date": null,
+    "number_of_rooms": null,
+    "dates": [],
+    "ranges": []
 }
 """
 SYSTEM_PROMPT_GET_DATE = """You are a helpful assistant that extracts date information from messages.
@@ -234,10 +259,7 @@ Response: "2024-01-15"
 Response: "2024-01-15"
 
 Always return just the date string in YYYY-MM-DD format, with no additional text or formatting.
-
-### Today's Date: 
-{}
- """
+"""
 
 SYSTEM_PROMPT_GET_ORIGINATOR = """You are a helpful assistant that extracts phone numbers from messages.
 
@@ -270,3 +292,58 @@ Response: null
 
 Always return either a valid E.164 phone number or null, with no additional text or formatting.
 """
+
+
+class PromptTask(str, Enum):
+    NEEDS_ROOMS = "needs_rooms"
+    NUMBER_OF_ROOMS = "number_of_rooms"
+    BOOKING_ROOMS = "booking_rooms"
+    CONFIRMATION_MENU = "confirmation_menu"
+    OVERRIDE = "override"
+    GET_DATE = "get_date"
+    GET_ORIGINATOR = "get_originator"
+
+
+SYSTEM_PROMPTS = {
+    PromptTask.NEEDS_ROOMS: SYSTEM_PROMPT_NEEDS_ROOMS,
+    PromptTask.NUMBER_OF_ROOMS: SYSTEM_PROMPT_NUMBER_OF_ROOMS,
+    PromptTask.BOOKING_ROOMS: SYSTEM_PROMPT_BOOKING_ROOMS,
+    PromptTask.CONFIRMATION_MENU: SYSTEM_PROMPT_CONFIRMATION_MENU,
+    PromptTask.OVERRIDE: SYSTEM_PROMPT_OVERRIDE,
+    PromptTask.GET_DATE: SYSTEM_PROMPT_GET_DATE,
+    PromptTask.GET_ORIGINATOR: SYSTEM_PROMPT_GET_ORIGINATOR,
+}
+
+# Built once so every call for a task starts with a byte-identical prefix,
+# which lets the provider reuse its prompt cache. Treat these as read-only.
+STATIC_PROMPT_MESSAGES = {
+    task: {"role": "system", "content": prompt} for task, prompt in SYSTEM_PROMPTS.items()
+}
+
+
+@functools.lru_cache(maxsize=8)
+def _date_context_message(today: str) -> Dict[str, str]:
+    return {"role": "system", "content": f"Today's date: {today}"}
+
+
+def build_messages(task: PromptTask, user_message: str, today: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Assemble the chat messages for a task.
+
+    The static system prompt always comes first; dynamic context (today's
+    date) follows it and the user message comes last, so the cached prefix
+    is never invalidated by the date.
+
+    Args:
+        task (PromptTask): Which system prompt to use.
+        user_message (str): The WhatsApp message to classify or extract from.
+        today (str): Today's date in YYYY-MM-DD format, for tasks that resolve relative dates.
+
+    Returns:
+        List[Dict[str, str]]: Messages ready for acompletion.
+    """
+    messages = [STATIC_PROMPT_MESSAGES[task]]
+    if today is not None:
+        messages.append(_date_context_message(today))
+    messages.append({"role": "user", "content": user_message})
+    return messages
@@ -0,0 +1,80 @@
+import datetime
+
+import pytest
+
+from utils.command_router import mentions_date, parse_command_date, route_command
+
+TODAY = datetime.date(2024, 10, 18)
+
+
+# Every example in SYSTEM_PROMPT_CONFIRMATION_MENU; "others" is left to the LLM
+@pytest.mark.parametrize("message, expected", [
+    ("Please shut down the bot", "shut_down_agent"),
+    ("How many rooms have we booked today?", "rooms_booked_query"),
+    ("Override the rooms for 2024-11-08 to 33", "override_rooms"),
+    ("Generate report for today's bookings", "report"),
+    ("Start the booking agent", "start_agent"),
+    ("Hello, how are you?", None),
+    ("How many rooms are empty on 2024-11-08?", "rooms_empty_query"),
+    ("Change the message originator to 24354242224", "change_message_originator"),
+    ("What is the message originator?", "get_originator"),
+    ("message originator", "get_originator"),
+    ("Originator updated from 24354242224 to 24354242225", "change_message_originator"),
+    ("Help", "help"),
+    ("What can I do with this?", "help"),
+])
+def test_menu_prompt_examples(message, expected):
+    assert route_command(message) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "Don't stop the bot",
+    "please do not turn off the agent",
+    "thanks, that report looks good",
+    "Is the bot available?",
+    "How many rooms are booked vs available today?",
+    "the bot should stop replying to SQ",
+])
+def test_negated_or_ambiguous_messages_go_to_the_llm(message):
+    assert route_command(message) is None
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("stop", "shut_down_agent"),
+    ("turn the bot off", "shut_down_agent"),
+    ("resume the bot please", "start_agent"),
+    ("report for 09NOV", "report"),
+    ("Report for 2024-11-01 to 2024-11-30", "report"),
+    ("Override availability:\n09NOV 3 rooms", "override_rooms"),
+    ("rooms empty 09NOV", "rooms_empty_query"),
+    ("rooms booked this month", "rooms_booked_query"),
+])
+def test_short_commands(message, expected):
+    assert route_command(message) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("rooms empty 09NOV", "2024-11-09"),
+    ("rooms empty 15 nov 2025", "2025-11-15"),
+    ("rooms empty on 2024-11-08", "2024-11-08"),
+    ("rooms booked tomorrow", "2024-10-19"),
+    ("rooms booked", "2024-10-18"),
+    ("empty in december", None),
+    ("rooms booked in 2025", None),
+    ("rooms booked for the 15th", None),
+])
+def test_parse_command_date(message, expected):
+    assert parse_command_date(message, TODAY) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("report for 09NOV", True),
+    ("report for today", True),
+    ("Generate report for today's bookings", True),
+    ("report for december", True),
+    ("report for the 15th", True),
+    ("send the report", False),
+    ("daily report please", False),
+])
+def test_mentions_date(message, expected):
+    assert mentions_date(message) == expected
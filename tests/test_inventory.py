@@ -0,0 +1,118 @@
+import datetime
+import json
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.config_cache import ConfigCache
+from utils.inventory import RoomInventory
+from utils.sqlite_backend import SQLiteStateBackend
+from utils.storage import Storage
+
+START_DATE = datetime.date(2024, 11, 1)
+DAYS = 7
+INITIAL_AVAILABILITY = 40
+WORKERS = 8
+OPERATIONS = 200
+
+
+@pytest.fixture
+def room_requirements_file(tmp_path):
+    path = tmp_path / "room_availability.json"
+    path.write_text(json.dumps({
+        (START_DATE + datetime.timedelta(days=i)).isoformat(): {"availability": INITIAL_AVAILABILITY}
+        for i in range(DAYS)
+    }))
+    return str(path)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def inventory(request, room_requirements_file, tmp_path):
+    if request.param == "memory":
+        inventory = RoomInventory(room_requirements_file)
+        yield inventory
+        inventory.close()
+    else:
+        storage = Storage(str(tmp_path / "state.db"))
+        storage.import_json(room_requirements_file)
+        backend = SQLiteStateBackend(storage, ConfigCache(storage))
+        yield backend.inventory
+        backend.close()
+
+
+def run_worker(inventory, seed: int, committed: Counter, committed_lock: threading.Lock):
+    rng = random.Random(seed)
+    for _ in range(OPERATIONS):
+        arrival = (START_DATE + datetime.timedelta(days=rng.randrange(DAYS - 2))).isoformat()
+        rooms = rng.randint(1, 4)
+        hold = inventory.try_reserve(arrival, rng.randint(1, 3), rooms, ttl=rng.choice([0.001, 60.0]))
+        if hold is None:
+            continue
+        choice = rng.random()
+        if choice < 0.6:
+            booked_rooms = rng.randint(1, rooms)
+            try:
+                dates = inventory.commit(hold, booked_rooms)
+            except ValueError:
+                # The hold expired before it was committed
+                continue
+            with committed_lock:
+                for date in dates:
+                    committed[date] += booked_rooms
+        elif choice < 0.9:
+            inventory.release(hold)
+        # else: the hold is abandoned and expires
+
+
+def test_concurrent_reservations_never_overbook(inventory):
+    committed = Counter()
+    committed_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        for future in [executor.submit(run_worker, inventory, seed, committed, committed_lock) for seed in range(WORKERS)]:
+            future.result()
+
+    # Rooms run out, so some reservations must have been refused
+    assert any(committed[date] > INITIAL_AVAILABILITY // 2 for date in committed)
+    time.sleep(0.01)
+    inventory.expire_holds()
+    for date in committed:
+        assert committed[date] <= INITIAL_AVAILABILITY
+        assert inventory.get(date) == INITIAL_AVAILABILITY - committed[date]
+
+
+def test_released_and_expired_holds_give_rooms_back(inventory):
+    date = START_DATE.isoformat()
+    hold = inventory.try_reserve(date, 1, INITIAL_AVAILABILITY)
+    assert hold is not None
+    assert inventory.try_reserve(date, 1, 1) is None
+    inventory.release(hold)
+
+    hold = inventory.try_reserve(date, 1, INITIAL_AVAILABILITY, ttl=0.001)
+    time.sleep(0.01)
+    assert not inventory.is_held(hold)
+    assert inventory.try_reserve(date, 1, INITIAL_AVAILABILITY) is not None
+
+
+def test_snapshot_while_other_threads_add_dates(room_requirements_file):
+    inventory = RoomInventory(room_requirements_file, compact_every=50)
+    # Each date is on a page of its own, so every write adds a page
+    dates = [(START_DATE + datetime.timedelta(days=32 * i)).isoformat() for i in range(1, 401)]
+
+    def add_dates(offset: int):
+        for date in dates[offset::4]:
+            inventory.set_availability(date, 5)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(add_dates, offset) for offset in range(4)]
+        while not all(future.done() for future in futures):
+            inventory.snapshot()
+        for future in futures:
+            future.result()
+
+    assert all(inventory.snapshot()[date]["availability"] == 5 for date in dates)
+    inventory.close()
+    assert RoomInventory(room_requirements_file).snapshot() == inventory.snapshot()
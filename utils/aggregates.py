@@ -0,0 +1,163 @@
+import datetime
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("rooms_booked", "airline_messages", "bids", "bids_won")
+
+
+class PrefixSums:
+    """
+    Fenwick tree over day ordinals, for O(log n) updates and range sums.
+
+    The tree covers a window of ordinals starting at base and is rebuilt
+    with twice the capacity when a date falls outside it.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.base: Optional[int] = None
+        self.capacity = capacity
+        self.tree: List[int] = [0] * (capacity + 1)
+        self.values: Dict[int, int] = {}
+
+    def __grow(self, ordinal: int):
+        ordinals = list(self.values) + [ordinal]
+        low, high = min(ordinals), max(ordinals)
+        while high - low + 1 > self.capacity // 2:
+            self.capacity *= 2
+        # Leave room on both sides so dates around today rarely trigger another rebuild
+        self.base = low - (self.capacity - (high - low + 1)) // 2
+        self.tree = [0] * (self.capacity + 1)
+        for existing, value in self.values.items():
+            self.__add(existing, value)
+
+    def __add(self, ordinal: int, delta: int):
+        index = ordinal - self.base + 1
+        while index <= self.capacity:
+            self.tree[index] += delta
+            index += index & -index
+
+    def __prefix(self, ordinal: int) -> int:
+        """Sum of every value up to and including ordinal."""
+        index = min(ordinal - self.base + 1, self.capacity)
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def add(self, ordinal: int, delta: int):
+        if self.base is None or not self.base <= ordinal < self.base + self.capacity:
+            self.__grow(ordinal)
+        self.values[ordinal] = self.values.get(ordinal, 0) + delta
+        self.__add(ordinal, delta)
+
+    def get(self, ordinal: int) -> int:
+        return self.values.get(ordinal, 0)
+
+    def range_sum(self, first: int, last: int) -> int:
+        """Sum of the values of ordinals first..last, both included."""
+        if self.base is None or last < first:
+            return 0
+        return self.__prefix(last) - self.__prefix(first - 1)
+
+
+class ReportAggregates:
+    """
+    Running totals of the report counters, kept up to date by every report update.
+
+    Each metric is stored per day, per ISO week and per calendar month
+    (O(1) dict increments) and in a PrefixSums tree, so the total over any
+    date range is two prefix lookups instead of a scan of the report.
+
+    Metrics:
+        rooms_booked: Rooms booked, counted on every night of the stay.
+        airline_messages: Room requests received from airlines, by day received.
+        bids: "RP Can" replies sent, by day sent.
+        bids_won: Bookings made against one of our bids, by day booked.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sums = {metric: PrefixSums() for metric in METRICS}
+        self.weeks = {metric: defaultdict(int) for metric in METRICS}
+        self.months = {metric: defaultdict(int) for metric in METRICS}
+
+    @staticmethod
+    def __week(day: datetime.date) -> Tuple[int, int]:
+        year, week, _ = day.isocalendar()
+        return year, week
+
+    def add(self, date: str, **deltas: int):
+        """Add deltas (metric=amount) to date's totals."""
+        day = datetime.date.fromisoformat(date)
+        ordinal = day.toordinal()
+        with self.lock:
+            for metric, delta in deltas.items():
+                if not delta:
+                    continue
+                self.sums[metric].add(ordinal, delta)
+                self.weeks[metric][self.__week(day)] += delta
+                self.months[metric][(day.year, day.month)] += delta
+
+    def load(self, rows: Iterable[Tuple[str, Dict[str, int]]]):
+        """Replace every total with (date, {metric: value}) rows, e.g. read back from storage."""
+        with self.lock:
+            self.sums = {metric: PrefixSums() for metric in METRICS}
+            self.weeks = {metric: defaultdict(int) for metric in METRICS}
+            self.months = {metric: defaultdict(int) for metric in METRICS}
+        count = 0
+        for date, values in rows:
+            self.add(date, **values)
+            count += 1
+        logger.info(f"Loaded report aggregates for {count} dates")
+
+    def day(self, metric: str, date: str) -> int:
+        return self.sums[metric].get(datetime.date.fromisoformat(date).toordinal())
+
+    def week(self, metric: str, date: str) -> int:
+        """Total for the ISO week (Monday to Sunday) containing date."""
+        return self.weeks[metric].get(self.__week(datetime.date.fromisoformat(date)), 0)
+
+    def month(self, metric: str, date: str) -> int:
+        """Total for the calendar month containing date."""
+        day = datetime.date.fromisoformat(date)
+        return self.months[metric].get((day.year, day.month), 0)
+
+    def total(self, metric: str, start: str, end: str) -> int:
+        """Total for start <= date <= end."""
+        with self.lock:
+            return self.sums[metric].range_sum(
+                datetime.date.fromisoformat(start).toordinal(),
+                datetime.date.fromisoformat(end).toordinal(),
+            )
+
+    def summary(self, start: str, end: str, availability: Optional[Callable[[str], Optional[int]]] = None) -> Dict[str, float]:
+        """
+        Totals of every metric for start <= date <= end, with derived rates.
+
+        Args:
+            availability: Returns the rooms still available on a date. When given,
+                occupancy is rooms booked / (rooms booked + rooms available) over
+                the dates that have availability.
+
+        Returns:
+            Dict[str, float]: The metric totals plus bid_win_rate and, with availability, occupancy.
+        """
+        result = {metric: self.total(metric, start, end) for metric in METRICS}
+        result["bid_win_rate"] = result["bids_won"] / result["bids"] if result["bids"] else 0.0
+        if availability is not None:
+            booked = available = 0
+            first = datetime.date.fromisoformat(start)
+            for offset in range((datetime.date.fromisoformat(end) - first).days + 1):
+                date = (first + datetime.timedelta(days=offset)).isoformat()
+                rooms_available = availability(date)
+                if rooms_available is None:
+                    continue
+                booked += self.day("rooms_booked", date)
+                available += rooms_available
+            result["occupancy"] = booked / (booked + available) if booked + available else 0.0
+        return result
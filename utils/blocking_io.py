@@ -0,0 +1,81 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BlockingIOPool:
+    """
+    Dedicated threads for disk and SQLite work called from async handlers.
+
+    Inventory writes, report counters, session saves and database queries
+    block until the disk answers; run() moves them off the event loop so
+    other webhooks keep being served meanwhile. The pool is separate from
+    the loop's default executor, so a burst of disk work cannot starve
+    anything else that uses run_in_executor. Threads are started on first
+    use, so the pool can be used again after shutdown().
+    """
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "failed": 0, "in_flight": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    def __call(self, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            with self.lock:
+                self.stats["failed"] += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.stats["calls"] += 1
+                self.stats["in_flight"] -= 1
+                self.stats["total_ms"] += elapsed_ms
+                self.stats["max_ms"] = max(self.stats["max_ms"], elapsed_ms)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool and return its result."""
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="blocking-io")
+            self.stats["in_flight"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self.__call, fn, args, kwargs))
+
+    def metrics(self) -> Dict[str, float]:
+        with self.lock:
+            stats = dict(self.stats)
+        stats["workers"] = self.workers
+        stats["mean_ms"] = stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
+    def shutdown(self):
+        """Wait for running calls to finish and stop the threads."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        logger.info(f"Blocking I/O pool stopped: {self.metrics()}")
+
+
+io_pool = BlockingIOPool(workers=int(os.getenv("BLOCKING_IO_THREADS", "4")))
+
+
+async def run_blocking(fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call on the shared blocking I/O pool."""
+    return await io_pool.run(fn, *args, **kwargs)
+
+
+def blocking_io_stats() -> Dict[str, float]:
+    return io_pool.metrics()
@@ -0,0 +1,235 @@
+import datetime
+import re
+from typing import Dict, List, Optional, Tuple
+
+from utils.telex_parser import MONTHS, resolve_date
+
+# Bot replies with fixed text
+ECHO_MESSAGES = frozenset({
+    "Successfully shut down agent",
+    "Successfully started agent",
+    "No report data available",
+    "Error generating report",
+    "Error during override processing",
+    "Error updating originator",
+    "Error retrieving originator",
+    "Error retrieving help menu",
+})
+
+# Starts of the bot's templated replies, for echoes of messages sent by another worker or before a restart
+ECHO_PREFIX_RE = re.compile(
+    r"^(?:📊 \*Daily Booking Report\*"
+    r"|Successfully overridden room availability"
+    r"|We've \d+ rooms empty for the date"
+    r"|We've \d+ rooms empty across \d+ dates"
+    r"|We've booked \d+ rooms (?:for|from)"
+    r"|current message originator for the system is"
+    r"|Originator updated from"
+    r"|SQ booking \d+ rooms from"
+    r"|.*you can try following messages to command the bot)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Pieces of the short imperative commands below: "please stop the bot now!", "send the report for 2024-11-01"
+_POLITE = r"\s*(?:(?:please|pls|kindly)\s+)?"
+_AGENT = r"(?:\s+(?:the\s+)?(?:booking\s+)?(?:bot|agent))?"
+_END = r"(?:\s+(?:now|please|pls))*\s*[.!]*\s*$"
+# "Don't stop the bot" must not stop it; any negated command goes to the LLM
+NEGATION_RE = re.compile(r"\b(?:not|no|never|cannot|dont|\w+n['’]t)\b", re.IGNORECASE)
+
+# Whole-message commands; the first that matches decides
+COMMAND_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ("help", re.compile(r"^\s*(?:help|menu|commands?|\?)\s*[.!?]*\s*$", re.IGNORECASE)),
+    ("override_rooms", re.compile(rf"^{_POLITE}override\b", re.IGNORECASE)),
+    ("report", re.compile(
+        rf"^{_POLITE}(?:(?:send|show|give|get|generate|share)\s+(?:me\s+|us\s+)?)?(?:(?:the|a|today['’]?s|daily|booking)\s+)*"
+        rf"report(?:\s+(?:for|from|on|between)\s+[\w\s:'’-]+?)?{_END}",
+        re.IGNORECASE,
+    )),
+    ("shut_down_agent", re.compile(
+        rf"^{_POLITE}(?:(?:shut\s*down|turn\s+off|switch\s+off|stop|disable|pause){_AGENT}"
+        rf"|(?:shut|turn|switch)\s+(?:the\s+)?(?:booking\s+)?(?:bot|agent)\s+(?:down|off)){_END}",
+        re.IGNORECASE,
+    )),
+    ("start_agent", re.compile(
+        rf"^{_POLITE}(?:(?:start|restart|turn\s+on|switch\s+on|enable|resume){_AGENT}"
+        rf"|(?:turn|switch)\s+(?:the\s+)?(?:booking\s+)?(?:bot|agent)\s+on){_END}",
+        re.IGNORECASE,
+    )),
+]
+
+# Keywords of each intent, for messages that are not one of the commands above. A message
+# is only routed locally when the keywords of exactly one intent match. None marks words,
+# like "bot", that belong to no query but mean the message is about something else
+KEYWORD_PATTERNS: List[Tuple[Optional[str], re.Pattern]] = [
+    ("help", re.compile(r"\bwhat (?:can i|commands)\b|\bhow do i use\b", re.IGNORECASE)),
+    ("change_message_originator", re.compile(r"\b(?:change|set|update|switch|replace)\b.*\boriginator\b|\boriginator\b.*\bto\s+\+?\d{6,}", re.IGNORECASE)),
+    ("get_originator", re.compile(r"^(?!.*\b(?:change|set|update|updated|switch|replace)\b)(?!.*\bto\s+\+?\d{6,}).*\boriginator\b", re.IGNORECASE | re.DOTALL)),
+    ("override_rooms", re.compile(r"\boverride\b|\bset\b.*\brooms?\b.*\bto\s+\d+\b", re.IGNORECASE)),
+    ("rooms_empty_query", re.compile(r"\b(?:empty|available|availability|free|vacant|left)\b", re.IGNORECASE)),
+    ("rooms_booked_query", re.compile(r"\bbooked\b|\bbookings?\b|\bsold\b", re.IGNORECASE)),
+    (None, re.compile(r"\b(?:bot|agent|report)\b", re.IGNORECASE)),
+]
+
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+# DDMMM with an optional year: 09NOV, 9th November, 15 Nov 2025
+DAY_MONTH_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s*(JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)[A-Z]*\b(?:,?\s*(20\d{2})\b)?", re.IGNORECASE)
+# A month or year on its own, e.g. "empty in december", which names no single day
+MONTH_OR_YEAR_RE = re.compile(
+    r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec|january|february|march|april|june|july|august"
+    r"|september|october|november|december)\b|\b20\d{2}\b",
+    re.IGNORECASE,
+)
+ANY_DATE_RE = re.compile(f"{ISO_DATE_RE.pattern}|{DAY_MONTH_RE.pattern}", re.IGNORECASE)
+# Bulk overrides are written one date range or date per line, or separated by ; or ,
+OVERRIDE_SEGMENT_RE = re.compile(r"[\n;,]")
+ROOMS_RE = re.compile(r"\b\d+\b")
+# Words that make a part with a single readable date a range whose other end was not read
+RANGE_WORD_RE = re.compile(r"\b(?:from|until|till|through|thru|between)\b", re.IGNORECASE)
+# Longest date range one override or query may expand to
+MAX_RANGE_DAYS = 731
+RELATIVE_DAYS = (("day after tomorrow", 2), ("tomorrow", 1), ("yesterday", -1), ("today", 0), ("tonight", 0))
+# Date forms the local parser does not read, e.g. 9/11, "next friday" or "the 15th"; these go to the LLM
+OTHER_DATE_RE = re.compile(
+    r"\d{1,2}[/.]\d{1,2}|\b(?:next|last|on|this)\s+(?:mon|tue|wed|thu|fri|sat|sun)"
+    r"|\b\d{1,2}(?:st|nd|rd|th)\b|\b(?:on|for|the|of)\s+\d{1,2}\b(?!\s*(?:rooms?|rms?|nights?|days?)\b)",
+    re.IGNORECASE,
+)
+
+
+def is_echo(message: str) -> bool:
+    """True if message is one of the bot's own confirmation-chat replies."""
+    return message in ECHO_MESSAGES or ECHO_PREFIX_RE.match(message) is not None
+
+
+def route_command(message: str) -> Optional[str]:
+    """
+    Classify a confirmation-chat command without the LLM.
+
+    Returns:
+        Optional[str]: The ResponseType value of the matching command, or of
+        the one intent whose keywords the message contains. None if the
+        message is negated, matches no intent or the keywords of several,
+        and the LLM should decide.
+    """
+    if NEGATION_RE.search(message):
+        return None
+    for response_type, pattern in COMMAND_PATTERNS:
+        if pattern.search(message):
+            return response_type
+    intents = {response_type for response_type, pattern in KEYWORD_PATTERNS if pattern.search(message)}
+    if len(intents) == 1:
+        return intents.pop()
+    return None
+
+
+def day_month_date(day: str, month_name: str, year: Optional[str], today: datetime.date) -> Optional[datetime.date]:
+    """A DDMMM date in the given year, or without one the occurrence closest to today."""
+    if not year:
+        return resolve_date(day, month_name[:3], today)
+    try:
+        return datetime.date(int(year), MONTHS[month_name[:3].upper()], int(day))
+    except ValueError:
+        return None
+
+
+def find_command_dates(message: str, today: datetime.date) -> List[str]:
+    """Every YYYY-MM-DD and DDMMM date in message that can be read, in order of appearance, as YYYY-MM-DD."""
+    dates = []
+    for match in ANY_DATE_RE.finditer(message):
+        year, month, day, day_of_month, month_name, month_year = match.groups()
+        if year:
+            try:
+                dates.append(datetime.date(int(year), int(month), int(day)).isoformat())
+            except ValueError:
+                continue
+        else:
+            date = day_month_date(day_of_month, month_name, month_year, today)
+            if date:
+                dates.append(date.isoformat())
+    return dates
+
+
+def mentions_date(message: str) -> bool:
+    """True if message names a day, month or year, or a day relative to today, readable locally or not."""
+    if ANY_DATE_RE.search(message) or OTHER_DATE_RE.search(message) or MONTH_OR_YEAR_RE.search(message):
+        return True
+    text = message.lower()
+    return any(phrase in text for phrase, _ in RELATIVE_DAYS)
+
+
+def date_range(start: str, end: str) -> List[str]:
+    """Every date from start to end, both included, whichever order they are given in."""
+    first, last = sorted((datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)))
+    return [(first + datetime.timedelta(days=offset)).isoformat() for offset in range((last - first).days + 1)]
+
+
+def parse_override(message: str, today: datetime.date) -> Optional[Dict[str, int]]:
+    """
+    Read an availability override without the LLM.
+
+    Each line (or ;/, separated part) holds one date or a start and end
+    date, plus the number of rooms, e.g. "override 2024-11-01 to 2024-11-30
+    to 5 rooms" or "09NOV 3 rooms, 10NOV 4 rooms". A later part overrides
+    an earlier one for the same date.
+
+    Returns:
+        Optional[Dict[str, int]]: Rooms per YYYY-MM-DD date, or None if any
+        part lacks a date or a single room count, or has date words left over
+        that were not read, so the LLM should decide.
+    """
+    entries: Dict[str, int] = {}
+    for segment in OVERRIDE_SEGMENT_RE.split(message):
+        if not segment.strip():
+            continue
+        dates = find_command_dates(segment, today)
+        rest = ANY_DATE_RE.sub(" ", segment)
+        rooms = ROOMS_RE.findall(rest)
+        if not dates and not rooms:
+            # A header line such as "Override availability:"
+            continue
+        if len(dates) not in (1, 2) or len(rooms) != 1:
+            return None
+        # Left-over day, ordinal or range words, as in "1st to 5th Nov", mean a date was not read
+        if OTHER_DATE_RE.search(rest) or (len(dates) == 1 and RANGE_WORD_RE.search(rest)):
+            return None
+        days = date_range(dates[0], dates[-1])
+        if len(days) > MAX_RANGE_DAYS:
+            return None
+        for date in days:
+            entries[date] = int(rooms[0])
+    return entries or None
+
+
+def parse_command_date(message: str, today: datetime.date) -> Optional[str]:
+    """
+    Find the date a command refers to.
+
+    Understands YYYY-MM-DD, DDMMM (09NOV, 9 Nov, 9th November, 15 Nov 2025;
+    without a year, the one closest to today) and today / tonight / tomorrow
+    / yesterday / day after tomorrow. A message without any date means
+    today; one with a day number, month or year this parser cannot place,
+    e.g. "the 15th" or "in december", does not.
+
+    Returns:
+        Optional[str]: The date in YYYY-MM-DD format, or None if the message
+        mentions a date this parser cannot read.
+    """
+    match = ISO_DATE_RE.search(message)
+    if match:
+        try:
+            return datetime.date(*map(int, match.groups())).isoformat()
+        except ValueError:
+            return None
+    match = DAY_MONTH_RE.search(message)
+    if match:
+        date = day_month_date(*match.groups(), today)
+        return date.isoformat() if date else None
+    text = message.lower()
+    # A day the parser cannot place must not be answered for today
+    if OTHER_DATE_RE.search(text) or MONTH_OR_YEAR_RE.search(text):
+        return None
+    for phrase, offset in RELATIVE_DAYS:
+        if phrase in text:
+            return (today + datetime.timedelta(days=offset)).isoformat()
+    return today.isoformat()
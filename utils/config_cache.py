@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from utils.blocking_io import run_blocking
+from utils.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+FILE_STAMP_KEY = "_metadata_file_stamp"
+
+
+class ConfigCache:
+    """
+    Metadata (message originator, help menu, ...) answered from memory.
+
+    Values are loaded from the Storage config table once and, after
+    start(), reloaded every poll_interval seconds by a background task on
+    the blocking I/O pool, which also picks up writes made by other
+    workers; get() only ever reads memory. When DATA_METADATA_FILE changes
+    on disk (mtime or size), the file is imported into the database on the
+    next poll, so an admin edit takes effect within poll_interval seconds.
+    set() writes through to the database and the file and is visible
+    immediately.
+    """
+
+    def __init__(self, storage: Storage, metadata_file: Optional[str] = None, poll_interval: float = 5.0):
+        self.storage = storage
+        self.metadata_file = metadata_file
+        self.poll_interval = poll_interval
+        self.values: Dict[str, Any] = {}
+        self.checked_at = 0.0
+        self.stats = {"reloads": 0, "file_imports": 0, "errors": 0}
+        # Bumped by set(), so a reload that read the database before the write does not undo it
+        self.writes = 0
+        self.poll_task: Optional[asyncio.Task] = None
+        self.reload()
+
+    def __file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.metadata_file)
+        except (FileNotFoundError, TypeError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def __import_file(self, stamp: Tuple[int, int]):
+        try:
+            with open(self.metadata_file, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            # Probably caught mid-edit; the stamp is not recorded, so the next poll retries
+            logger.warning(f"Could not read {self.metadata_file}: {e}")
+            return
+        with self.storage.transaction():
+            for key, value in metadata.items():
+                self.storage.set_config(key, value)
+            self.storage.set_config(FILE_STAMP_KEY, list(stamp))
+        self.stats["file_imports"] += 1
+        logger.info(f"Imported changed metadata file {self.metadata_file}")
+
+    def reload(self):
+        """Import the metadata file if it changed, then reload every value from the database."""
+        self.checked_at = time.monotonic()
+        writes = self.writes
+        stamp = self.__file_stamp()
+        if stamp is not None and list(stamp) != self.storage.get_config(FILE_STAMP_KEY):
+            self.__import_file(stamp)
+        values = self.storage.load_config()
+        if writes == self.writes:
+            self.values = values
+        self.stats["reloads"] += 1
+
+    async def __poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await run_blocking(self.reload)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Reloading metadata failed: {e}")
+
+    async def start(self):
+        """Start reloading every poll_interval seconds; called on application startup."""
+        if self.poll_interval > 0 and self.poll_task is None:
+            self.poll_task = asyncio.create_task(self.__poll())
+
+    async def stop(self):
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            try:
+                await self.poll_task
+            except asyncio.CancelledError:
+                pass
+            self.poll_task = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    def set(self, key: str, value: Any):
+        """Store value in the database and the metadata file."""
+        with self.storage.transaction():
+            self.storage.set_config(key, value)
+            if self.metadata_file:
+                self.__write_file(key, value)
+                self.storage.set_config(FILE_STAMP_KEY, list(self.__file_stamp()))
+        self.writes += 1
+        self.values[key] = value
+
+    def __write_file(self, key: str, value: Any):
+        try:
+            with open(self.metadata_file, 'r') as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            metadata = {}
+        metadata[key] = value
+        temp_file = self.metadata_file + ".tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(metadata, f, indent=4)
+        os.replace(temp_file, self.metadata_file)
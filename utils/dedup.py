@@ -0,0 +1,52 @@
+import logging
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RecentMessageIds:
+    """
+    Bounded index of recently seen WhatsApp message ids.
+
+    Ids are kept in a ring buffer (oldest first) mirrored by a set for O(1)
+    lookups. An id is forgotten once it is older than window seconds or when
+    more than max_ids newer ids have been seen.
+    """
+
+    def __init__(self, max_ids: int = 10000, window: float = 3600.0):
+        self.max_ids = max_ids
+        self.window = window
+        self.order = deque()
+        self.ids = set()
+        self.stats = {"checked": 0, "duplicates": 0}
+
+    def __evict(self, now: float):
+        while self.order and (len(self.order) > self.max_ids or now - self.order[0][0] > self.window):
+            _, message_id = self.order.popleft()
+            self.ids.discard(message_id)
+
+    def seen(self, message_id: Optional[str]) -> bool:
+        """Record message_id and return True if it was already seen within the window."""
+        if not message_id:
+            return False
+        now = time.monotonic()
+        self.__evict(now)
+        self.stats["checked"] += 1
+        if message_id in self.ids:
+            self.stats["duplicates"] += 1
+            return True
+        self.ids.add(message_id)
+        self.order.append((now, message_id))
+        return False
+
+    def forget(self, message_id: Optional[str]):
+        """Drop message_id so a redelivery of it is processed, e.g. when it could not be queued."""
+        if message_id in self.ids:
+            self.ids.discard(message_id)
+            self.order = deque(entry for entry in self.order if entry[1] != message_id)
+
+    def metrics(self) -> dict:
+        checked = self.stats["checked"]
+        return dict(self.stats, tracked=len(self.ids), hit_rate=self.stats["duplicates"] / checked if checked else 0.0)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+import zlib
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookDispatcher:
+    """
+    Hands webhook work to a pool of async consumers so the endpoint can
+    acknowledge immediately.
+
+    Each consumer owns one queue and every chat_id is always routed to the
+    same consumer, so messages of one chat are processed in arrival order
+    while different chats are processed in parallel.
+    """
+
+    def __init__(self, consumers: int = 4, max_queue_size: int = 1000):
+        self.consumer_count = consumers
+        self.max_queue_size = max_queue_size
+        self.queues: List[asyncio.Queue] = []
+        self.consumers: List[asyncio.Task] = []
+        self.stats = {"enqueued": 0, "processed": 0, "failed": 0, "rejected": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+
+    def start(self):
+        if self.consumers:
+            return
+        self.queues = [asyncio.Queue(maxsize=self.max_queue_size) for _ in range(self.consumer_count)]
+        self.consumers = [asyncio.create_task(self.__consume(i)) for i in range(self.consumer_count)]
+        logger.info(f"Started {self.consumer_count} webhook consumers")
+
+    def dispatch(self, chat_id: str, handler: Callable[..., Awaitable], *args) -> bool:
+        """
+        Queue handler(*args) behind earlier work for the same chat_id.
+
+        Returns:
+            bool: False if the chat's queue is full and the work was not queued.
+        """
+        self.start()
+        queue = self.queues[zlib.crc32(chat_id.encode()) % self.consumer_count]
+        try:
+            queue.put_nowait((handler, args, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            logger.warning(f"Webhook queue full, rejecting message for chat_id={chat_id}")
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    async def __consume(self, consumer: int):
+        queue = self.queues[consumer]
+        while True:
+            handler, args, enqueued_at = await queue.get()
+            wait_ms = (time.perf_counter() - enqueued_at) * 1000
+            self.stats["total_wait_ms"] += wait_ms
+            self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait_ms)
+            try:
+                await handler(*args)
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Webhook consumer {consumer} failed to process message: {e}")
+            finally:
+                queue.task_done()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def metrics(self) -> dict:
+        started = self.stats["processed"] + self.stats["failed"]
+        return dict(
+            self.stats,
+            depth=self.depth(),
+            depth_per_consumer=[queue.qsize() for queue in self.queues],
+            avg_wait_ms=self.stats["total_wait_ms"] / started if started else 0.0,
+        )
+
+    async def stop(self, timeout: Optional[float] = 30.0):
+        """Finish queued messages, then stop the consumers."""
+        if not self.consumers:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Webhook queues not drained after {timeout}s, {self.depth()} messages dropped")
+        for consumer in self.consumers:
+            consumer.cancel()
+        await asyncio.gather(*self.consumers, return_exceptions=True)
+        self.consumers = []
+        logger.info(f"Webhook dispatcher stopped: {self.metrics()}")
@@ -0,0 +1,391 @@
+import datetime
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AVAILABILITY = 10
+# An airline picks a hotel within a few minutes of its request
+DEFAULT_HOLD_TTL = 300.0
+PAGE_BITS = 5
+PAGE_SIZE = 1 << PAGE_BITS
+
+
+@dataclass
+class Hold:
+    hold_id: str
+    ordinals: List[int]
+    rooms: int
+    expires_at: float
+
+    @property
+    def dates(self) -> List[str]:
+        return [datetime.date.fromordinal(ordinal).isoformat() for ordinal in self.ordinals]
+
+
+class RoomInventory:
+    """
+    In-memory room availability, loaded once from ROOM_REQUIREMENTS_FILE or a Storage.
+
+    Availability is kept in fixed-size pages of date ordinals, so a
+    multi-night check is O(nights) with no disk I/O and a date's slot never
+    moves once created.
+
+    Rooms are taken in two steps: try_reserve() puts them on hold, commit()
+    makes the booking permanent and release() (or TTL expiry) gives them
+    back. Each date has its own lock; locks are always taken in date order,
+    so concurrent reservations on overlapping stays cannot overbook or
+    deadlock.
+
+    With a Storage, availability is loaded from the database and each
+    committed change is written to it as it happens. Without one, committed
+    changes are appended to a journal file next to the availability file
+    and folded back into it by compact(), which runs at load and on close().
+    Holds are never persisted.
+    """
+
+    def __init__(self, room_requirements_file: Optional[str] = None, default_availability: int = DEFAULT_AVAILABILITY, compact_every: int = 500, storage: Optional[Storage] = None):
+        self.room_requirements_file = room_requirements_file
+        self.journal_file = room_requirements_file + ".journal" if room_requirements_file else None
+        self.storage = storage
+        self.default_availability = default_availability
+        self.compact_every = compact_every
+        # page number -> [availability, price_per_night, rooms on hold] lists of PAGE_SIZE
+        self.availability_pages: Dict[int, List[Optional[int]]] = {}
+        self.price_pages: Dict[int, List[Optional[float]]] = {}
+        self.held_pages: Dict[int, List[int]] = {}
+        self.date_locks: Dict[int, threading.Lock] = {}
+        # Guards adding pages, so snapshot() can copy the page tables while other threads add dates
+        self.pages_lock = threading.Lock()
+        self.holds: Dict[str, Hold] = {}
+        self.hold_expiry: List[Tuple[float, str]] = []
+        self.holds_lock = threading.Lock()
+        self.journal_lock = threading.Lock()
+        self.journal_entries = 0
+        self.__load()
+
+    def __load(self):
+        if self.storage is not None:
+            logger.info(f"Loading room inventory from {self.storage.db_file}")
+            available_rooms = self.storage.load_availability()
+        else:
+            logger.info(f"Loading room inventory from {self.room_requirements_file}")
+            try:
+                with open(self.room_requirements_file, 'r') as f:
+                    available_rooms = json.load(f)
+            except FileNotFoundError:
+                logger.error(f"Room requirements file not found: {self.room_requirements_file}")
+                raise
+            except json.JSONDecodeError as e:
+                logger.error(f"Error decoding JSON from room requirements file: {e}")
+                raise
+
+        for date, data in available_rooms.items():
+            ordinal = self.__ordinal(date)
+            self.__set(ordinal, data.get("availability"))
+            page, slot = self.__page(self.price_pages, ordinal, None)
+            page[slot] = data.get("price_per_night")
+
+        if self.storage is None and os.path.exists(self.journal_file):
+            replayed = 0
+            with open(self.journal_file, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave a torn last line; everything before it is intact
+                        logger.warning(f"Skipping unreadable journal line in {self.journal_file}")
+                        continue
+                    self.__set(self.__ordinal(entry["date"]), entry["availability"])
+                    replayed += 1
+            logger.info(f"Replayed {replayed} journal entries")
+            self.compact()
+
+    @staticmethod
+    def __ordinal(date: str) -> int:
+        return datetime.date.fromisoformat(date).toordinal()
+
+    def __page(self, pages: Dict[int, list], ordinal: int, fill) -> Tuple[list, int]:
+        """Return the page holding ordinal and its slot, creating the page if needed."""
+        page = pages.get(ordinal >> PAGE_BITS)
+        if page is None:
+            # Two threads creating the same page agree on one list
+            with self.pages_lock:
+                page = pages.setdefault(ordinal >> PAGE_BITS, [fill] * PAGE_SIZE)
+        return page, ordinal & (PAGE_SIZE - 1)
+
+    def __lock(self, ordinal: int) -> threading.Lock:
+        lock = self.date_locks.get(ordinal)
+        if lock is None:
+            lock = self.date_locks.setdefault(ordinal, threading.Lock())
+        return lock
+
+    def __get(self, ordinal: int) -> Optional[int]:
+        page = self.availability_pages.get(ordinal >> PAGE_BITS)
+        return None if page is None else page[ordinal & (PAGE_SIZE - 1)]
+
+    def __set(self, ordinal: int, availability: Optional[int]):
+        page, slot = self.__page(self.availability_pages, ordinal, None)
+        page[slot] = availability
+
+    def __materialize(self, ordinal: int) -> int:
+        """Availability for ordinal, adding the default for dates never set. Caller holds the date lock."""
+        page, slot = self.__page(self.availability_pages, ordinal, None)
+        if page[slot] is None:
+            page[slot] = self.default_availability
+            logger.info("Added missing date %s with %s rooms", datetime.date.fromordinal(ordinal).isoformat(), self.default_availability)
+        return page[slot]
+
+    def __free(self, ordinal: int) -> int:
+        """Rooms that are neither booked nor on hold. Caller holds the date lock."""
+        held, slot = self.__page(self.held_pages, ordinal, 0)
+        return self.__materialize(ordinal) - held[slot]
+
+    @staticmethod
+    def __stay_ordinals(arrival_date: str, booking_days: int) -> List[int]:
+        first = datetime.date.fromisoformat(arrival_date).toordinal()
+        return list(range(first, first + booking_days))
+
+    def __acquire(self, ordinals: List[int]) -> List[threading.Lock]:
+        locks = [self.__lock(ordinal) for ordinal in sorted(ordinals)]
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    @staticmethod
+    def __release_locks(locks: List[threading.Lock]):
+        for lock in reversed(locks):
+            lock.release()
+
+    def get(self, date: str) -> Optional[int]:
+        """Committed availability for date, or None if the date has never been set."""
+        return self.__get(self.__ordinal(date))
+
+    def get_price(self, date: str) -> Optional[float]:
+        ordinal = self.__ordinal(date)
+        page = self.price_pages.get(ordinal >> PAGE_BITS)
+        return None if page is None else page[ordinal & (PAGE_SIZE - 1)]
+
+    def is_available(self, arrival_date: str, booking_days: int, rooms: int) -> bool:
+        """Check whether rooms are free (not booked and not on hold) on every night of the stay."""
+        self.expire_holds()
+        ordinals = self.__stay_ordinals(arrival_date, booking_days)
+        locks = self.__acquire(ordinals)
+        try:
+            for ordinal in ordinals:
+                if self.__free(ordinal) < rooms:
+                    logger.warning("Insufficient rooms on %s", datetime.date.fromordinal(ordinal).isoformat())
+                    return False
+            return True
+        finally:
+            self.__release_locks(locks)
+
+    def try_reserve(self, arrival_date: str, booking_days: int, rooms: int, ttl: float = DEFAULT_HOLD_TTL) -> Optional[Hold]:
+        """
+        Atomically put rooms on hold for every night of the stay.
+
+        Args:
+            arrival_date (str): First night in YYYY-MM-DD format.
+            booking_days (int): Number of nights.
+            rooms (int): Rooms needed each night.
+            ttl (float): Seconds after which an uncommitted hold is released.
+
+        Returns:
+            Optional[Hold]: The hold, or None if any night does not have enough free rooms.
+        """
+        self.expire_holds()
+        ordinals = self.__stay_ordinals(arrival_date, booking_days)
+        locks = self.__acquire(ordinals)
+        try:
+            for ordinal in ordinals:
+                if self.__free(ordinal) < rooms:
+                    logger.warning("Insufficient rooms on %s", datetime.date.fromordinal(ordinal).isoformat())
+                    return None
+            for ordinal in ordinals:
+                held, slot = self.__page(self.held_pages, ordinal, 0)
+                held[slot] += rooms
+        finally:
+            self.__release_locks(locks)
+
+        hold = Hold(hold_id=uuid.uuid4().hex, ordinals=ordinals, rooms=rooms, expires_at=time.monotonic() + ttl)
+        with self.holds_lock:
+            self.holds[hold.hold_id] = hold
+            heapq.heappush(self.hold_expiry, (hold.expires_at, hold.hold_id))
+        logger.info("Holding %s rooms on %s as %s", rooms, hold.dates, hold.hold_id)
+        return hold
+
+    def __pop_hold(self, hold: Hold) -> bool:
+        with self.holds_lock:
+            return self.holds.pop(hold.hold_id, None) is not None
+
+    def __unhold(self, ordinals: List[int], rooms: int):
+        locks = self.__acquire(ordinals)
+        try:
+            for ordinal in ordinals:
+                held, slot = self.__page(self.held_pages, ordinal, 0)
+                held[slot] -= rooms
+        finally:
+            self.__release_locks(locks)
+
+    def is_held(self, hold: Optional[Hold]) -> bool:
+        self.expire_holds()
+        return hold is not None and hold.hold_id in self.holds
+
+    def commit(self, hold: Hold, rooms: Optional[int] = None) -> List[str]:
+        """
+        Turn a hold into a booking.
+
+        Args:
+            hold (Hold): Hold returned by try_reserve().
+            rooms (int): Rooms to book, at most hold.rooms; the rest is released. Defaults to hold.rooms.
+
+        Returns:
+            List[str]: The booked dates in YYYY-MM-DD format.
+
+        Raises:
+            ValueError: If the hold was already committed, released or has expired.
+        """
+        rooms = hold.rooms if rooms is None else rooms
+        if rooms > hold.rooms:
+            raise ValueError(f"Cannot commit {rooms} rooms on a hold of {hold.rooms}")
+        if not self.__pop_hold(hold):
+            raise ValueError(f"Hold {hold.hold_id} is no longer active")
+
+        locks = self.__acquire(hold.ordinals)
+        try:
+            for ordinal in hold.ordinals:
+                held, slot = self.__page(self.held_pages, ordinal, 0)
+                held[slot] -= hold.rooms
+                self.__set(ordinal, self.__get(ordinal) - rooms)
+            # Journal while the dates are locked so entries for a date are written in order
+            self.__journal([(ordinal, self.__get(ordinal)) for ordinal in hold.ordinals])
+        finally:
+            self.__release_locks(locks)
+        logger.info("Committed %s rooms on %s from %s", rooms, hold.dates, hold.hold_id)
+        return hold.dates
+
+    def release(self, hold: Optional[Hold]):
+        """Give the rooms of an uncommitted hold back. Releasing an inactive hold is a no-op."""
+        if hold is None or not self.__pop_hold(hold):
+            return
+        self.__unhold(hold.ordinals, hold.rooms)
+        logger.info("Released %s rooms on %s from %s", hold.rooms, hold.dates, hold.hold_id)
+
+    def expire_holds(self):
+        now = time.monotonic()
+        if not self.hold_expiry or self.hold_expiry[0][0] > now:
+            return
+        expired = []
+        with self.holds_lock:
+            while self.hold_expiry and self.hold_expiry[0][0] <= now:
+                _, hold_id = heapq.heappop(self.hold_expiry)
+                hold = self.holds.pop(hold_id, None)
+                if hold is not None:
+                    expired.append(hold)
+        for hold in expired:
+            self.__unhold(hold.ordinals, hold.rooms)
+            logger.info("Hold %s on %s expired", hold.hold_id, hold.dates)
+
+    def book(self, arrival_date: str, booking_days: int, rooms: int) -> List[str]:
+        """
+        Take rooms on every night of the stay in one step.
+
+        Returns:
+            List[str]: The booked dates in YYYY-MM-DD format.
+
+        Raises:
+            ValueError: If any night does not have enough rooms; nothing is booked then.
+        """
+        hold = self.try_reserve(arrival_date, booking_days, rooms)
+        if hold is None:
+            raise ValueError(f"Not enough rooms available from {arrival_date} for {booking_days} days")
+        return self.commit(hold)
+
+    def get_many(self, dates: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Committed availability for each date, None for dates never set."""
+        return {date: self.__get(self.__ordinal(date)) for date in dates}
+
+    def set_availability(self, date: str, availability: int):
+        self.set_availability_many({date: availability})
+
+    def set_availability_many(self, entries: Dict[str, int]):
+        """
+        Set the availability of many dates as one update.
+
+        Every date lock is held until the whole batch is applied, so no
+        reservation sees a half-applied override, and the batch is written
+        with a single journal append or storage transaction.
+        """
+        ordinals = {self.__ordinal(date): availability for date, availability in entries.items()}
+        locks = self.__acquire(list(ordinals))
+        try:
+            for ordinal, availability in ordinals.items():
+                self.__set(ordinal, availability)
+            self.__journal(sorted(ordinals.items()))
+        finally:
+            self.__release_locks(locks)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Committed availability in the ROOM_REQUIREMENTS_FILE layout."""
+        available_rooms = {}
+        # Pages never move once created, so copying the page tables is enough to iterate them safely
+        with self.pages_lock:
+            availability_pages = sorted(self.availability_pages.items())
+            price_pages = dict(self.price_pages)
+        for page_number, page in availability_pages:
+            prices = price_pages.get(page_number)
+            for slot, availability in enumerate(page):
+                if availability is None:
+                    continue
+                entry = {"availability": availability}
+                if prices is not None and prices[slot] is not None:
+                    entry["price_per_night"] = prices[slot]
+                available_rooms[datetime.date.fromordinal((page_number << PAGE_BITS) + slot).isoformat()] = entry
+        return available_rooms
+
+    def __journal(self, entries: List[Tuple[int, int]]):
+        if self.storage is not None:
+            self.storage.set_availability([(datetime.date.fromordinal(ordinal).isoformat(), availability) for ordinal, availability in entries])
+            return
+        lines = "".join(
+            json.dumps({"date": datetime.date.fromordinal(ordinal).isoformat(), "availability": availability}) + "\n"
+            for ordinal, availability in entries
+        )
+        with self.journal_lock:
+            with open(self.journal_file, 'a') as f:
+                f.write(lines)
+            self.journal_entries += len(entries)
+            if self.journal_entries >= self.compact_every:
+                self.__compact()
+
+    def compact(self):
+        """Write the full availability back to ROOM_REQUIREMENTS_FILE and truncate the journal."""
+        if self.storage is not None:
+            return
+        with self.journal_lock:
+            self.__compact()
+
+    def __compact(self):
+        temp_file = self.room_requirements_file + ".tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.snapshot(), f, indent=4)
+        os.replace(temp_file, self.room_requirements_file)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self.journal_entries = 0
+        logger.info(f"Compacted room inventory into {self.room_requirements_file}")
+
+    def close(self):
+        if self.journal_entries:
+            self.compact()
@@ -0,0 +1,61 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(log_file: Optional[str] = None, level: Optional[str] = None) -> Optional[logging.handlers.QueueListener]:
+    """
+    Send all logging through a queue so no caller waits on the log file or the console.
+
+    The root logger only gets a QueueHandler. It still merges each record's
+    message and arguments (and any traceback) in the calling thread, the
+    event loop included, before enqueueing it; a QueueListener thread then
+    adds the LOG_FORMAT prefix and writes it to LOG_FILE and stderr. Records
+    below the root level are dropped before any of that, so %-style logger
+    calls cost nothing when their level is off.
+    Like logging.basicConfig this does nothing when the root logger already
+    has handlers, so it is safe to call from every module that used to call
+    basicConfig.
+
+    Args:
+        log_file (str): File to write to. Defaults to LOG_FILE or fast_finger_bot.log.
+        level (str): Root level. Defaults to LOG_LEVEL or INFO.
+
+    Returns:
+        The running QueueListener, or None if logging was already configured.
+    """
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None or root.handlers:
+        return None
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [
+        logging.FileHandler(log_file or os.getenv("LOG_FILE", "fast_finger_bot.log")),
+        logging.StreamHandler(),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Write out every queued record and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
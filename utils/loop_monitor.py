@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Reports handlers that block the event loop.
+
+    A task on the loop records a heartbeat every interval seconds. A
+    watchdog thread checks it; when the heartbeat is more than threshold_ms
+    old the loop is stuck in synchronous code, and the watchdog logs the
+    loop thread's current stack, which names the blocking handler. Each
+    stall is reported once, with its full length once the loop recovers.
+    """
+
+    def __init__(self, threshold_ms: float = 100.0, interval: float = 0.02):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        self.stats = {"stalls": 0, "max_lag_ms": 0.0, "total_stall_ms": 0.0}
+
+    async def __beat(self):
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def __stack(self) -> str:
+        frame = sys._current_frames().get(self.loop_thread_id)
+        return "".join(traceback.format_stack(frame, limit=8)) if frame is not None else "<no stack>"
+
+    def __watch(self):
+        stalled_since = None
+        while not self.stopped.wait(self.interval):
+            lag = time.monotonic() - self.heartbeat - self.interval
+            if lag > self.threshold:
+                if stalled_since is None:
+                    stalled_since = self.heartbeat
+                    self.stats["stalls"] += 1
+                    logger.warning(f"Event loop blocked for over {lag * 1000:.0f}ms in:\n{self.__stack()}")
+                continue
+            if stalled_since is not None:
+                stall_ms = (self.heartbeat - stalled_since - self.interval) * 1000
+                self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], stall_ms)
+                self.stats["total_stall_ms"] += stall_ms
+                logger.warning(f"Event loop unblocked after {stall_ms:.0f}ms")
+                stalled_since = None
+
+    def start(self):
+        """Start monitoring the running loop; call from within it."""
+        if self.task is not None or self.threshold <= 0:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.__beat())
+        self.watchdog = threading.Thread(target=self.__watch, name="loop-lag-monitor", daemon=True)
+        self.watchdog.start()
+        logger.info(f"Event loop lag monitor started, reporting stalls over {self.threshold * 1000:.0f}ms")
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.stopped.set()
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.watchdog.join()
+        self.task = self.watchdog = None
+        logger.info(f"Event loop lag monitor stopped: {self.stats}")
+
+    def metrics(self) -> Dict[str, float]:
+        return dict(self.stats, threshold_ms=self.threshold * 1000, running=self.task is not None)
@@ -0,0 +1,126 @@
+import datetime
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# WhatsApp truncates longer text messages
+WHATSAPP_MAX_CHARS = 4096
+REPORT_TITLE = "📊 *Daily Booking Report*"
+
+
+def format_report_day(date: str, messages_from_airlines: int, rooms_booked: int, bookings: List[Dict[str, Any]], rooms_available: Optional[int]) -> str:
+    """One date of the daily booking report, ending in a blank line."""
+    lines = [
+        f"*Date:* {date}",
+        f"Rooms Booked: {rooms_booked}",
+        f"Rooms Available: {rooms_available if rooms_available is not None else 'N/A'}",
+        f"Messages from Airlines: {messages_from_airlines}",
+    ]
+    if bookings:
+        lines.append("Booking Details:")
+        for booking in bookings:
+            lines.append(f"- Room Type: {booking.get('room_type', 'N/A')}")
+            lines.append(f"  Check-in: {booking.get('check_in', 'N/A')}")
+            lines.append(f"  Check-out: {booking.get('check_out', 'N/A')}")
+    lines.append("\n")
+    return "\n".join(lines)
+
+
+def format_date_runs(values: Dict[str, Optional[int]], unit: str = "rooms") -> List[str]:
+    """
+    One line per run of consecutive dates with the same value, e.g. "2024-11-01 to 2024-11-07: 5 rooms".
+
+    Dates without a value are shown as N/A.
+    """
+    lines = []
+    run_start = run_end = run_value = None
+    for date in sorted(values):
+        value = values[date]
+        day = datetime.date.fromisoformat(date)
+        if run_start is not None and value == run_value and day - run_end == datetime.timedelta(days=1):
+            run_end = day
+            continue
+        if run_start is not None:
+            lines.append(_format_run(run_start, run_end, run_value, unit))
+        run_start = run_end = day
+        run_value = value
+    if run_start is not None:
+        lines.append(_format_run(run_start, run_end, run_value, unit))
+    return lines
+
+
+def _format_run(start: datetime.date, end: datetime.date, value: Optional[int], unit: str) -> str:
+    dates = start.isoformat() if start == end else f"{start.isoformat()} to {end.isoformat()}"
+    return f"{dates}: {value} {unit}" if value is not None else f"{dates}: N/A"
+
+
+def _split_block(block: str, max_chars: int) -> Iterator[str]:
+    """Split a block longer than max_chars on line boundaries, hard-cutting single overlong lines."""
+    part: List[str] = []
+    size = 0
+    for line in block.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if part:
+                yield "".join(part)
+                part, size = [], 0
+            yield line[:max_chars]
+            line = line[max_chars:]
+        if size + len(line) > max_chars and part:
+            yield "".join(part)
+            part, size = [], 0
+        part.append(line)
+        size += len(line)
+    if part:
+        yield "".join(part)
+
+
+def paginate(blocks: Iterable[str], title: str = REPORT_TITLE, max_chars: int = WHATSAPP_MAX_CHARS) -> Iterator[str]:
+    """
+    Pack blocks into messages of at most max_chars, each starting with title.
+
+    A block is only split across messages when it does not fit in a message
+    on its own. Every message carries the title, so the bot still recognises
+    each part as its own report in the confirmation group.
+
+    Yields:
+        str: The messages, in order.
+    """
+    page = 1
+    header = f"{title}\n\n"
+    room = max_chars - len(f"{title} (part 999)\n\n")
+    parts: List[str] = [header]
+    size = 0
+    for block in blocks:
+        for piece in (_split_block(block, room) if len(block) > room else (block,)):
+            if size + len(piece) > room and size:
+                yield "".join(parts)
+                page += 1
+                parts, size = [f"{title} (part {page})\n\n"], 0
+            parts.append(piece)
+            size += len(piece)
+    if size:
+        yield "".join(parts)
+
+
+def iter_report_messages(
+    days: Iterable[Tuple[str, int, int, List[Dict[str, Any]]]],
+    rooms_available: Callable[[str], Optional[int]],
+    max_chars: int = WHATSAPP_MAX_CHARS,
+) -> Iterator[str]:
+    """
+    Stream the daily booking report as WhatsApp-sized messages.
+
+    Args:
+        days: (date, messages_from_airlines, rooms_booked, bookings) tuples in date order, e.g. StateBackend.iter_report().
+        rooms_available: Returns the committed availability of a date, or None.
+        max_chars: Longest message to produce.
+
+    Yields:
+        str: Report messages in order; nothing if days is empty.
+    """
+    blocks = (
+        format_report_day(date, messages, rooms_booked, bookings, rooms_available(date))
+        for date, messages, rooms_booked, bookings in days
+    )
+    return paginate(blocks, max_chars=max_chars)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from utils.blocking_io import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so reposted or re-typed messages map to the same key."""
+    return " ".join(text.split()).casefold()
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of LLM response contents.
+
+    Entries live in memory up to max_entries; the least recently used entry
+    is evicted first and entries older than ttl seconds are treated as
+    misses. With disk_path set, entries are also written to a shelve file
+    and looked up there on a memory miss, so they survive restarts. On the
+    event loop use aget() and aput(), which touch the shelve file on the
+    blocking I/O pool.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.disk = None
+        # shelve is not thread-safe and the pool may run several lookups at once
+        self.disk_lock = threading.Lock()
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self.disk = shelve.open(disk_path)
+            logger.info(f"LLM response cache disk tier at {disk_path}")
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(task: str, messages: List[Dict[str, str]], **kwargs) -> str:
+        """
+        Key for a call: the task, the call options and every message, with the
+        user message normalized. The system prompt and date context are part of
+        the key, so a prompt change or a new day never returns a stale answer.
+        """
+        normalized = [
+            (message["role"], normalize_text(message["content"]) if message["role"] == "user" else message["content"])
+            for message in messages
+        ]
+        options = {name: getattr(value, "__name__", value) for name, value in sorted(kwargs.items())}
+        payload = json.dumps([task, options, normalized], default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def __get_memory(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            del self.entries[key]
+        return None
+
+    def __read_disk(self, key: str) -> Optional[Tuple[float, str]]:
+        with self.disk_lock:
+            if self.disk is None:
+                return None
+            entry = self.disk.get(key)
+        return entry if entry is not None and entry[0] > time.time() else None
+
+    def __write_disk(self, key: str, entry: Tuple[float, str]):
+        with self.disk_lock:
+            if self.disk is not None:
+                self.disk[key] = entry
+
+    def __found_on_disk(self, key: str, entry: Optional[Tuple[float, str]]) -> Optional[str]:
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.__remember(key, entry)
+        self.stats["disk_hits"] += 1
+        return entry[1]
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.__get_memory(key)
+        if value is not None:
+            return value
+        return self.__found_on_disk(key, self.__read_disk(key) if self.disk is not None else None)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() that reads the disk tier off the event loop; memory hits return without leaving it."""
+        value = self.__get_memory(key)
+        if value is not None:
+            return value
+        return self.__found_on_disk(key, await run_blocking(self.__read_disk, key) if self.disk is not None else None)
+
+    def put(self, key: str, value: str):
+        entry = (time.time() + self.ttl, value)
+        self.__remember(key, entry)
+        if self.disk is not None:
+            self.__write_disk(key, entry)
+
+    async def aput(self, key: str, value: str):
+        """put() that writes the disk tier off the event loop."""
+        entry = (time.time() + self.ttl, value)
+        self.__remember(key, entry)
+        if self.disk is not None:
+            await run_blocking(self.__write_disk, key, entry)
+
+    def __remember(self, key: str, entry: Tuple[float, str]):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return (self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0
+
+    def close(self):
+        with self.disk_lock:
+            if self.disk is not None:
+                self.disk.close()
+                self.disk = None
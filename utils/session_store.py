@@ -0,0 +1,74 @@
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSession:
+    """Bid state of one WhatsApp group."""
+
+    __slots__ = ("chat_id", "current_state", "current_hold", "message", "bids", "conversation", "last_seen")
+
+    def __init__(self, chat_id: str, history_size: int):
+        self.chat_id = chat_id
+        # BasicExtraction of the request we are bidding on
+        self.current_state = None
+        # Hold on the rooms promised with "RP Can"
+        self.current_hold = None
+        self.message: Optional[str] = None
+        self.bids = deque(maxlen=history_size)
+        self.conversation = deque(maxlen=history_size)
+        self.last_seen = time.monotonic()
+
+
+class SessionStore:
+    """
+    Per chat_id sessions with bounded history.
+
+    Sessions are kept in least-recently-used order. A session idle for longer
+    than ttl seconds is dropped, and when more than max_sessions groups are
+    active the least recently used one is evicted.
+    """
+
+    def __init__(self, max_sessions: int = 256, ttl: float = 86400.0, history_size: int = 50):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_size = history_size
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def get(self, chat_id: str) -> ChatSession:
+        """Return the session for chat_id, creating it if needed."""
+        now = time.monotonic()
+        self.evict_expired(now)
+        session = self.sessions.get(chat_id)
+        if session is None:
+            session = ChatSession(chat_id, self.history_size)
+            self.sessions[chat_id] = session
+            logger.info(f"Created session for chat_id={chat_id}")
+            while len(self.sessions) > self.max_sessions:
+                evicted_chat_id, _ = self.sessions.popitem(last=False)
+                logger.info(f"Evicted least recently used session for chat_id={evicted_chat_id}")
+        else:
+            self.sessions.move_to_end(chat_id)
+        session.last_seen = now
+        return session
+
+    def save(self, session: ChatSession):
+        """Persist changes made to session. Sessions here are live objects, so there is nothing to do."""
+
+    def evict_expired(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        while self.sessions:
+            chat_id, session = next(iter(self.sessions.items()))
+            if now - session.last_seen < self.ttl:
+                break
+            del self.sessions[chat_id]
+            logger.info(f"Evicted idle session for chat_id={chat_id}")
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
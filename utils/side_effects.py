@@ -0,0 +1,104 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Callable, List, Optional, Set
+
+from utils.blocking_io import run_blocking
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class SideEffectQueue:
+    """
+    In-process queue for work that must not delay a reply.
+
+    Report counters, confirmation notifications and timing logs are
+    submitted here and run by a small pool of asyncio worker tasks once the
+    caller has yielded, i.e. after the reply went out. Plain functions run
+    on the blocking I/O pool, coroutine functions on the loop. Workers are
+    started on the first submit; stop() drains the queue, and waits for
+    side effects that overflowed it, before shutting down.
+    """
+
+    def __init__(self, workers: int = 2, max_size: int = 1000):
+        self.worker_count = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.workers: List[asyncio.Task] = []
+        # Side effects run beside a full queue; kept here so they are not garbage collected and stop() can wait for them
+        self.overflow_tasks: Set[asyncio.Task] = set()
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "overflow": 0}
+
+    def __ensure_workers(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self.__work(i)) for i in range(self.worker_count)]
+            logger.info(f"Started {self.worker_count} side effect workers")
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) to run after the current handler yields.
+
+        fn may be a plain function or a coroutine function. Must be called
+        from within the running event loop.
+        """
+        self.__ensure_workers()
+        item = (name, fn, args, kwargs, time.perf_counter(), tracer.current_trace())
+        self.stats["submitted"] += 1
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Never drop a side effect; run it beside the queue instead
+            self.stats["overflow"] += 1
+            logger.warning("Side effect queue full, running %s directly", name)
+            task = asyncio.create_task(self.__run(item))
+            self.overflow_tasks.add(task)
+            task.add_done_callback(self.overflow_tasks.discard)
+
+    async def __run(self, item):
+        name, fn, args, kwargs, submitted_at, trace = item
+        try:
+            # Side effects are traced under the message that submitted them
+            with tracer.activate(trace), tracer.span(f"side_effect.{name}"):
+                if inspect.iscoroutinefunction(fn):
+                    await fn(*args, **kwargs)
+                else:
+                    # Plain functions are report and database writes; keep them off the event loop
+                    await run_blocking(fn, *args, **kwargs)
+            self.stats["completed"] += 1
+            logger.debug("Side effect %s done %.1fms after submit", name, (time.perf_counter() - submitted_at) * 1000)
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error("Side effect %s failed: %s", name, e)
+
+    async def __work(self, worker: int):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self.__run(item)
+            finally:
+                self.queue.task_done()
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def __drain(self):
+        await self.queue.join()
+        # An overflow side effect may itself submit more
+        while self.overflow_tasks:
+            await asyncio.gather(*self.overflow_tasks, return_exceptions=True)
+            await self.queue.join()
+
+    async def stop(self, timeout: Optional[float] = 10.0):
+        """Wait for queued and overflow side effects to finish, then stop the workers."""
+        if self.workers:
+            try:
+                await asyncio.wait_for(self.__drain(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Side effect queue not drained after {timeout}s, "
+                             f"{self.queue.qsize() + len(self.overflow_tasks)} items dropped")
+            for task in [*self.workers, *self.overflow_tasks]:
+                task.cancel()
+            await asyncio.gather(*self.workers, *self.overflow_tasks, return_exceptions=True)
+            self.workers = []
+        logger.info(f"Side effect queue stopped: {self.stats}")
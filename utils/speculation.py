@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from utils.blocking_io import run_blocking
+from utils.inventory import Hold
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# At most this many guessed stays are tried for a speculative hold
+MAX_SPECULATIVE_STAYS = 4
+
+
+@dataclass(frozen=True)
+class Stay:
+    """What a bid reserves: rooms on every night from arrival_date for booking_days nights."""
+    arrival_date: str
+    booking_days: int
+    rooms: int
+
+
+class SpeculativeBid:
+    """
+    A bid prepared from a local guess while the LLM is still classifying the message.
+
+    start() tries the guessed stays in order in the background and puts the
+    first one that has rooms on hold, then runs prepare (e.g. reopening the
+    WHAPI connection). Once the LLM has answered, claim() hands over the
+    hold if the LLM's stay is the one that was guessed, so "RP Can" can be
+    sent without another inventory round trip; any other outcome releases
+    the hold in discard(). Outcomes are counted in stats:
+
+    - hits: the LLM confirmed the held stay.
+    - mismatches: the LLM asked for a different stay.
+    - no_hold: no guess could be made or none of the guessed stays had rooms.
+    - unused: a stay was held but the LLM found no room request.
+    - errors: the background work failed.
+    """
+
+    def __init__(self, inventory, ttl: float, stats: Dict[str, int], prepare: Optional[Callable[[], Awaitable]] = None):
+        self.inventory = inventory
+        self.ttl = ttl
+        self.stats = stats
+        self.prepare = prepare
+        self.task: Optional[asyncio.Task] = None
+        self.stay: Optional[Stay] = None
+        self.hold: Optional[Hold] = None
+        self.settled = False
+
+    async def __run(self, stays: List[Stay]):
+        with tracer.span("speculation", guesses=len(stays)) as span:
+            for stay in stays[:MAX_SPECULATIVE_STAYS]:
+                hold = await run_blocking(self.inventory.try_reserve, stay.arrival_date, stay.booking_days, stay.rooms, ttl=self.ttl)
+                if hold is not None:
+                    self.stay, self.hold = stay, hold
+                    span.set(held=True)
+                    logger.debug("Speculatively holding %s rooms from %s for %s nights", stay.rooms, stay.arrival_date, stay.booking_days)
+                    break
+            if self.prepare is not None:
+                try:
+                    await self.prepare()
+                except Exception as e:
+                    logger.warning("Preparing the speculative reply failed: %s", e)
+
+    def start(self, stays: List[Stay]):
+        """Start holding the first of stays that has rooms; call just before awaiting the LLM."""
+        if self.task is not None:
+            return
+        self.stats["started"] += 1
+        self.task = asyncio.create_task(self.__run(stays))
+
+    async def __finished(self) -> bool:
+        try:
+            await self.task
+            return True
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning("Speculative bid failed: %s", e)
+            return False
+
+    async def claim(self, stay: Stay) -> Optional[Hold]:
+        """
+        The speculative hold if it is for stay, otherwise None after releasing it.
+
+        Args:
+            stay (Stay): The stay the LLM's answer asks for.
+
+        Returns:
+            Optional[Hold]: The hold, now owned by the caller, or None.
+        """
+        if self.task is None or self.settled:
+            return None
+        self.settled = True
+        if not await self.__finished():
+            return None
+        if self.hold is None:
+            self.stats["no_hold"] += 1
+            return None
+        if stay != self.stay:
+            self.stats["mismatches"] += 1
+            logger.info("Speculative stay %s does not match %s, discarding it", self.stay, stay)
+            await run_blocking(self.inventory.release, self.hold)
+            self.hold = None
+            return None
+        self.stats["hits"] += 1
+        hold, self.hold = self.hold, None
+        return hold
+
+    async def discard(self):
+        """Release the hold unless it was claimed; safe to call more than once."""
+        if self.task is None or self.settled:
+            return
+        self.settled = True
+        if not await self.__finished():
+            return
+        if self.hold is None:
+            self.stats["no_hold"] += 1
+            return
+        self.stats["unused"] += 1
+        await run_blocking(self.inventory.release, self.hold)
+        self.hold = None
+
+
+def speculation_stats(stats: Dict[str, int]) -> Dict[str, float]:
+    """Speculation outcome counts with misses and hit_rate added."""
+    misses = stats["mismatches"] + stats["no_hold"] + stats["unused"] + stats["errors"]
+    settled = stats["hits"] + misses
+    return dict(stats, misses=misses, hit_rate=stats["hits"] / settled if settled else 0.0)
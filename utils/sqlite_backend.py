@@ -0,0 +1,391 @@
+import dataclasses
+import datetime
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from utils.inventory import DEFAULT_AVAILABILITY, DEFAULT_HOLD_TTL, Hold
+from utils.session_store import ChatSession
+from utils.aggregates import ReportAggregates
+from utils.config_cache import ConfigCache
+from utils.state_backend import StateBackend
+from utils.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Tables on top of the Storage schema that only the shared backend needs
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS holds (
+    hold_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    rooms INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (hold_id, date)
+);
+CREATE INDEX IF NOT EXISTS holds_date ON holds (date);
+CREATE INDEX IF NOT EXISTS holds_expires_at ON holds (expires_at);
+CREATE TABLE IF NOT EXISTS flags (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    chat_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    last_seen REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);
+CREATE TABLE IF NOT EXISTS processed_messages (
+    message_id TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS processed_messages_seen_at ON processed_messages (seen_at);
+"""
+
+
+class SQLiteInventory:
+    """
+    RoomInventory on a SQLite database shared by all worker processes.
+
+    Every reservation runs in one BEGIN IMMEDIATE transaction, which SQLite
+    serializes across processes, so two workers can never promise the same
+    rooms. Holds are rows with a wall-clock expiry and are purged lazily at
+    the start of each write.
+    """
+
+    def __init__(self, storage: Storage, default_availability: int = DEFAULT_AVAILABILITY):
+        self.storage = storage
+        self.default_availability = default_availability
+
+    @staticmethod
+    def __stay_dates(arrival_date: str, booking_days: int) -> List[str]:
+        first = datetime.date.fromisoformat(arrival_date)
+        return [(first + datetime.timedelta(days=day)).isoformat() for day in range(booking_days)]
+
+    @staticmethod
+    def __purge_expired(conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM holds WHERE expires_at <= ?", (now,))
+
+    def __free(self, conn: sqlite3.Connection, date: str) -> int:
+        """Rooms on date that are neither booked nor on hold, adding the default for dates never set."""
+        if self.storage.ensure_dates([date], self.default_availability):
+            logger.info("Added missing date %s with %s rooms", date, self.default_availability)
+        availability, held = conn.execute(
+            "SELECT availability, (SELECT COALESCE(SUM(rooms), 0) FROM holds WHERE holds.date = availability.date) "
+            "FROM availability WHERE date = ?",
+            (date,),
+        ).fetchone()
+        return availability - held
+
+    def get(self, date: str) -> Optional[int]:
+        """Committed availability for date, or None if the date has never been set."""
+        return self.storage.get_availability(date)
+
+    def get_price(self, date: str) -> Optional[float]:
+        return self.storage.get_price(date)
+
+    def is_available(self, arrival_date: str, booking_days: int, rooms: int) -> bool:
+        """Check whether rooms are free (not booked and not on hold) on every night of the stay."""
+        with self.storage.transaction() as conn:
+            self.__purge_expired(conn, time.time())
+            for date in self.__stay_dates(arrival_date, booking_days):
+                if self.__free(conn, date) < rooms:
+                    logger.warning("Insufficient rooms on %s", date)
+                    return False
+            return True
+
+    def try_reserve(self, arrival_date: str, booking_days: int, rooms: int, ttl: float = DEFAULT_HOLD_TTL) -> Optional[Hold]:
+        """Atomically put rooms on hold for every night of the stay; see RoomInventory.try_reserve."""
+        dates = self.__stay_dates(arrival_date, booking_days)
+        now = time.time()
+        hold = Hold(
+            hold_id=uuid.uuid4().hex,
+            ordinals=[datetime.date.fromisoformat(date).toordinal() for date in dates],
+            rooms=rooms,
+            expires_at=now + ttl,
+        )
+        with self.storage.transaction() as conn:
+            self.__purge_expired(conn, now)
+            for date in dates:
+                if self.__free(conn, date) < rooms:
+                    logger.warning("Insufficient rooms on %s", date)
+                    return None
+            conn.executemany(
+                "INSERT INTO holds (hold_id, date, rooms, expires_at) VALUES (?, ?, ?, ?)",
+                [(hold.hold_id, date, rooms, hold.expires_at) for date in dates],
+            )
+        logger.info("Holding %s rooms on %s as %s", rooms, dates, hold.hold_id)
+        return hold
+
+    def is_held(self, hold: Optional[Hold]) -> bool:
+        if hold is None:
+            return False
+        return bool(self.storage.query("SELECT 1 FROM holds WHERE hold_id = ? AND expires_at > ? LIMIT 1", (hold.hold_id, time.time())))
+
+    def commit(self, hold: Hold, rooms: Optional[int] = None) -> List[str]:
+        """Turn a hold into a booking; see RoomInventory.commit."""
+        rooms = hold.rooms if rooms is None else rooms
+        if rooms > hold.rooms:
+            raise ValueError(f"Cannot commit {rooms} rooms on a hold of {hold.rooms}")
+        with self.storage.transaction() as conn:
+            self.__purge_expired(conn, time.time())
+            if not conn.execute("DELETE FROM holds WHERE hold_id = ?", (hold.hold_id,)).rowcount:
+                raise ValueError(f"Hold {hold.hold_id} is no longer active")
+            self.storage.adjust_availability(hold.dates, -rooms)
+        logger.info("Committed %s rooms on %s from %s", rooms, hold.dates, hold.hold_id)
+        return hold.dates
+
+    def release(self, hold: Optional[Hold]):
+        """Give the rooms of an uncommitted hold back. Releasing an inactive hold is a no-op."""
+        if hold is None:
+            return
+        with self.storage.transaction() as conn:
+            released = conn.execute("DELETE FROM holds WHERE hold_id = ?", (hold.hold_id,)).rowcount
+        if released:
+            logger.info("Released %s rooms on %s from %s", hold.rooms, hold.dates, hold.hold_id)
+
+    def expire_holds(self):
+        with self.storage.transaction() as conn:
+            self.__purge_expired(conn, time.time())
+
+    def book(self, arrival_date: str, booking_days: int, rooms: int) -> List[str]:
+        hold = self.try_reserve(arrival_date, booking_days, rooms)
+        if hold is None:
+            raise ValueError(f"Not enough rooms available from {arrival_date} for {booking_days} days")
+        return self.commit(hold)
+
+    def get_many(self, dates: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Committed availability for each date, None for dates never set, in one query."""
+        dates = list(dates)
+        if not dates:
+            return {}
+        stored = {date: availability for date, availability, _ in self.storage.availability_range(min(dates), max(dates))}
+        return {date: stored.get(date) for date in dates}
+
+    def set_availability(self, date: str, availability: int):
+        self.set_availability_many({date: availability})
+
+    def set_availability_many(self, entries: Dict[str, int]):
+        """Set the availability of many dates in one transaction."""
+        self.storage.set_availability(sorted(entries.items()))
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Committed availability in the ROOM_REQUIREMENTS_FILE layout."""
+        return self.storage.load_availability()
+
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StoredChatSession(ChatSession):
+    """ChatSession read from the database, with the row version and data it was read at."""
+
+    __slots__ = ("version", "loaded")
+
+    def __init__(self, chat_id: str, history_size: int, version: int = 0, loaded: Optional[str] = None):
+        super().__init__(chat_id, history_size)
+        self.version = version
+        self.loaded = loaded
+
+
+class SQLiteSessionStore:
+    """
+    SessionStore whose sessions live in the shared database.
+
+    get() returns a detached ChatSession; changes are only visible to other
+    workers after save(). current_state is stored as a dict and restored
+    through session_model when one is given.
+
+    Every save bumps the row's version. If another worker saved the chat
+    since get(), save() merges instead of overwriting: its own changes to
+    the bid (current_state, current_hold, message) win, otherwise the
+    other worker's bid is kept, and bids and conversation lines added on
+    either side are all kept.
+    """
+
+    def __init__(self, storage: Storage, max_sessions: int = 256, ttl: float = 86400.0, history_size: int = 50, session_model=None):
+        self.storage = storage
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_size = history_size
+        self.session_model = session_model
+
+    def __dump(self, session: ChatSession) -> str:
+        state = session.current_state
+        if state is not None and hasattr(state, "dict"):
+            state = state.dict()
+        hold = session.current_hold
+        return json.dumps({
+            "current_state": state,
+            "current_hold": dataclasses.asdict(hold) if hold is not None else None,
+            "message": session.message,
+            "bids": list(session.bids),
+            "conversation": list(session.conversation),
+        })
+
+    def __restore(self, chat_id: str, data: str, last_seen: float, version: int = 0) -> StoredChatSession:
+        fields = json.loads(data)
+        session = StoredChatSession(chat_id, self.history_size, version, data)
+        state = fields["current_state"]
+        if state is not None and self.session_model is not None:
+            state = self.session_model.parse_obj(state)
+        session.current_state = state
+        session.current_hold = Hold(**fields["current_hold"]) if fields["current_hold"] else None
+        session.message = fields["message"]
+        session.bids.extend(tuple(bid) for bid in fields["bids"])
+        session.conversation.extend(fields["conversation"])
+        session.last_seen = last_seen
+        return session
+
+    def get(self, chat_id: str) -> ChatSession:
+        """Return the session for chat_id, creating it if needed."""
+        now = time.time()
+        with self.storage.transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE last_seen <= ?", (now - self.ttl,))
+            row = conn.execute("SELECT data, version FROM sessions WHERE chat_id = ?", (chat_id,)).fetchone()
+            if row is None:
+                session = StoredChatSession(chat_id, self.history_size)
+                session.last_seen = now
+                session.loaded = self.__dump(session)
+                conn.execute("INSERT INTO sessions (chat_id, data, last_seen, version) VALUES (?, ?, ?, 0)", (chat_id, session.loaded, now))
+                conn.execute(
+                    "DELETE FROM sessions WHERE chat_id IN "
+                    "(SELECT chat_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,),
+                )
+                logger.info("Created session for chat_id=%s", chat_id)
+                return session
+            conn.execute("UPDATE sessions SET last_seen = ? WHERE chat_id = ?", (now, chat_id))
+        return self.__restore(chat_id, row[0], now, row[1])
+
+    def __appended(self, before: List, after: List) -> List:
+        """Entries appended to a bounded history that held before and now holds after."""
+        for count in range(len(after) + 1):
+            if (before + after[len(after) - count:])[-self.history_size:] == after:
+                return after[len(after) - count:]
+        return after
+
+    def __merge(self, base: Dict, ours: Dict, theirs: Dict) -> Dict:
+        """Three-way merge of a session saved by another worker since base was read."""
+        bid_fields = ("current_state", "current_hold", "message")
+        merged = dict(theirs)
+        if any(ours[field] != base[field] for field in bid_fields):
+            if any(theirs[field] != base[field] for field in bid_fields):
+                logger.warning("Bid state changed concurrently by another worker, keeping ours")
+            merged.update((field, ours[field]) for field in bid_fields)
+        for field in ("bids", "conversation"):
+            merged[field] = (theirs[field] + self.__appended(base[field], ours[field]))[-self.history_size:]
+        return merged
+
+    def save(self, session: ChatSession):
+        """Write session back, merging with any save made by another worker since it was read."""
+        data = self.__dump(session)
+        version = getattr(session, "version", None)
+        with self.storage.transaction() as conn:
+            row = conn.execute("SELECT data, version FROM sessions WHERE chat_id = ?", (session.chat_id,)).fetchone()
+            if row is not None and version is not None and row[1] != version and getattr(session, "loaded", None):
+                logger.info("Session for chat_id=%s was saved by another worker, merging", session.chat_id)
+                data = json.dumps(self.__merge(json.loads(session.loaded), json.loads(data), json.loads(row[0])))
+            new_version = row[1] + 1 if row is not None else 0
+            conn.execute(
+                "INSERT INTO sessions (chat_id, data, last_seen, version) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET data = excluded.data, last_seen = excluded.last_seen, version = excluded.version",
+                (session.chat_id, data, time.time(), new_version),
+            )
+        if isinstance(session, StoredChatSession):
+            session.version, session.loaded = new_version, data
+
+    def evict_expired(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self.storage.transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE last_seen <= ?", (now - self.ttl,))
+
+    def __len__(self) -> int:
+        return self.storage.query("SELECT COUNT(*) FROM sessions")[0][0]
+
+    def __iter__(self):
+        rows = self.storage.query("SELECT chat_id, data, last_seen, version FROM sessions ORDER BY last_seen")
+        return iter([self.__restore(*row) for row in rows])
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    State shared by every worker process through one Storage database, for
+    running several uvicorn workers on one host.
+
+    Apart from metadata, which ConfigCache reloads every few seconds,
+    nothing is cached in the process: every read goes to the database and
+    every write is a transaction, so all workers see the same inventory,
+    holds, sessions and flags.
+    """
+
+    sessions_on_disk = True
+    flags_on_disk = True
+    messages_on_disk = True
+
+    def __init__(
+        self,
+        storage: Storage,
+        config: ConfigCache,
+        max_sessions: int = 256,
+        session_ttl: float = 86400.0,
+        history_size: int = 50,
+        session_model=None,
+        message_window: float = 3600.0,
+    ):
+        self.storage = storage
+        self.config = config
+        self.aggregates = ReportAggregates()
+        self.aggregates_version = None
+        self.message_window = message_window
+        storage.executescript(SCHEMA)
+        self.__migrate()
+        self.inventory = SQLiteInventory(storage)
+        self.sessions = SQLiteSessionStore(storage, max_sessions=max_sessions, ttl=session_ttl, history_size=history_size, session_model=session_model)
+        logger.info(f"Sharing state through {storage.db_file}")
+
+    def __migrate(self):
+        # Databases created before sessions were versioned
+        if "version" not in {row[1] for row in self.storage.query("PRAGMA table_info(sessions)")}:
+            with self.storage.transaction() as conn:
+                conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            logger.info("Added column sessions.version")
+
+    def report_aggregates(self) -> ReportAggregates:
+        """Running report totals, reloaded first if another worker has written to the database since."""
+        data_version = self.storage.data_version()
+        if data_version != self.aggregates_version:
+            self.aggregates.load(self.storage.report_counters())
+            self.aggregates_version = data_version
+        return self.aggregates
+
+    def get_flag(self, name: str, default: bool) -> bool:
+        rows = self.storage.query("SELECT value FROM flags WHERE name = ?", (name,))
+        return bool(rows[0][0]) if rows else default
+
+    def set_flag(self, name: str, value: bool):
+        with self.storage.transaction() as conn:
+            conn.execute("INSERT INTO flags (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value", (name, int(value)))
+
+    def claim_message(self, message_id: str) -> bool:
+        if not message_id:
+            return True
+        now = time.time()
+        with self.storage.transaction() as conn:
+            conn.execute("DELETE FROM processed_messages WHERE seen_at <= ?", (now - self.message_window,))
+            return bool(conn.execute("INSERT OR IGNORE INTO processed_messages (message_id, seen_at) VALUES (?, ?)", (message_id, now)).rowcount)
+
+    def release_message(self, message_id: str):
+        if not message_id:
+            return
+        with self.storage.transaction() as conn:
+            conn.execute("DELETE FROM processed_messages WHERE message_id = ?", (message_id,))
+
+    def close(self):
+        self.storage.close()
@@ -0,0 +1,169 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.aggregates import ReportAggregates
+from utils.config_cache import ConfigCache
+from utils.inventory import RoomInventory
+from utils.session_store import SessionStore
+from utils.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend(ABC):
+    """
+    State the bot shares between webhooks: room inventory, the daily report,
+    metadata (message originator, help menu), runtime flags and chat
+    sessions.
+
+    inventory follows the RoomInventory interface and sessions the
+    SessionStore interface. Implementations decide whether that state lives
+    in this process only or is shared between worker processes.
+    """
+
+    storage: Storage = None
+    inventory: Optional[RoomInventory] = None
+    sessions: SessionStore = None
+    config: ConfigCache = None
+    aggregates: ReportAggregates = None
+    # Whether session get/save read and write the database, so callers should keep them off the event loop
+    sessions_on_disk = False
+    # Likewise for get_flag and set_flag
+    flags_on_disk = False
+    # Likewise for claim_message and release_message
+    messages_on_disk = False
+
+    def load_report(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        return self.storage.load_report(start, end)
+
+    def iter_report(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Tuple[str, int, int, List[Dict[str, Any]]]]:
+        """Lazily yield (date, messages_from_airlines, rooms_booked, bookings) for start <= date <= end."""
+        return self.storage.iter_report(start, end)
+
+    def update_report(self, date: str, rooms_booked: int = 0, message_from_airlines: bool = False):
+        if message_from_airlines:
+            self.storage.increment_report(date, messages_from_airlines=1)
+            self.aggregates.add(date, airline_messages=1)
+        else:
+            self.storage.increment_report(date, rooms_booked=rooms_booked)
+            self.aggregates.add(date, rooms_booked=rooms_booked)
+
+    def record_bid(self, date: str, won: bool = False):
+        """Count an "RP Can" bid sent on date, or with won=True a booking made against one."""
+        if won:
+            self.storage.increment_report(date, bids_won=1)
+            self.aggregates.add(date, bids_won=1)
+        else:
+            self.storage.increment_report(date, bids=1)
+            self.aggregates.add(date, bids=1)
+
+    def report_aggregates(self) -> ReportAggregates:
+        """Running report totals, up to date with every report update."""
+        return self.aggregates
+
+    def record_booking(self, check_in: str, check_out: str, rooms: int, chat_id: Optional[str] = None):
+        self.storage.record_booking(check_in, check_out, rooms, chat_id=chat_id)
+
+    def get_metadata(self, key: str, default: Any = None) -> Any:
+        return self.config.get(key, default)
+
+    def set_metadata(self, key: str, value: Any):
+        self.config.set(key, value)
+
+    @abstractmethod
+    def get_flag(self, name: str, default: bool) -> bool:
+        """Value of the runtime flag name, or default if it was never set."""
+
+    @abstractmethod
+    def set_flag(self, name: str, value: bool):
+        """Set the runtime flag name for every worker sharing this state."""
+
+    @abstractmethod
+    def claim_message(self, message_id: str) -> bool:
+        """Return True if this process should handle message_id, False if another worker already did."""
+
+    @abstractmethod
+    def release_message(self, message_id: str):
+        """Undo claim_message, so a redelivery of message_id is handled again."""
+
+    def close(self):
+        pass
+
+
+class InProcessStateBackend(StateBackend):
+    """
+    State kept in this process, for a single worker deployment.
+
+    inventory is a RoomInventory answered from memory and sessions live in
+    memory. Availability changes, report counters, bookings and metadata
+    are written through to the Storage; flags are not persisted.
+    """
+
+    def __init__(self, storage: Storage, sessions: SessionStore, config: ConfigCache):
+        self.storage = storage
+        self.inventory = RoomInventory(storage=storage)
+        self.sessions = sessions
+        self.config = config
+        self.aggregates = ReportAggregates()
+        self.aggregates.load(storage.report_counters())
+        self.flags: Dict[str, bool] = {}
+
+    def get_flag(self, name: str, default: bool) -> bool:
+        return self.flags.get(name, default)
+
+    def set_flag(self, name: str, value: bool):
+        self.flags[name] = value
+
+    def claim_message(self, message_id: str) -> bool:
+        # Only one process handles webhooks; RecentMessageIds already drops redeliveries
+        return True
+
+    def release_message(self, message_id: str):
+        pass
+
+    def close(self):
+        self.storage.close()
+
+
+def create_state_backend(session_model=None) -> StateBackend:
+    """
+    Build the backend selected by STATE_BACKEND ("memory" or "sqlite").
+
+    Args:
+        session_model: Pydantic model of ChatSession.current_state, needed to restore shared sessions.
+    """
+    backend = os.getenv("STATE_BACKEND", "memory").lower()
+    if backend not in ("memory", "sqlite"):
+        raise ValueError(f"Unknown STATE_BACKEND: {backend}")
+    room_requirements_file = os.getenv("ROOM_REQUIREMENTS_FILE")
+    if not room_requirements_file:
+        logger.critical("ROOM_REQUIREMENTS_FILE environment variable not set")
+    storage = Storage(os.getenv("STATE_DB_FILE", "data/state.db"))
+    # The JSON files are only read on the very first start; the database is the source of truth after that
+    metadata_file = os.getenv("DATA_METADATA_FILE", "data/metadata.json")
+    storage.import_json(room_requirements_file, os.getenv("REPORT_FILE", "data/report.json"), metadata_file)
+    # Metadata is read from memory; edits to the metadata file are picked up within METADATA_POLL_SECONDS
+    config = ConfigCache(storage, metadata_file, poll_interval=float(os.getenv("METADATA_POLL_SECONDS", "5")))
+    max_sessions = int(os.getenv("SESSION_MAX_CHATS", "256"))
+    session_ttl = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    history_size = int(os.getenv("SESSION_HISTORY_SIZE", "50"))
+
+    logger.info(f"Using {backend} state backend")
+    if backend == "sqlite":
+        from utils.sqlite_backend import SQLiteStateBackend
+        return SQLiteStateBackend(
+            storage,
+            config,
+            max_sessions=max_sessions,
+            session_ttl=session_ttl,
+            history_size=history_size,
+            session_model=session_model,
+            message_window=float(os.getenv("DEDUP_WINDOW_SECONDS", "3600")),
+        )
+    return InProcessStateBackend(
+        storage,
+        SessionStore(max_sessions=max_sessions, ttl=session_ttl, history_size=history_size),
+        config,
+    )
@@ -0,0 +1,331 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS availability (
+    date TEXT PRIMARY KEY,
+    availability INTEGER NOT NULL,
+    price_per_night REAL
+);
+CREATE TABLE IF NOT EXISTS report (
+    date TEXT PRIMARY KEY,
+    number_of_messages_from_airlines INTEGER NOT NULL DEFAULT 0,
+    number_of_rooms_booked INTEGER NOT NULL DEFAULT 0,
+    number_of_bids INTEGER NOT NULL DEFAULT 0,
+    number_of_bids_won INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    check_in TEXT NOT NULL,
+    check_out TEXT NOT NULL,
+    rooms INTEGER NOT NULL,
+    room_type TEXT,
+    chat_id TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_check_in ON bookings (check_in);
+CREATE TABLE IF NOT EXISTS config (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+IMPORT_MARKER = "_json_import"
+
+
+class Storage:
+    """
+    SQLite storage for availability, report counters, bookings and config.
+
+    The database runs in WAL mode, so readers never block the writer and a
+    crash can lose at most the last transaction, never corrupt the file.
+    Every write touches only the rows it changes.
+
+    transaction() is reentrant: writes made inside an outer transaction()
+    block are committed together, which is how updates are batched.
+    """
+
+    def __init__(self, db_file: str, timeout: float = 30.0):
+        self.db_file = db_file
+        directory = os.path.dirname(db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.conn = sqlite3.connect(db_file, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.__migrate()
+        logger.info(f"Opened storage {db_file}")
+
+    def __migrate(self):
+        """Add columns introduced after a database was created."""
+        report_columns = {row[1] for row in self.conn.execute("PRAGMA table_info(report)")}
+        for column in ("number_of_bids", "number_of_bids_won"):
+            if column not in report_columns:
+                self.conn.execute(f"ALTER TABLE report ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+                logger.info(f"Added column report.{column}")
+
+    @contextmanager
+    def transaction(self):
+        """Run a write transaction; BEGIN IMMEDIATE takes the database write lock up front."""
+        with self.lock:
+            if self.depth:
+                self.depth += 1
+                try:
+                    yield self.conn
+                finally:
+                    self.depth -= 1
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.depth = 1
+            try:
+                yield self.conn
+            except BaseException:
+                self.depth = 0
+                self.conn.execute("ROLLBACK")
+                raise
+            self.depth = 0
+            self.conn.execute("COMMIT")
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def executescript(self, script: str):
+        with self.lock:
+            self.conn.executescript(script)
+
+    # Availability
+
+    def get_availability(self, date: str) -> Optional[int]:
+        rows = self.query("SELECT availability FROM availability WHERE date = ?", (date,))
+        return rows[0][0] if rows else None
+
+    def get_price(self, date: str) -> Optional[float]:
+        rows = self.query("SELECT price_per_night FROM availability WHERE date = ?", (date,))
+        return rows[0][0] if rows else None
+
+    def availability_range(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[str, int, Optional[float]]]:
+        """(date, availability, price_per_night) rows with start <= date <= end, in date order."""
+        return self.query(
+            "SELECT date, availability, price_per_night FROM availability WHERE date >= ? AND date <= ? ORDER BY date",
+            (start or "", end or "9999-12-31"),
+        )
+
+    def set_availability(self, entries: Iterable[Tuple[str, int]]):
+        """Upsert (date, availability) pairs, keeping any stored price."""
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO availability (date, availability) VALUES (?, ?) "
+                "ON CONFLICT (date) DO UPDATE SET availability = excluded.availability",
+                entries,
+            )
+
+    def adjust_availability(self, dates: Iterable[str], delta: int):
+        with self.transaction() as conn:
+            conn.executemany("UPDATE availability SET availability = availability + ? WHERE date = ?", [(delta, date) for date in dates])
+
+    def ensure_dates(self, dates: Iterable[str], availability: int) -> List[str]:
+        """Add dates that have never been set with the given availability and return the ones added."""
+        added = []
+        with self.transaction() as conn:
+            for date in dates:
+                if conn.execute("INSERT OR IGNORE INTO availability (date, availability) VALUES (?, ?)", (date, availability)).rowcount:
+                    added.append(date)
+        return added
+
+    def load_availability(self) -> Dict[str, Dict[str, float]]:
+        """All availability in the ROOM_REQUIREMENTS_FILE layout."""
+        available_rooms = {}
+        for date, availability, price_per_night in self.availability_range():
+            entry = {"availability": availability}
+            if price_per_night is not None:
+                entry["price_per_night"] = price_per_night
+            available_rooms[date] = entry
+        return available_rooms
+
+    # Report and bookings
+
+    def increment_report(self, date: str, messages_from_airlines: int = 0, rooms_booked: int = 0, bids: int = 0, bids_won: int = 0):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO report (date, number_of_messages_from_airlines, number_of_rooms_booked, number_of_bids, number_of_bids_won) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (date) DO UPDATE SET "
+                "number_of_messages_from_airlines = number_of_messages_from_airlines + excluded.number_of_messages_from_airlines, "
+                "number_of_rooms_booked = number_of_rooms_booked + excluded.number_of_rooms_booked, "
+                "number_of_bids = number_of_bids + excluded.number_of_bids, "
+                "number_of_bids_won = number_of_bids_won + excluded.number_of_bids_won",
+                (date, messages_from_airlines, rooms_booked, bids, bids_won),
+            )
+
+    def report_counters(self) -> List[Tuple[str, Dict[str, int]]]:
+        """Every report row as (date, {metric: value}) in the ReportAggregates metric names."""
+        return [
+            (date, {"airline_messages": messages, "rooms_booked": rooms_booked, "bids": bids, "bids_won": bids_won})
+            for date, messages, rooms_booked, bids, bids_won in self.query(
+                "SELECT date, number_of_messages_from_airlines, number_of_rooms_booked, number_of_bids, number_of_bids_won FROM report"
+            )
+        ]
+
+    def data_version(self) -> int:
+        """Changes whenever another connection commits to the database."""
+        return self.query("PRAGMA data_version")[0][0]
+
+    def record_booking(self, check_in: str, check_out: str, rooms: int, chat_id: Optional[str] = None, room_type: Optional[str] = None):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO bookings (check_in, check_out, rooms, room_type, chat_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (check_in, check_out, rooms, room_type, chat_id, time.time()),
+            )
+
+    def load_report(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Report counters with start <= date <= end, in the REPORT_FILE layout.
+
+        Bookings are listed under their check-in date.
+        """
+        start, end = start or "", end or "9999-12-31"
+        report = {
+            date: {"number_of_messages_from_airlines": messages, "number_of_rooms_booked": rooms_booked}
+            for date, messages, rooms_booked in self.query(
+                "SELECT date, number_of_messages_from_airlines, number_of_rooms_booked FROM report "
+                "WHERE date >= ? AND date <= ? ORDER BY date",
+                (start, end),
+            )
+        }
+        bookings = self.query(
+            "SELECT check_in, check_out, rooms, room_type FROM bookings WHERE check_in >= ? AND check_in <= ? ORDER BY check_in, id",
+            (start, end),
+        )
+        for check_in, check_out, rooms, room_type in bookings:
+            entry = report.setdefault(check_in, {"number_of_messages_from_airlines": 0, "number_of_rooms_booked": 0})
+            booking = {"check_in": check_in, "check_out": check_out, "rooms": rooms}
+            if room_type is not None:
+                booking["room_type"] = room_type
+            entry.setdefault("bookings", []).append(booking)
+        return report
+
+    def iter_report(self, start: Optional[str] = None, end: Optional[str] = None, page_size: int = 100) -> Iterator[Tuple[str, int, int, List[Dict[str, Any]]]]:
+        """
+        Lazily yield (date, messages_from_airlines, rooms_booked, bookings) for start <= date <= end.
+
+        Dates are read page_size at a time with a keyset query joined to
+        their bookings, and the database lock is released between pages.
+        """
+        after = (datetime.date.fromisoformat(start) - datetime.timedelta(days=1)).isoformat() if start else ""
+        end = end or "9999-12-31"
+        while True:
+            rows = self.query(
+                "SELECT r.date, r.number_of_messages_from_airlines, r.number_of_rooms_booked, b.check_in, b.check_out, b.rooms, b.room_type "
+                "FROM (SELECT * FROM report WHERE date > ? AND date <= ? ORDER BY date LIMIT ?) AS r "
+                "LEFT JOIN bookings AS b ON b.check_in = r.date ORDER BY r.date, b.id",
+                (after, end, page_size),
+            )
+            if not rows:
+                return
+            for date, day_rows in groupby(rows, key=lambda row: row[0]):
+                day_rows = list(day_rows)
+                bookings = []
+                for _, _, _, check_in, check_out, rooms, room_type in day_rows:
+                    if check_in is None:
+                        continue
+                    booking = {"check_in": check_in, "check_out": check_out, "rooms": rooms}
+                    if room_type is not None:
+                        booking["room_type"] = room_type
+                    bookings.append(booking)
+                yield date, day_rows[0][1], day_rows[0][2], bookings
+            after = rows[-1][0]
+
+    # Config
+
+    def get_config(self, key: str, default: Any = None) -> Any:
+        rows = self.query("SELECT value FROM config WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else default
+
+    def set_config(self, key: str, value: Any):
+        with self.transaction() as conn:
+            conn.execute("INSERT INTO config (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, json.dumps(value)))
+
+    def load_config(self) -> Dict[str, Any]:
+        """Every config value except internal keys, which start with an underscore."""
+        return {key: json.loads(value) for key, value in self.query("SELECT key, value FROM config WHERE substr(key, 1, 1) != '_'")}
+
+    # Import
+
+    def import_json(self, room_requirements_file: Optional[str] = None, report_file: Optional[str] = None, metadata_file: Optional[str] = None) -> Dict[str, int]:
+        """
+        Copy the legacy JSON files into the database, once.
+
+        The import runs in one transaction and leaves a marker in config, so
+        later calls (from any worker) do nothing and the database stays the
+        source of truth. Missing files are skipped.
+
+        Returns:
+            Dict[str, int]: Rows imported per table, empty if the import had already run.
+        """
+        with self.transaction():
+            if self.get_config(IMPORT_MARKER) is not None:
+                return {}
+            available_rooms = _read_json(room_requirements_file)
+            report = _read_json(report_file)
+            metadata = _read_json(metadata_file)
+
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO availability (date, availability, price_per_night) VALUES (?, ?, ?)",
+                [(date, data.get("availability"), data.get("price_per_night")) for date, data in available_rooms.items()],
+            )
+            for date, data in report.items():
+                self.increment_report(date, data.get("number_of_messages_from_airlines", 0), data.get("number_of_rooms_booked", 0))
+                for booking in data.get("bookings", []):
+                    self.record_booking(booking.get("check_in", date), booking.get("check_out", date), booking.get("rooms", 0), room_type=booking.get("room_type"))
+            for key, value in metadata.items():
+                self.set_config(key, value)
+
+            imported = {"availability": len(available_rooms), "report": len(report), "config": len(metadata)}
+            self.set_config(IMPORT_MARKER, {
+                "files": [room_requirements_file, report_file, metadata_file],
+                "imported_at": datetime.datetime.now().isoformat(),
+                "rows": imported,
+            })
+        logger.info(f"Imported JSON data into {self.db_file}: {imported}")
+        return imported
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+        logger.info(f"Closed storage {self.db_file}")
+
+
+def _read_json(path: Optional[str]) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the JSON data files into the SQLite storage.")
+    parser.add_argument("--db", default=os.getenv("STATE_DB_FILE", "data/state.db"))
+    parser.add_argument("--rooms", default=os.getenv("ROOM_REQUIREMENTS_FILE", "data/room_availability.json"))
+    parser.add_argument("--report", default=os.getenv("REPORT_FILE", "data/report.json"))
+    parser.add_argument("--metadata", default=os.getenv("DATA_METADATA_FILE", "data/metadata.json"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    storage = Storage(args.db)
+    rows = storage.import_json(args.rooms, args.report, args.metadata)
+    print(f"Imported {rows}" if rows else f"{args.db} was already imported, nothing to do")
+    storage.close()
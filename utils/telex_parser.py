@@ -0,0 +1,224 @@
+"""
+Deterministic parser for the SQ delay telexes posted in the airline groups.
+
+The telexes we bid on follow a rigid layout (see the examples in
+SYSTEM_PROMPT_NEEDS_ROOMS):
+
+    NEW DELAYED SQ ARR
+
+    SQ387/BCN/02NOV/ETA 0820HRS
+
+    NO. OF ROOMS
+
+      2 ROOMS (ECONOMY)
+      1 ROOM (Business)
+
+     DEPARTURE :
+
+    SQ285/AKL/02NOV/STD 2225HRS
+
+parse_telex() reads such a message with precompiled regular expressions and
+returns one of three verdicts:
+
+- ROOM_REQUEST: the message is a well-formed telex, all fields were extracted.
+- NOT_A_REQUEST: the message cannot be a room request (no SQ flight), so
+  no LLM call is needed to reject it.
+- UNSURE: anything else; the caller should fall back to the LLM.
+
+For UNSURE messages guess_room_requests() reads any dates, times and room
+counts it can find, loosely, so a likely answer can be prepared while the
+LLM is still working on the message.
+
+The extracted fields mirror what SYSTEM_PROMPT_NEEDS_ROOMS asks the model to
+return, so both paths produce the same BasicExtraction for the same telex.
+"""
+import datetime
+import re
+from dataclasses import dataclass
+from enum import Enum
+from typing import List, Optional
+
+
+class TelexVerdict(str, Enum):
+    ROOM_REQUEST = "room_request"
+    NOT_A_REQUEST = "not_a_request"
+    UNSURE = "unsure"
+
+
+@dataclass
+class TelexParse:
+    verdict: TelexVerdict
+    flight: Optional[str] = None
+    arrival_date: str = ""
+    arrival_time: str = ""
+    departure_date: str = ""
+    departure_time: str = ""
+    number_of_rooms: int = 0
+
+    def extraction_fields(self) -> dict:
+        """Fields of a BasicExtraction built from this parse."""
+        return {
+            "needs_rooms": self.verdict == TelexVerdict.ROOM_REQUEST,
+            "arrival_date": self.arrival_date,
+            "arrival_time": self.arrival_time,
+            "departure_date": self.departure_date,
+            "departure_time": self.departure_time,
+            "number_of_rooms": self.number_of_rooms,
+        }
+
+
+MONTHS = {
+    "JAN": 1, "FEB": 2, "MAR": 3, "APR": 4, "MAY": 5, "JUN": 6,
+    "JUL": 7, "AUG": 8, "SEP": 9, "OCT": 10, "NOV": 11, "DEC": 12,
+}
+
+FLIGHT_RE = re.compile(r"\bSQ\s?\d{1,4}\b", re.IGNORECASE)
+# Free-form requests abbreviate, e.g. "3 rms for SQ221 crew"
+ROOM_WORD_RE = re.compile(r"\b(?:ROOMS?|RMS?)\b", re.IGNORECASE)
+ARRIVAL_RE = re.compile(
+    r"\bSQ\s?(?P<flight>\d{1,4})\s*/\s*[A-Z]{3}\s*/\s*(?P<day>\d{1,2})(?P<month>[A-Z]{3})\s*/\s*"
+    r"ETA\s*(?P<hour>\d{2}):?(?P<minute>\d{2})\s*(?:HRS)?",
+    re.IGNORECASE,
+)
+ROOMS_HEADER_RE = re.compile(r"\bNO\.?\s*OF\s*ROOMS\b", re.IGNORECASE)
+ROOM_COUNT_RE = re.compile(r"^\s*(?P<count>\d{1,3})\s*ROOMS?\b", re.IGNORECASE | re.MULTILINE)
+DEPARTURE_RE = re.compile(
+    r"\bDEPARTURE\s*:?\s*(?:"
+    r"SQ\s?\d{1,4}\s*/\s*[A-Z]{3}\s*/\s*(?P<day>\d{1,2})(?P<month>[A-Z]{3})\s*/\s*"
+    r"STD\s*(?P<hour>\d{2}):?(?P<minute>\d{2})\s*(?:HRS)?"
+    r"|(?P<multiple>MULTIPLE)\b)",
+    re.IGNORECASE,
+)
+# Words that change the meaning of an otherwise well-formed telex
+AMENDMENT_RE = re.compile(r"\b(?:CANCEL\w*|AMEND\w*|REVISED|NO LONGER|NOT REQUIRED)\b", re.IGNORECASE)
+# Loose patterns for free-form requests, e.g. "pls provide 4 rooms for SQ221 crew arr 12NOV 0630 dep 13NOV 2350"
+LOOSE_DATE_RE = re.compile(r"\b(?P<day>\d{1,2})\s?(?P<month>" + "|".join(MONTHS) + r")\b", re.IGNORECASE)
+LOOSE_TIME_RE = re.compile(r"\b(?P<hour>[01]\d|2[0-3]):?(?P<minute>[0-5]\d)\s*(?:HRS?|H)?\b", re.IGNORECASE)
+LOOSE_ROOMS_RE = re.compile(r"\b(?P<count>\d{1,3})\s*(?:X\s*)?(?:ROOMS?|RMS?)\b", re.IGNORECASE)
+
+
+def resolve_date(day: str, month: str, today: datetime.date) -> Optional[datetime.date]:
+    """Resolve a DDMMM telex date to the occurrence closest to today."""
+    month_number = MONTHS.get(month.upper())
+    if month_number is None:
+        return None
+    try:
+        date = datetime.date(today.year, month_number, int(day))
+        if (date - today).days < -180:
+            date = date.replace(year=today.year + 1)
+        elif (date - today).days > 180:
+            date = date.replace(year=today.year - 1)
+    except ValueError:
+        return None
+    return date
+
+
+def parse_telex(message: str, today: Optional[datetime.date] = None) -> TelexParse:
+    """
+    Parse an airline group message into a TelexParse.
+
+    Args:
+        message (str): Raw WhatsApp message text.
+        today (datetime.date): Date used to resolve the year of DDMMM dates. Defaults to today.
+
+    Returns:
+        TelexParse: The verdict and, for ROOM_REQUEST, the extracted fields.
+    """
+    if today is None:
+        today = datetime.date.today()
+
+    if not FLIGHT_RE.search(message):
+        return TelexParse(TelexVerdict.NOT_A_REQUEST)
+
+    unsure = TelexParse(TelexVerdict.UNSURE)
+    if AMENDMENT_RE.search(message):
+        return unsure
+
+    arrivals = list(ARRIVAL_RE.finditer(message))
+    rooms_header = ROOMS_HEADER_RE.search(message)
+    departure = DEPARTURE_RE.search(message)
+    if len(arrivals) != 1 or not rooms_header or not departure or departure.start() < rooms_header.end():
+        return unsure
+    arrival = arrivals[0]
+
+    room_section = message[rooms_header.end():departure.start()]
+    number_of_rooms = sum(int(match.group("count")) for match in ROOM_COUNT_RE.finditer(room_section))
+    if number_of_rooms <= 0:
+        return unsure
+
+    arrival_date = resolve_date(arrival.group("day"), arrival.group("month"), today)
+    if arrival_date is None:
+        return unsure
+    arrival_time = f"{arrival.group('hour')}:{arrival.group('minute')}"
+
+    if departure.group("multiple"):
+        departure_date = arrival_date
+        departure_time = arrival_time
+    else:
+        departure_date = resolve_date(departure.group("day"), departure.group("month"), today)
+        if departure_date is None or departure_date < arrival_date:
+            return unsure
+        departure_time = f"{departure.group('hour')}:{departure.group('minute')}"
+        # The prompt examples report the departure STD as the arrival time
+        arrival_time = departure_time
+
+    if int(arrival_time[:2]) > 23 or int(arrival_time[3:]) > 59 or int(departure_time[:2]) > 23 or int(departure_time[3:]) > 59:
+        return unsure
+
+    return TelexParse(
+        verdict=TelexVerdict.ROOM_REQUEST,
+        flight=f"SQ{arrival.group('flight')}",
+        arrival_date=arrival_date.strftime("%Y-%m-%d"),
+        arrival_time=arrival_time,
+        departure_date=departure_date.strftime("%Y-%m-%d"),
+        departure_time=departure_time,
+        number_of_rooms=number_of_rooms,
+    )
+
+
+def guess_room_requests(message: str, today: Optional[datetime.date] = None) -> List[TelexParse]:
+    """
+    Likely readings of a room request the parser is unsure about, most likely first.
+
+    The first DDMMM date is taken as the arrival and the last as the
+    departure, the first and last HHMM times likewise, and the room count
+    is either the sum of every "N ROOMS" or just the first. Each reading is
+    returned both with the arrival's own time as arrival_time and with the
+    departure time, as the telex examples in the prompt report it.
+    Amendments and cancellations get no guesses.
+
+    Args:
+        message (str): Raw WhatsApp message text.
+        today (datetime.date): Date used to resolve the year of DDMMM dates. Defaults to today.
+
+    Returns:
+        List[TelexParse]: UNSURE parses with the guessed fields filled in, possibly empty.
+    """
+    if today is None:
+        today = datetime.date.today()
+    if not FLIGHT_RE.search(message) or not ROOM_WORD_RE.search(message) or AMENDMENT_RE.search(message):
+        return []
+
+    dates = [date for date in (resolve_date(m.group("day"), m.group("month"), today) for m in LOOSE_DATE_RE.finditer(message)) if date]
+    times = [f"{m.group('hour')}:{m.group('minute')}" for m in LOOSE_TIME_RE.finditer(message)]
+    counts = [int(m.group("count")) for m in LOOSE_ROOMS_RE.finditer(message) if int(m.group("count")) > 0]
+    if not dates or not counts:
+        return []
+    arrival_date, departure_date = dates[0], dates[-1]
+    if departure_date < arrival_date:
+        return []
+    arrival_time = times[0] if times else "00:00"
+    departure_time = times[-1] if times else "00:00"
+
+    guesses = []
+    for number_of_rooms in dict.fromkeys((sum(counts), counts[0])):
+        for guessed_arrival_time in dict.fromkeys((arrival_time, departure_time)):
+            guesses.append(TelexParse(
+                verdict=TelexVerdict.UNSURE,
+                arrival_date=arrival_date.strftime("%Y-%m-%d"),
+                arrival_time=guessed_arrival_time,
+                departure_date=departure_date.strftime("%Y-%m-%d"),
+                departure_time=departure_time,
+                number_of_rooms=number_of_rooms,
+            ))
+    return guesses
@@ -0,0 +1,300 @@
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Buckets are exact below 2^SUB_BUCKET_BITS microseconds and split every power of two into HALF_BUCKET above
+SUB_BUCKET_BITS = 7
+HALF_BUCKET = 1 << (SUB_BUCKET_BITS - 1)
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram, in microseconds.
+
+    Values below 128us have their own bucket; above that every power of two
+    is split into 64 buckets, so a percentile is reported within 1.6% of
+    the true value. Only buckets that were hit are stored: at most 64 per
+    power of two, about 1,300 counters for anything from 1us to a minute.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    @staticmethod
+    def bucket(value_us: int) -> int:
+        magnitude = max(value_us.bit_length() - SUB_BUCKET_BITS, 0)
+        return magnitude * HALF_BUCKET + (value_us >> magnitude)
+
+    @staticmethod
+    def bucket_high(bucket: int) -> int:
+        """Largest value that falls in bucket."""
+        if bucket < 2 * HALF_BUCKET:
+            return bucket
+        magnitude = bucket // HALF_BUCKET - 1
+        return ((bucket - magnitude * HALF_BUCKET + 1) << magnitude) - 1
+
+    def record(self, seconds: float):
+        value_us = max(int(seconds * 1_000_000), 0)
+        bucket = self.bucket(value_us)
+        with self.lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.count += 1
+            self.total_us += value_us
+            self.max_us = max(self.max_us, value_us)
+
+    def percentile(self, quantile: float) -> float:
+        """Latency in seconds below which quantile of the recorded values fall."""
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = max(math.ceil(quantile * self.count), 1)
+            seen = 0
+            for bucket in sorted(self.counts):
+                seen += self.counts[bucket]
+                if seen >= rank:
+                    return min(self.bucket_high(bucket), self.max_us) / 1_000_000
+        return self.max_us / 1_000_000
+
+    def snapshot(self) -> Dict[str, float]:
+        """Count, sum, max and p50/p95/p99, in milliseconds."""
+        result = {"count": self.count, "sum_ms": self.total_us / 1000, "max_ms": self.max_us / 1000}
+        for quantile in QUANTILES:
+            result[f"p{int(quantile * 100)}_ms"] = self.percentile(quantile) * 1000
+        return result
+
+
+class Trace:
+    """Spans recorded while processing one WhatsApp message."""
+
+    def __init__(self, message_id: str, started: Optional[float] = None):
+        self.message_id = message_id
+        self.started = started if started is not None else time.perf_counter()
+        self.started_at = time.time() - (time.perf_counter() - self.started)
+        self.spans: List[Dict[str, Any]] = []
+
+    def add(self, stage: str, started: float, seconds: float, attrs: Dict[str, Any]):
+        self.spans.append(dict(attrs, stage=stage, start_ms=(started - self.started) * 1000, duration_ms=seconds * 1000))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"message_id": self.message_id, "started_at": self.started_at, "spans": list(self.spans)}
+
+
+class Span:
+    __slots__ = ("tracer", "stage", "trace", "attrs", "started", "token")
+
+    def __init__(self, tracer: "Tracer", stage: str, trace: Optional[Trace], attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.stage = stage
+        self.trace = trace
+        self.attrs = attrs
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        self.token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        _current_span.reset(self.token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.stage, seconds, self.trace, self.started, **self.attrs)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    """What span() returns while tracing is disabled: entering, leaving and set() do nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Activation:
+    __slots__ = ("trace", "token")
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+
+    def __enter__(self) -> Trace:
+        self.token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self.token)
+
+
+class Tracer:
+    """
+    Latency of every stage of the bid pipeline, per message and in aggregate.
+
+    A trace is started for each webhook, keyed by its WhatsApp message id,
+    and carried to the handler in a context variable. span(stage) times a
+    block and records it both in that trace and in the stage's
+    LatencyHistogram; numeric attributes ending in _tokens (set by LLM
+    calls) are summed per stage. The last max_traces traces can be looked
+    up by message id.
+
+    When disabled, start_trace() returns None and span() returns a shared
+    do-nothing span, so instrumented code costs one attribute check.
+    """
+
+    def __init__(self, enabled: bool = True, max_traces: int = 500):
+        self.enabled = enabled
+        self.max_traces = max_traces
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, int] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        self.traces: "OrderedDict[str, Trace]" = OrderedDict()
+
+    def start_trace(self, message_id: str, started: Optional[float] = None) -> Optional[Trace]:
+        """
+        Start the trace of a message; started is its time.perf_counter() arrival time.
+
+        A redelivery of a message that is still in the buffer gets a trace
+        of its own that is not stored, so the original trace is kept.
+        """
+        if not self.enabled:
+            return None
+        trace = Trace(message_id, started)
+        with self.lock:
+            if message_id in self.traces:
+                return trace
+            self.traces[message_id] = trace
+            self.traces.move_to_end(message_id)
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+        return trace
+
+    def activate(self, trace: Optional[Trace]):
+        """Context manager making trace the current trace; does nothing for None."""
+        return NULL_SPAN if trace is None else _Activation(trace)
+
+    def current_trace(self) -> Optional[Trace]:
+        return _current_trace.get() if self.enabled else None
+
+    def get_trace(self, message_id: str) -> Optional[Trace]:
+        with self.lock:
+            return self.traces.get(message_id)
+
+    def span(self, stage: str, **attrs):
+        """Time a with block as stage, in the current trace if there is one."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, _current_trace.get(), attrs)
+
+    def annotate(self, **attrs):
+        """Add attributes to the innermost open span."""
+        if not self.enabled:
+            return
+        span = _current_span.get()
+        if span is not None:
+            span.set(**attrs)
+
+    def mark(self, stage: str):
+        """Record the time from the current trace's start until now as stage, e.g. time to "RP Can"."""
+        trace = self.current_trace()
+        if trace is not None:
+            self.record(stage, time.perf_counter() - trace.started, trace, trace.started)
+
+    def record(self, stage: str, seconds: float, trace: Optional[Trace] = None, started: Optional[float] = None, **attrs):
+        """Record a stage that was timed elsewhere."""
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        histogram.record(seconds)
+        if attrs:
+            with self.lock:
+                if "error" in attrs:
+                    self.errors[stage] = self.errors.get(stage, 0) + 1
+                for name, value in attrs.items():
+                    if name.endswith("_tokens") and isinstance(value, int):
+                        totals = self.tokens.setdefault(stage, {})
+                        totals[name] = totals.get(name, 0) + value
+        if trace is not None:
+            trace.add(stage, started if started is not None else time.perf_counter() - seconds, seconds, attrs)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        return {stage: histogram.snapshot() for stage, histogram in sorted(self.histograms.items())}
+
+    def prometheus(self) -> str:
+        """Stage latencies, errors and LLM tokens in the Prometheus text exposition format."""
+        lines = [
+            "# HELP fast_finger_stage_latency_seconds Latency of each stage of the bid pipeline.",
+            "# TYPE fast_finger_stage_latency_seconds summary",
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            for quantile in QUANTILES:
+                lines.append(f'fast_finger_stage_latency_seconds{{stage="{stage}",quantile="{quantile}"}} {histogram.percentile(quantile):.6f}')
+            lines.append(f'fast_finger_stage_latency_seconds_sum{{stage="{stage}"}} {histogram.total_us / 1_000_000:.6f}')
+            lines.append(f'fast_finger_stage_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+        lines += [
+            "# HELP fast_finger_stage_errors_total Stages that ended in an exception.",
+            "# TYPE fast_finger_stage_errors_total counter",
+        ]
+        for stage, count in sorted(self.errors.items()):
+            lines.append(f'fast_finger_stage_errors_total{{stage="{stage}"}} {count}')
+        lines += [
+            "# HELP fast_finger_llm_tokens_total Tokens used by LLM calls, per stage.",
+            "# TYPE fast_finger_llm_tokens_total counter",
+        ]
+        for stage, totals in sorted(self.tokens.items()):
+            for name, value in sorted(totals.items()):
+                lines.append(f'fast_finger_llm_tokens_total{{stage="{stage}",kind="{name[:-len("_tokens")]}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer(
+    enabled=os.getenv("TRACING_ENABLED", "true").lower() == "true",
+    max_traces=int(os.getenv("TRACE_BUFFER_SIZE", "500")),
+)
+
+
+def traced(trace: Optional[Trace], handler: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """
+    Wrap a queued handler so it runs with trace as the current trace.
+
+    The time between wrapping (i.e. queueing) and the handler starting is
+    recorded as queue_wait.
+    """
+    if trace is None:
+        return handler
+    queued_at = time.perf_counter()
+
+    async def run(*args, **kwargs):
+        tracer.record("queue_wait", time.perf_counter() - queued_at, trace, queued_at)
+        with tracer.activate(trace):
+            return await handler(*args, **kwargs)
+
+    return run
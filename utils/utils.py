@@ -1,27 +1,124 @@
 
+import asyncio
 import datetime
+import importlib.util
 import json
 import os
 import logging
+import random
+import time
 from litellm import OpenAI, acompletion
 from Message.message import Message
-from typing import Union, List, Tuple, Dict
+from typing import Union, List, Tuple, Dict, Optional
 import httpx
 from dotenv import load_dotenv
 from pydantic import BaseModel
+from utils.logging_setup import configure_logging
+from utils.tracing import tracer
 
 # Initialize Logger
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("fast_finger_bot.log"),
-        logging.StreamHandler()
-    ]
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_WHAPI_BASE_URL = "https://gate.whapi.cloud"
+# Sending a message is not idempotent: only a request WHAPI turned away unprocessed is
+# retried. A gateway error or a dropped connection may come after the message went out
+RETRYABLE_STATUS_CODES = {429}
+
+# One long-lived client so every send reuses a warm connection to WHAPI
+_whatsapp_client: Optional[httpx.AsyncClient] = None
+_whatsapp_stats = {"requests": 0, "new_connections": 0, "retries": 0, "failures": 0}
+_whatsapp_last_request = 0.0
+
+
+async def _trace_whatsapp_connection(event_name: str, info: dict):
+    if event_name == "connection.connect_tcp.complete":
+        _whatsapp_stats["new_connections"] += 1
+
+
+def _create_whatsapp_client() -> httpx.AsyncClient:
+    http2 = os.getenv("WHAPI_HTTP2", "true").lower() == "true"
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("h2 package not installed, using HTTP/1.1 keep-alive for WHAPI")
+        http2 = False
+    timeout = httpx.Timeout(
+        float(os.getenv("WHAPI_TIMEOUT", "10")),
+        connect=float(os.getenv("WHAPI_CONNECT_TIMEOUT", "3")),
+    )
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("WHAPI_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("WHAPI_MAX_KEEPALIVE_CONNECTIONS", "10")),
+        keepalive_expiry=float(os.getenv("WHAPI_KEEPALIVE_EXPIRY", "300")),
+    )
+    base_url = os.getenv("WHAPI_BASE_URL", DEFAULT_WHAPI_BASE_URL)
+    logger.info(f"Creating WHAPI client for {base_url} (http2={http2})")
+    return httpx.AsyncClient(base_url=base_url, http2=http2, timeout=timeout, limits=limits)
+
+
+def get_whatsapp_client() -> httpx.AsyncClient:
+    """Return the shared WHAPI client, creating it on first use."""
+    global _whatsapp_client
+    if _whatsapp_client is None or _whatsapp_client.is_closed:
+        _whatsapp_client = _create_whatsapp_client()
+    return _whatsapp_client
+
+
+async def start_whatsapp_client():
+    """Create the shared WHAPI client and open its connection before the first send."""
+    client = get_whatsapp_client()
+    api_key = os.getenv("WHAPI_API_KEY")
+    if not api_key:
+        logger.warning("WHAPI_API_KEY environment variable not set, skipping WHAPI warm-up")
+        return
+    try:
+        started = time.perf_counter()
+        _whatsapp_stats["requests"] += 1
+        await client.get("/health", headers={'authorization': f'Bearer {api_key}'}, extensions={"trace": _trace_whatsapp_connection})
+        _mark_whatsapp_request()
+        logger.info(f"WHAPI connection warmed up in {(time.perf_counter() - started) * 1000:.1f}ms")
+    except httpx.HTTPError as e:
+        logger.warning(f"WHAPI warm-up failed: {e}")
+
+
+def _mark_whatsapp_request():
+    global _whatsapp_last_request
+    _whatsapp_last_request = time.monotonic()
+
+
+async def warm_whatsapp_client() -> bool:
+    """
+    Reopen the WHAPI connection ahead of a send when the pooled one has probably expired.
+
+    Meant to run while a reply is still being worked out, so the send that
+    follows a quiet period does not pay for a new connection.
+
+    Returns:
+        bool: True if a warm-up request was made.
+    """
+    expiry = float(os.getenv("WHAPI_KEEPALIVE_EXPIRY", "300"))
+    if time.monotonic() - _whatsapp_last_request < expiry * 0.9:
+        return False
+    await start_whatsapp_client()
+    return True
+
+
+async def close_whatsapp_client():
+    global _whatsapp_client
+    if _whatsapp_client is not None:
+        await _whatsapp_client.aclose()
+        _whatsapp_client = None
+        logger.info("WHAPI client closed")
+
+
+def whatsapp_client_stats() -> Dict[str, float]:
+    """Send counters of the shared WHAPI client; connection_reuse is the share of requests that needed no new connection."""
+    stats = dict(_whatsapp_stats)
+    requests = stats["requests"]
+    stats["connection_reuse"] = 1 - min(stats["new_connections"], requests) / requests if requests else 0.0
+    return stats
+
+
 async def send_whatsapp_message(response: str, chat_id: str, responding_to_our_message: bool):
     if responding_to_our_message:
         logger.info("First message already sent, not sending again")
@@ -33,29 +130,88 @@ async def send_whatsapp_message(response: str, chat_id: str, responding_to_our_m
         logger.critical("WHAPI_API_KEY environment variable not set")
         raise ValueError("WHAPI_API_KEY environment variable not set")
 
-    async with httpx.AsyncClient() as client:
-        headers = {
-            'accept': 'application/json',
-            'authorization': f'Bearer {api_key}',
-            'content-type': 'application/json'
-        }
-        data = {
-            'to': chat_id,
-            'body': response
-        }
+    client = get_whatsapp_client()
+    headers = {
+        'accept': 'application/json',
+        'authorization': f'Bearer {api_key}',
+        'content-type': 'application/json'
+    }
+    data = {
+        'to': chat_id,
+        'body': response
+    }
+    if not response:
+        return
+
+    with tracer.span("whapi_send") as span:
+        await _post_whatsapp_message(client, headers, data, chat_id, span)
+
+
+async def _post_whatsapp_message(client: httpx.AsyncClient, headers: Dict[str, str], data: Dict[str, str], chat_id: str, span):
+    max_retries = int(os.getenv("WHAPI_MAX_RETRIES", "2"))
+    backoff = float(os.getenv("WHAPI_RETRY_BACKOFF", "0.05"))
+    logger.debug("Sending POST request to WHAPI with data: %s", data)
+    for attempt in range(max_retries + 1):
+        span.set(attempts=attempt + 1)
         try:
-            if response:
-                logger.info(f"Sending POST request to WHAPI with data: {data}")
-                resp = await client.post(
-                    'https://gate.whapi.cloud/messages/text',
-                    headers=headers,
-                    json=data
-                )
-                resp.raise_for_status()
-                logger.info(f"Message sent successfully to chat_id={chat_id}")
+            _whatsapp_stats["requests"] += 1
+            resp = await client.post(
+                '/messages/text',
+                headers=headers,
+                json=data,
+                extensions={"trace": _trace_whatsapp_connection}
+            )
+            _mark_whatsapp_request()
+            if resp.status_code in RETRYABLE_STATUS_CODES and attempt < max_retries:
+                raise httpx.HTTPStatusError(f"WHAPI returned {resp.status_code}", request=resp.request, response=resp)
+            resp.raise_for_status()
+            logger.info(f"Message sent successfully to chat_id={chat_id}")
+            return
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.HTTPStatusError) as e:
+            # Only retry failures where WHAPI cannot have accepted the message: no
+            # connection was made, or it rate-limited the request
+            retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in RETRYABLE_STATUS_CODES
+            if not retryable or attempt == max_retries:
+                _whatsapp_stats["failures"] += 1
+                logger.error(f"Failed to send message to chat_id={chat_id}: {e}")
+                raise
+            delay = random.uniform(0, backoff * 2 ** attempt)
+            _whatsapp_stats["retries"] += 1
+            logger.warning(f"Retrying message to chat_id={chat_id} in {delay * 1000:.0f}ms after: {e}")
+            await asyncio.sleep(delay)
         except httpx.HTTPError as e:
+            _whatsapp_stats["failures"] += 1
             logger.error(f"Failed to send message to chat_id={chat_id}: {e}")
-            raise 
+            raise
+
+class StageTimer:
+    """
+    Measures the latency of each stage of a message's processing.
+
+    Call mark() at the end of every stage; log() writes one line with the
+    per-stage and total latencies in milliseconds.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.stages: Dict[str, float] = {}
+
+    def mark(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed_ms = (now - self.last) * 1000
+        self.stages[stage] = elapsed_ms
+        self.last = now
+        return elapsed_ms
+
+    def total_ms(self) -> float:
+        return (self.last - self.start) * 1000
+
+    def log(self):
+        stages = ", ".join(f"{stage}={elapsed:.1f}ms" for stage, elapsed in self.stages.items())
+        logger.info(f"[{self.name}] {stages}, total={self.total_ms():.1f}ms")
+
 
 def calculate_hotel_days(arrival_date: str, departure_date: str, departure_time: str = "00:00") -> int:
     """